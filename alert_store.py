@@ -0,0 +1,152 @@
+import sqlite3
+import threading
+import time
+import os
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+ALERT_DEDUP = os.getenv("ALERT_DEDUP", "true").lower() in ("1", "true", "yes")  # Send each NWS alert only once
+ALERT_DB = os.getenv("ALERT_DB", os.path.join(CACHE_DIR, "alerts.db"))
+ALERT_TTL = float(os.getenv("ALERT_TTL", str(7 * 86400)))  # Seconds to remember a sent alert that has no expiry time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sent_alerts (
+    area TEXT NOT NULL,
+    id TEXT NOT NULL,
+    event TEXT,
+    message_type TEXT,
+    sent TEXT,
+    expires_at REAL,
+    broadcast_at REAL NOT NULL,
+    PRIMARY KEY (area, id)
+);
+CREATE INDEX IF NOT EXISTS sent_alerts_expires ON sent_alerts (expires_at);
+CREATE TABLE IF NOT EXISTS polls (
+    area TEXT PRIMARY KEY,
+    updated TEXT,
+    active TEXT
+);
+"""
+
+_lock = threading.Lock()
+
+
+def area_key(lat, lon):
+    return f"{float(lat):.4f},{float(lon):.4f}"
+
+
+def alert_features(collection):
+    """Alert property dicts from an /alerts response in either GeoJSON or JSON-LD form"""
+    items = collection.get("features")
+    if items is None:
+        items = collection.get("@graph", [])
+    return [item.get("properties", item) for item in items]
+
+
+def _timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def expiry(alert):
+    """Epoch seconds after which an alert no longer needs to be remembered"""
+    times = [t for t in (_timestamp(alert.get("expires")), _timestamp(alert.get("ends"))) if t is not None]
+    return max(times) if times else None
+
+
+class AlertStore:
+    """Record of NWS alerts already broadcast, kept in SQLite.
+
+    Alerts are keyed by area and NWS id, so each site gets an alert once.
+    Updates and cancellations are issued by NWS under new ids, so they are
+    broadcast once like new alerts, while an alert seen on every poll is
+    sent only the first time. Alerts are recorded with record() once
+    they have been handed to the radio, not when they are selected, so an
+    alert that fails to go out is offered again on the next poll. Rows are
+    purged once the alert has expired (or, without an expiry time, after
+    ALERT_TTL) and NWS no longer lists it.
+    """
+
+    def __init__(self, path=ALERT_DB):
+        self.path = path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.executescript(SCHEMA)
+        return conn
+
+    def select_new(self, area, collection, now=None):
+        """Split an /alerts/active response for an area into what to broadcast.
+
+        Returns (new, active): new is the list of alert properties not
+        broadcast before, active is the list of event names currently in
+        effect. Nothing is recorded; pass the same collection and new list
+        to record() once the alerts have been sent. When the collection's
+        'updated' time matches the last recorded poll nothing has changed
+        and it is not processed again.
+        """
+        updated = collection.get("updated")
+        with _lock:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT updated, active FROM polls WHERE area = ?", (area,)).fetchone()
+                if updated and row and row[0] == updated:
+                    return [], [e for e in (row[1] or "").split("\n") if e]
+
+                alerts = alert_features(collection)
+                ids = [a.get("id") for a in alerts if a.get("id")]
+                known = set()
+                if ids:
+                    placeholders = ",".join("?" * len(ids))
+                    known = {r[0] for r in conn.execute(
+                        f"SELECT id FROM sent_alerts WHERE area = ? AND id IN ({placeholders})", [area] + ids)}
+            finally:
+                conn.close()
+
+        new = [a for a in alerts if a.get("id") and a["id"] not in known]
+        active = [a.get("event") or "Alert" for a in alerts if a.get("messageType") != "Cancel"]
+        if known:
+            print(f"Suppressed {len(known)} alert(s) already broadcast")
+        return new, active
+
+    def record(self, area, collection, new, now=None):
+        """Record the new alerts from select_new() as broadcast, and the poll they came from"""
+        now = time.time() if now is None else now
+        alerts = alert_features(collection)
+        ids = [a.get("id") for a in alerts if a.get("id")]
+        active = [a.get("event") or "Alert" for a in alerts if a.get("messageType") != "Cancel"]
+        with _lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO sent_alerts"
+                        " (area, id, event, message_type, sent, expires_at, broadcast_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(area, a["id"], a.get("event"), a.get("messageType"), a.get("sent"), expiry(a), now)
+                         for a in new])
+                    conn.execute("INSERT OR REPLACE INTO polls (area, updated, active) VALUES (?, ?, ?)",
+                                 (area, collection.get("updated"), "\n".join(active)))
+                    self._purge(conn, area, ids, now)
+            finally:
+                conn.close()
+
+    def _purge(self, conn, area, current_ids, now):
+        # Keep expired rows while NWS still lists the alert, or it would be sent again
+        query = ("DELETE FROM sent_alerts WHERE area = ?"
+                 " AND (expires_at < ? OR (expires_at IS NULL AND broadcast_at < ?))")
+        if current_ids:
+            query += f" AND id NOT IN ({','.join('?' * len(current_ids))})"
+        removed = conn.execute(query, [area, now, now - ALERT_TTL] + current_ids).rowcount
+        if removed:
+            print(f"Purged {removed} expired alert(s)")
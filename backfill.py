@@ -0,0 +1,315 @@
+"""Backfill the local observation history from the Tempest REST API.
+
+Pages through /observations/device/{device_id} one local day at a time
+(the API only returns one-minute data for short ranges) and
+parses each page's "obs" arrays into numpy columns. Sea level pressure,
+daily rain and the fixed-point record encoding are computed over whole
+columns at once, and every touched day file is rewritten in one go. A
+progress file records the range and the last batch written, so an
+interrupted run resumes where it stopped when asked for the same range
+again.
+"""
+import argparse
+import json
+import time
+import os
+from datetime import date, datetime, timedelta
+from dotenv import load_dotenv
+
+import numpy as np
+
+import http_client
+import tempest_udp
+import tsstore
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+API_TOKEN = os.getenv("TEMPEST_API_TOKEN")
+STATION_ID = os.getenv("TEMPEST_STATION_ID")
+DEVICE_ID = os.getenv("TEMPEST_DEVICE_ID")  # Looked up from the station when not set
+BACKFILL_BATCH = int(os.getenv("BACKFILL_BATCH", "7"))  # Days fetched in parallel and written together
+
+COLUMN = {name: idx for idx, name in enumerate(tempest_udp.OBS_ST_FIELDS)}
+
+# US units as used in the reports: (column, factor, offset)
+US_UNITS = {
+    "air_temperature": ("temp_f", 9 / 5, 32),
+    "barometric_pressure": ("pressure_inhg", 0.02953, 0),
+    "wind_avg": ("wind_mph", 2.23694, 0),
+    "wind_gust": ("gust_mph", 2.23694, 0),
+    "precip_accum_local_day": ("rain_day_in", 0.03937, 0),
+}
+
+RECORD_DTYPE = tsstore.record_dtype()
+
+
+def api_get(path, **params):
+    params["token"] = API_TOKEN
+    query = "&".join(f"{key}={value}" for key, value in params.items())
+    # Historical pages never change and would only crowd the response cache
+    response = http_client.get(f"{http_client.TEMPEST_API_URL}{path}?{query}", cache=False)
+    response.raise_for_status()
+    return response.json()
+
+
+def find_device(station_id):
+    """Return (device_id, elevation in meters) of the station's Tempest (ST) device"""
+    data = api_get(f"/stations/{station_id}")
+    for station in data.get("stations", []):
+        elevation = (station.get("station_meta") or {}).get("elevation")
+        for device in station.get("devices", []):
+            if device.get("device_type") == "ST":
+                return device["device_id"], elevation
+    raise ValueError(f"No Tempest device found for station {station_id}")
+
+
+def fetch_chunk(device_id, start, end):
+    """Raw obs arrays for [start, end), oldest first"""
+    data = api_get(f"/observations/device/{device_id}", time_start=int(start), time_end=int(end) - 1)
+    return data.get("obs") or []
+
+
+def to_columns(rows):
+    """Turn obs arrays into a dict of float columns (NaN for missing values)"""
+    width = len(tempest_udp.OBS_ST_FIELDS)
+    table = np.array([row[:width] + [None] * (width - len(row)) for row in rows], dtype=float).reshape(-1, width)
+    return {name: table[:, idx] for name, idx in COLUMN.items()}
+
+
+def day_starts(first_ts, last_ts):
+    """Epoch seconds of each local midnight from the day of first_ts through the day after last_ts"""
+    day = datetime.fromtimestamp(first_ts).date()
+    last_day = datetime.fromtimestamp(last_ts).date()
+    starts = []
+    while day <= last_day + timedelta(days=1):
+        starts.append(time.mktime(day.timetuple()))
+        day += timedelta(days=1)
+    return np.array(starts)
+
+
+def derive(columns, elevation):
+    """Add the fields the live listener derives, over whole columns.
+
+    Rows are sorted by time and de-duplicated first. Returns the columns
+    plus a "day" column with the index of each row's local day in the
+    returned list of day names.
+    """
+    ts = columns["timestamp"]
+    _, unique = np.unique(ts, return_index=True)
+    columns = {name: values[unique] for name, values in columns.items()}
+    ts = columns["timestamp"]
+
+    temp_c = columns["air_temperature"]
+    station = columns["station_pressure"]
+    if elevation:
+        # Vectorized form of tempest_udp.sea_level_pressure
+        factor = (1 - 0.0065 * elevation / (temp_c + 0.0065 * elevation + 273.15)) ** -5.257
+        columns["barometric_pressure"] = station * factor
+    else:
+        columns["barometric_pressure"] = station.copy()
+
+    # Rain accumulates from local midnight, like precip_accum_local_day
+    starts = day_starts(ts[0], ts[-1])
+    day_index = np.searchsorted(starts, ts, side="right") - 1
+    running = np.cumsum(np.nan_to_num(columns["precip"]))
+    first_of_day = np.searchsorted(ts, starts[day_index])
+    before = np.where(first_of_day > 0, running[np.maximum(first_of_day - 1, 0)], 0.0)
+    columns["precip_accum_local_day"] = running - before
+    columns["day"] = day_index
+    names = [datetime.fromtimestamp(start).date().isoformat() for start in starts]
+    return columns, names
+
+
+def us_units(columns):
+    """Report units for the converted columns, computed a column at a time"""
+    return {us_name: columns[name] * factor + offset for name, (us_name, factor, offset) in US_UNITS.items()}
+
+
+def encode(columns, rows):
+    """Pack the selected rows into tsstore records"""
+    records = np.zeros(int(rows.sum()), dtype=RECORD_DTYPE)
+    records["timestamp"] = columns["timestamp"][rows].astype(np.uint32)
+    for name, scale, fmt in tsstore.FIELDS:
+        values = columns[name][rows] * scale
+        low, high = tsstore.LIMITS[fmt]
+        raw = np.clip(np.rint(np.nan_to_num(values, nan=0.0)), low, high)
+        records[name] = np.where(np.isnan(values), tsstore.MISSING[fmt], raw).astype(tsstore.NUMPY_TYPES[fmt])
+    return records
+
+
+def merge_day(store, day, records):
+    """Combine new records with a day file already on disk; returns the merged records"""
+    try:
+        with open(store.day_path(day), "rb") as f:
+            data = f.read()
+    except OSError:
+        data = b""
+    usable = len(data) - len(data) % RECORD_DTYPE.itemsize
+    existing = np.frombuffer(data[:usable], dtype=RECORD_DTYPE)
+    # Records already stored win over backfilled ones with the same timestamp
+    merged = np.concatenate([existing, records])
+    _, unique = np.unique(merged["timestamp"], return_index=True)
+    merged = merged[unique]
+    store.replace_day(day, merged.tobytes())
+    return merged
+
+
+def summarize(day, records):
+    """tsstore rollup summary for a whole day's records"""
+    def column(name, scale, fmt):
+        values = records[name].astype(float)
+        values[records[name] == tsstore.MISSING[fmt]] = np.nan
+        return values / scale
+
+    fields = {name: (scale, fmt) for name, scale, fmt in tsstore.FIELDS}
+    temp = column("air_temperature", *fields["air_temperature"])
+    gust = column("wind_gust", *fields["wind_gust"])
+    rain = column("precip_accum_local_day", *fields["precip_accum_local_day"])
+    summary = {"day": day, "samples": len(records), "last_ts": int(records["timestamp"][-1]),
+               "temp_min": None, "temp_max": None, "gust_max": None, "gust_ts": None, "rain_day": None}
+    if not np.all(np.isnan(temp)):
+        summary["temp_min"] = float(np.nanmin(temp))
+        summary["temp_max"] = float(np.nanmax(temp))
+    if not np.all(np.isnan(gust)):
+        peak = int(np.nanargmax(gust))
+        summary["gust_max"] = float(gust[peak])
+        summary["gust_ts"] = int(records["timestamp"][peak])
+    if not np.all(np.isnan(rain)):
+        summary["rain_day"] = float(np.nanmax(rain))
+    return summary
+
+
+def write_batch(store, columns, names):
+    """Write every day touched by a batch; returns the number of new records"""
+    added = 0
+    for idx in np.unique(columns["day"]):
+        day = names[idx]
+        path = store.day_path(day)
+        before = os.path.getsize(path) // RECORD_DTYPE.itemsize if os.path.exists(path) else 0
+        merged = merge_day(store, day, encode(columns, columns["day"] == idx))
+        added += len(merged) - before
+        # Only changes the rollup when the day is the current one (or newer)
+        store.merge_rollup(summarize(day, merged))
+    return added
+
+
+class Progress:
+    """Resume point of a backfill, kept next to the series it fills"""
+
+    def __init__(self, store):
+        self.path = os.path.join(store.directory, "backfill.json")
+
+    def load(self, device_id, start, end):
+        """How far an earlier run for the same device and range got, or None"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (state.get("device_id"), state.get("start"), state.get("end")) != (device_id, int(start), int(end)):
+            return None
+        return state.get("completed_until")
+
+    def save(self, device_id, start, end, completed_until):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_file = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"device_id": device_id, "start": int(start), "end": int(end),
+                       "completed_until": completed_until}, f)
+        os.replace(tmp_file, self.path)
+
+
+def backfill(start, end, station_id=STATION_ID, device_id=DEVICE_ID, series=None, elevation=None, csv_path=None):
+    """Fill [start, end) epoch seconds into the station's series; returns the number of records added"""
+    if not API_TOKEN or not (station_id or device_id):
+        raise ValueError("TEMPEST_API_TOKEN and TEMPEST_STATION_ID (or TEMPEST_DEVICE_ID) must be set")
+    station_elevation = None
+    if not device_id:
+        device_id, station_elevation = find_device(station_id)
+    if elevation is None:
+        # STATION_ELEVATION overrides the elevation recorded for the station
+        elevation = tempest_udp.STATION_ELEVATION or station_elevation or 0.0
+
+    store = tsstore.SeriesStore(series or tsstore.series_name(station_id or device_id))
+    # Day files older than the retention are purged at the next day rollover, so keep the whole range
+    span = date.today().toordinal() - datetime.fromtimestamp(start).date().toordinal()
+    if span > store.retention_days():
+        print(f"Keeping {span} days of history for {store.name} to cover the backfill"
+              f" (TS_RETENTION_DAYS is {tsstore.TS_RETENTION_DAYS})")
+        store.keep_days(span)
+    progress = Progress(store)
+    requested = (start, end)
+    resume = progress.load(device_id, start, end)
+    if resume is not None and resume >= end:
+        print("This range has already been backfilled")
+        return 0
+    if resume is not None and start < resume:
+        print(f"Resuming from {datetime.fromtimestamp(resume)}")
+        start = resume
+    if start >= end:
+        print("Nothing to backfill")
+        return 0
+
+    # One request per local day, so a day's rain total is never split between batches
+    starts = [t for t in day_starts(start, end) if start < t < end]
+    bounds = [int(start)] + [int(t) for t in starts] + [int(end)]
+    chunks = list(zip(bounds[:-1], bounds[1:]))
+    total = 0
+    began = time.monotonic()
+    csv_file = open(csv_path, "a", encoding="utf-8") if csv_path else None
+    try:
+        for offset in range(0, len(chunks), BACKFILL_BATCH):
+            batch = chunks[offset:offset + BACKFILL_BATCH]
+            # Requests for the whole batch run in parallel on the shared HTTP pool
+            futures = [http_client.submit(fetch_chunk, device_id, a, b) for a, b in batch]
+            rows = [row for future in futures for row in future.result()]
+            if rows:
+                columns, names = derive(to_columns(rows), elevation)
+                total += write_batch(store, columns, names)
+                if csv_file:
+                    write_csv(csv_file, columns)
+            progress.save(device_id, *requested, batch[-1][1])
+            print(f"{datetime.fromtimestamp(batch[-1][1]):%Y-%m-%d %H:%M}: {len(rows)} observations"
+                  f" ({total} new, {time.monotonic() - began:.1f}s)")
+    finally:
+        if csv_file:
+            csv_file.close()
+    return total
+
+
+def write_csv(f, columns):
+    converted = us_units(columns)
+    if f.tell() == 0:
+        f.write("timestamp," + ",".join(converted) + "\n")
+    table = np.column_stack([columns["timestamp"]] + list(converted.values()))
+    np.savetxt(f, table, fmt=["%d"] + ["%.2f"] * len(converted), delimiter=",")
+
+
+def parse_time(value):
+    """Epoch seconds from a YYYY-MM-DD date (local midnight) or an epoch number"""
+    if value.isdigit():
+        return int(value)
+    return int(time.mktime(date.fromisoformat(value).timetuple()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill observation history from the Tempest REST API")
+    parser.add_argument("start", type=parse_time, help="first day (YYYY-MM-DD) or epoch seconds")
+    parser.add_argument("end", type=parse_time, nargs="?", default=None,
+                        help="day after the last (YYYY-MM-DD) or epoch seconds; default now")
+    parser.add_argument("--device", default=DEVICE_ID, help="Tempest device ID (default: looked up from the station)")
+    parser.add_argument("--series", help="tsstore series to fill (default: tempest-<station id>)")
+    parser.add_argument("--csv", help="also append the observations in US units to this CSV file")
+    args = parser.parse_args()
+
+    end = args.end if args.end is not None else int(time.time())
+    try:
+        added = backfill(args.start, end, device_id=args.device, series=args.series, csv_path=args.csv)
+        print(f"Backfill complete: {added} observations added")
+    finally:
+        http_client.close()
+
+if __name__ == "__main__":
+    main()
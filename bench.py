@@ -0,0 +1,450 @@
+"""Offline benchmark of the report scripts.
+
+Each script runs in a fresh Python process against a local HTTP stand-in
+that serves the recorded API responses in fixtures/bench, with a fake
+Meshtastic interface that records every packet. Transmit pacing runs on
+a simulated clock, so a run takes as long as fetching and rendering do,
+and airtime is reported rather than waited for.
+
+Every script is run cold (empty caches) and warm (caches from the cold
+run), and the median of --repeat runs is reported: process start-up,
+import, HTTP, render and send time, requests made, packets, bytes and
+estimated airtime. --output saves the results as JSON and --compare
+flags anything that got slower or bigger than a saved run. --import-budget
+fails the run if a script is slow to import or imports meshtastic, which
+only sending needs.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import os
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "bench")
+SCRIPTS = ["getwx", "getwx_forecast", "nws_current_weather", "tempest_forecast"]
+METRICS = ["startup", "import", "http", "render", "send", "total", "requests", "packets", "bytes", "airtime"]
+LOWER_IS_BETTER_SLACK = 0.2  # Fraction a metric may grow before --compare flags it
+NWS_URL = "https://api.weather.gov"
+
+
+def _rebase_hourly(body, now):
+    # Forecast periods start at the current hour so the script always finds upcoming hours
+    data = json.loads(body)
+    start = now.replace(minute=0, second=0, microsecond=0)
+    # Reissued each hour, like NWS does
+    data["properties"]["generatedAt"] = data["properties"]["updateTime"] = start.isoformat()
+    for idx, period in enumerate(data["properties"]["periods"]):
+        period["startTime"] = (start + timedelta(hours=idx)).isoformat()
+        period["endTime"] = (start + timedelta(hours=idx + 1)).isoformat()
+    return json.dumps(data)
+
+
+def _rebase_gridpoints(body, now):
+    # Move every series so the grid starts at the current hour, as the hourly forecast does
+    data = json.loads(body)
+    props = data["properties"]
+    first = datetime.fromisoformat(props["validTimes"].split("/")[0])
+    shift = now.replace(minute=0, second=0, microsecond=0) - first
+    props["validTimes"] = f"{(first + shift).isoformat()}/{props['validTimes'].split('/')[1]}"
+    props["updateTime"] = (first + shift).isoformat()
+    for layer in props.values():
+        for item in layer.get("values", []) if isinstance(layer, dict) else []:
+            start, duration = item["validTime"].split("/")
+            item["validTime"] = f"{(datetime.fromisoformat(start) + shift).isoformat()}/{duration}"
+    return json.dumps(data)
+
+
+def _rebase_nws_observation(body, now):
+    data = json.loads(body)
+    data["properties"]["timestamp"] = (now - timedelta(minutes=5)).replace(microsecond=0).isoformat()
+    return json.dumps(data)
+
+
+def _rebase_tempest_observation(body, now):
+    data = json.loads(body)
+    data["obs"][0]["timestamp"] = int(now.timestamp()) - 60
+    return json.dumps(data)
+
+
+def _rebase_tempest_forecast(body, now):
+    # Hourly forecasts start at the current hour and the days move by whole days, keeping local midnight
+    data = json.loads(body)
+    shift = int(now.timestamp()) // 3600 * 3600 - data["forecast"]["hourly"][0]["time"]
+    day_shift = round(shift / 86400) * 86400
+    data["current_conditions"]["time"] = int(now.timestamp()) - 60
+    for hour in data["forecast"]["hourly"]:
+        hour["time"] += shift
+    for day in data["forecast"]["daily"]:
+        for key in ("day_start_local", "sunrise", "sunset"):
+            day[key] += day_shift
+    return json.dumps(data)
+
+
+# (path pattern, fixture, transform, max-age) - paths are relative to the stand-in's /nws or /tempest prefix
+ROUTES = [
+    (r"/nws/points/[-\d.]+,[-\d.]+$", "nws_points.json", None, 86400),
+    (r"/nws/gridpoints/\w+/\d+,\d+/forecast/hourly$", "nws_forecast_hourly.json", _rebase_hourly, 3600),
+    (r"/nws/gridpoints/\w+/\d+,\d+/stations$", "nws_stations.json", None, 86400),
+    (r"/nws/gridpoints/\w+/\d+,\d+$", "nws_gridpoints.json", _rebase_gridpoints, 3600),
+    (r"/nws/alerts/active$", "nws_alerts.json", None, 30),
+    (r"/nws/stations/\w+/observations/latest$", "nws_observation_latest.json", _rebase_nws_observation, 300),
+    (r"/tempest/observations/station/\d+$", "tempest_observations_station.json", _rebase_tempest_observation, 0),
+    (r"/tempest/better_forecast$", "tempest_better_forecast.json", _rebase_tempest_forecast, 0),
+]
+
+
+class StandIn:
+    """Local HTTP server answering with the fixtures instead of NWS and Tempest.
+
+    latency is added to every response; a fraction error_rate of requests
+    get a 503. Responses carry an ETag and Cache-Control like the real
+    APIs, so conditional requests and the response cache are exercised.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.fixtures = {}
+        for _, name, _, _ in ROUTES:
+            with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+                self.fixtures[name] = f.read().replace(NWS_URL, f"{self.url}/nws")
+
+    def _respond(self, handler):
+        with self._lock:
+            self.requests += 1
+            fail = self.random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        path = handler.path.split("?", 1)[0]
+        route = next((r for r in ROUTES if re.search(r[0], path)), None)
+        if fail or route is None:
+            with self._lock:
+                self.errors += 1
+            handler.send_response(503 if fail else 404)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+
+        _, name, transform, max_age = route
+        body = self.fixtures[name]
+        if transform:
+            body = transform(body, datetime.now(timezone.utc).astimezone())
+        data = body.encode("utf-8")
+        etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+        if handler.headers.get("If-None-Match") == etag:
+            with self._lock:
+                self.not_modified += 1
+            handler.send_response(304)
+            handler.send_header("ETag", etag)
+            handler.end_headers()
+            return
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.send_header("ETag", etag)
+        handler.send_header("Cache-Control", f"public, max-age={max_age}")
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                standin._respond(self)
+
+            def log_message(self, format, *args):
+                pass
+        return Handler
+
+    def reset(self):
+        with self._lock:
+            self.requests = self.errors = self.not_modified = 0
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeInterface:
+    """Stands in for a Meshtastic interface, recording packets instead of sending them"""
+
+    def __init__(self):
+        import txqueue
+        self.isConnected = threading.Event()
+        self.isConnected.set()
+        self.failure = None
+        self.packets = []
+        self._airtime = txqueue.airtime
+
+    def _record(self, payload, **kwargs):
+        size = len(payload) if isinstance(payload, bytes) else len(payload.encode("utf-8"))
+        self.packets.append({"bytes": size, "airtime": self._airtime(size), "channel": kwargs.get("channelIndex")})
+
+    def sendText(self, text, **kwargs):
+        self._record(text, **kwargs)
+
+    def sendData(self, data, **kwargs):
+        self._record(data, **kwargs)
+
+    def close(self):
+        pass
+
+
+class Span:
+    """Wall time during which at least one call of a wrapped function is running"""
+
+    def __init__(self):
+        self.total = 0.0
+        self.calls = 0
+        self._active = 0
+        self._started = None
+        self._lock = threading.Lock()
+
+    def wrap(self, func):
+        def wrapper(*args, **kwargs):
+            with self._lock:
+                self.calls += 1
+                self._active += 1
+                if self._active == 1:
+                    self._started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    if self._active == 0:
+                        self.total += time.perf_counter() - self._started
+        return wrapper
+
+
+def child(script, result_path, spawned_at):
+    """Run one script in this process and write its timings to result_path"""
+    startup = time.time() - spawned_at
+    began = time.perf_counter()
+    module = __import__(script)
+    imported = time.perf_counter()
+    # Only sending needs meshtastic; rendering must not pay for importing it
+    meshtastic_imported = "meshtastic" in sys.modules
+
+    import http_client
+    import radio
+    import txqueue
+
+    interface = FakeInterface()
+    sim = txqueue.SimulatedClock()
+    radio.open_interface = lambda *args, **kwargs: interface
+    radio.make_queue = lambda iface, label=None, on_done=None: txqueue.TxQueue(
+        lambda: iface, binary_portnum=radio.BINARY_PORTNUM, clock=sim.clock, sleep=sim.sleep, on_done=on_done)
+    http_span, build_span, send_span = Span(), Span(), Span()
+    http_client.get = http_span.wrap(http_client.get)
+    module.build_messages = build_span.wrap(module.build_messages)
+    radio.send_once = send_span.wrap(radio.send_once)
+
+    error = None
+    sys.argv = [f"{script}.py"]
+    try:
+        module.main()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finished = time.perf_counter()
+    http_client.close()
+
+    result = {
+        "startup": startup,
+        "import": imported - began,
+        "http": http_span.total,
+        "render": max(0.0, build_span.total - http_span.total),
+        "send": send_span.total,
+        "total": startup + finished - began,
+        "packets": len(interface.packets),
+        "bytes": sum(p["bytes"] for p in interface.packets),
+        "airtime": sum(p["airtime"] for p in interface.packets),
+        "tx_duration": sim.now,
+        "meshtastic_imported": meshtastic_imported,
+        "error": error,
+    }
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def run_script(script, standin, cache_dir, verbose=False):
+    """Run one script in a fresh interpreter; returns its result dict"""
+    env = dict(os.environ)
+    env.update({
+        "CACHE_DIR": cache_dir,
+        "NWS_API_URL": f"{standin.url}/nws",
+        "TEMPEST_API_URL": f"{standin.url}/tempest",
+        "TEMPEST_API_TOKEN": "bench",
+        "TEMPEST_STATION_ID": "12345",
+        "TEMPEST_SOURCE": "rest",
+        "LAT": "33.7473",
+        "LON": "-111.7791",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    for name in ("METRICS_TEXTFILE_DIR", "METRICS_LOG", "METRICS_PORT"):
+        # A benchmark run is not a real run; keep it out of the monitoring
+        env.pop(name, None)
+    result_path = os.path.join(cache_dir, "bench_result.json")
+    standin.reset()
+    spawned_at = time.time()
+    subprocess.run([sys.executable, os.path.abspath(__file__), "child", script, result_path, repr(spawned_at)],
+                   env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                   stdout=None if verbose else subprocess.DEVNULL, check=True)
+    with open(result_path, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    os.remove(result_path)
+    result["requests"] = standin.requests
+    result["http_errors"] = standin.errors
+    result["not_modified"] = standin.not_modified
+    return result
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def benchmark(scripts, repeat=3, latency=0.0, error_rate=0.0, verbose=False):
+    """Cold and warm results for each script, as the median over repeat runs"""
+    standin = StandIn(latency=latency, error_rate=error_rate).start()
+    results = {}
+    try:
+        for script in scripts:
+            runs = {"cold": [], "warm": []}
+            for _ in range(repeat):
+                cache_dir = tempfile.mkdtemp(prefix="wxbench-")
+                try:
+                    runs["cold"].append(run_script(script, standin, cache_dir, verbose))
+                    runs["warm"].append(run_script(script, standin, cache_dir, verbose))
+                finally:
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+            for mode, mode_runs in runs.items():
+                summary = {key: median([r[key] for r in mode_runs])
+                           for key in METRICS + ["tx_duration", "http_errors", "not_modified"]}
+                summary["errors"] = [r["error"] for r in mode_runs if r["error"]]
+                summary["meshtastic_imported"] = any(r["meshtastic_imported"] for r in mode_runs)
+                results[f"{script}/{mode}"] = summary
+    finally:
+        standin.stop()
+    return results
+
+
+def print_table(results):
+    header = (f"{'run':<28}{'startup':>8}{'import':>8}{'http':>8}{'render':>8}{'send':>8}{'total':>8}"
+              f"{'reqs':>6}{'pkts':>6}{'bytes':>7}{'air s':>7}{'tx s':>7}")
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<28}{r['startup']:>8.3f}{r['import']:>8.3f}{r['http']:>8.3f}{r['render']:>8.3f}"
+              f"{r['send']:>8.3f}{r['total']:>8.3f}{r['requests']:>6.0f}{r['packets']:>6.0f}{r['bytes']:>7.0f}"
+              f"{r['airtime']:>7.2f}{r['tx_duration']:>7.1f}")
+        for error in r["errors"]:
+            print(f"    error: {error}")
+
+
+def compare(results, baseline, slack=LOWER_IS_BETTER_SLACK, min_seconds=0.005):
+    """Return a line for every metric that grew by more than slack against the baseline"""
+    regressions = []
+    for name, r in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        for key in METRICS:
+            before, after = old.get(key), r.get(key)
+            if before is None or after is None:
+                continue
+            # Ignore timing jitter on stages that take almost no time
+            if key in ("startup", "import", "http", "render", "send", "total") and after - before < min_seconds:
+                continue
+            if after > before * (1 + slack) and after > before:
+                regressions.append(f"{name} {key}: {before:.3f} -> {after:.3f}")
+    return regressions
+
+
+def check_imports(results, budget):
+    """Return a line for every run whose import took longer than budget or pulled in meshtastic"""
+    problems = []
+    for name, r in results.items():
+        if r["import"] > budget:
+            problems.append(f"{name} import: {r['import']:.3f}s > {budget:.3f}s")
+        if r.get("meshtastic_imported"):
+            problems.append(f"{name} imported meshtastic before sending")
+    return problems
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "child":
+        child(sys.argv[2], sys.argv[3], float(sys.argv[4]))
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark the report scripts offline")
+    parser.add_argument("scripts", nargs="*", metavar="script",
+                        help=f"scripts to run (default: all of {', '.join(SCRIPTS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per script; the median is reported")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every stand-in response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stand-in responses that are 503s")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--compare", help="JSON from an earlier --output to check for regressions")
+    parser.add_argument("--import-budget", type=float,
+                        help="fail if a script takes longer than this many seconds to import, or imports meshtastic")
+    parser.add_argument("--verbose", action="store_true", help="show the scripts' own output")
+    args = parser.parse_args()
+    unknown = [s for s in args.scripts if s not in SCRIPTS]
+    if unknown:
+        parser.error(f"unknown script: {', '.join(unknown)}")
+
+    results = benchmark(args.scripts or SCRIPTS, args.repeat, args.latency, args.error_rate, args.verbose)
+    print_table(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    failed = False
+    if args.import_budget is not None:
+        problems = check_imports(results, args.import_budget)
+        if problems:
+            print("\nImport budget exceeded:")
+            for line in problems:
+                print(f"  {line}")
+            failed = True
+        else:
+            print(f"\nAll imports within {args.import_budget:.3f}s")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            failed = True
+        else:
+            print("\nNo regressions")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Tempest Better Forecast payloads shared by every report that needs one.
+
+One better_forecast response carries the station's current conditions,
+the daily forecast and the hourly forecast. The parsed payload is kept in
+memory per station for TEMPEST_FORECAST_TTL seconds, so the daily
+forecast, the multi-day outlook, the next hours, current conditions
+(getwx.py with TEMPEST_SOURCE=forecast) and the energy outlook can all be
+rendered from a single request, whether in one run or by separate jobs of
+the daemon.
+"""
+import threading
+import time
+import os
+from datetime import timedelta, timezone
+from dotenv import load_dotenv
+
+import http_client
+import metrics
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+TEMPEST_API_TOKEN = os.getenv("TEMPEST_API_TOKEN")
+TEMPEST_FORECAST_TTL = float(os.getenv("TEMPEST_FORECAST_TTL", "300"))  # Seconds a fetched payload is reused
+
+# current_conditions fields under the names of a station observation (getwx.render_messages)
+OBSERVATION_FIELDS = {
+    "time": "timestamp",
+    "air_temperature": "air_temperature",
+    "feels_like": "feels_like",
+    "relative_humidity": "relative_humidity",
+    "station_pressure": "barometric_pressure",
+    "pressure_trend": "pressure_trend",
+    "wind_avg": "wind_avg",
+    "wind_gust": "wind_gust",
+    "wind_direction": "wind_direction",
+    "precip_accum_local_day": "precip_accum_local_day",
+    "lightning_strike_count_last_1hr": "lightning_strike_count_last_1hr",
+    "solar_radiation": "solar_radiation",
+    "uv": "uv",
+}
+
+_lock = threading.Lock()
+_station_locks = {}
+_memory = {}  # Station id -> (monotonic time fetched, payload)
+
+
+def _station_lock(station_id):
+    with _lock:
+        return _station_locks.setdefault(station_id, threading.Lock())
+
+
+def fetch(station_id, ttl=TEMPEST_FORECAST_TTL, clock=time.monotonic):
+    """The station's Better Forecast payload, fetched at most once per ttl seconds.
+
+    Raises like http_client.get_json. The payload is shared and must be
+    treated as read-only; http_client.stale_since(payload) is set when it
+    is an old cached copy served after a failed fetch.
+    """
+    if not station_id or not TEMPEST_API_TOKEN:
+        raise ValueError("TEMPEST_STATION_ID and TEMPEST_API_TOKEN environment variables must be set")
+
+    with _station_lock(station_id):
+        cached = _memory.get(station_id)
+        if cached is not None and clock() - cached[0] < ttl:
+            metrics.inc("better_forecast_total", result="reused")
+            return cached[1]
+
+        print(f"Fetching Better Forecast for station {station_id}...")
+        url = f"{http_client.TEMPEST_API_URL}/better_forecast?station_id={station_id}&token={TEMPEST_API_TOKEN}"
+        data = http_client.get_json(url)
+        metrics.inc("better_forecast_total", result="fetched")
+        _memory[station_id] = (clock(), data)
+        return data
+
+
+def tz(data):
+    """The station's time zone, or None (the machine's) when the payload has none"""
+    offset = data.get("timezone_offset_minutes")
+    return None if offset is None else timezone(timedelta(minutes=offset))
+
+
+def daily(data):
+    """The daily forecasts, today first"""
+    return (data.get("forecast") or {}).get("daily") or []
+
+
+def hourly(data, now=None):
+    """Hourly forecasts from the current hour on"""
+    now = time.time() if now is None else now
+    return [hour for hour in (data.get("forecast") or {}).get("hourly") or [] if hour.get("time", 0) + 3600 > now]
+
+
+def observation(data):
+    """The payload's current conditions as a station observation, or None when it has none"""
+    current = data.get("current_conditions")
+    if not current or current.get("time") is None:
+        return None
+    obs = {name: current[field] for field, name in OBSERVATION_FIELDS.items() if field in current}
+    obs.setdefault("barometric_pressure", current.get("sea_level_pressure"))
+    return http_client.mark_stale(obs, http_client.stale_since(data))
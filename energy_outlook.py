@@ -0,0 +1,73 @@
+import time
+import os
+from dotenv import load_dotenv
+
+import better_forecast
+import http_client
+import metrics
+import packer
+import radio
+import solar
+import tsstore
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+TEMPEST_STATION_ID = os.getenv("TEMPEST_STATION_ID")
+TEMPEST_SOURCE = os.getenv("TEMPEST_SOURCE", "rest")  # Which history to read the harvest so far from; see getwx.py
+CHANNEL_INDEX = os.getenv("CHANNEL_INDEX", "4")
+LOCATION_NAME = os.getenv("LOCATION_NAME", "NE Scottsdale")  # Place name used in messages
+
+
+def node_line(outlook, idx):
+    """(verbose, compact) line for one node"""
+    name = outlook["names"][idx]
+    so_far = outlook["so_far"]
+    done = f"{so_far[idx]:.0f}" if so_far is not None else "?"
+    rest = outlook["rest_of_today"][idx]
+    ahead = outlook["tomorrow"][idx]
+    need = outlook["need"][idx]
+    verbose = f"{name}: {done} Wh so far, {rest:.0f} Wh more today, {ahead:.0f} Wh tomorrow (uses {need:.0f} Wh/day)"
+    compact = f"{name} {done}+{rest:.0f}/{ahead:.0f}Wh use {need:.0f}"
+    if outlook["days"][idx]:
+        verbose += f", battery {outlook['days'][idx]:.1f} days"
+        compact += f" bat {outlook['days'][idx]:.1f}d"
+    return verbose, compact
+
+
+def build_messages(station_id=TEMPEST_STATION_ID, label=LOCATION_NAME, fleet=None):
+    """Fetch the Better Forecast (or reuse the one fetched by another report) and return the message groups to send"""
+    forecast = better_forecast.fetch(station_id)
+
+    fleet = fleet or solar.load_fleet()
+    with metrics.span("model", nodes=len(fleet)) as fields:
+        observed = solar.observed(tsstore.series_name(station_id, TEMPEST_SOURCE))
+        outlook = solar.outlook(fleet, forecast, observed, time.time())
+        fields.update(panels=len(fleet.rating))
+
+    lines = [(f"{label} Solar Outlook:", f"{label} PV Wh:")]
+    stale = http_client.stale_field(http_client.stale_since(forecast))
+    if stale:
+        lines.append(stale)
+    lines.extend(node_line(outlook, idx) for idx in range(len(fleet)))
+    print("\n".join(line[0] for line in lines))
+
+    # Fit the radio's payload limit - split at line boundaries if needed
+    messages_to_send = packer.pack_profiles(lines, sep="\n", compact_sep="\n")
+    if len(messages_to_send) > 1:
+        print(f"Warning: Outlook split into {len(messages_to_send)} parts")
+    return [messages_to_send]
+
+
+def main():
+    args = radio.parse_args("Send the solar energy outlook of the nodes over Meshtastic")
+    http_client.start_run()
+    with metrics.span("render", report="energy_outlook"):
+        groups = build_messages()
+
+    # Send message(s) using Meshtastic API
+    radio.send_once(groups, CHANNEL_INDEX, dry_run=args.dry_run)
+
+if __name__ == "__main__":
+    main()
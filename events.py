@@ -0,0 +1,228 @@
+import threading
+import time
+import os
+from collections import deque
+from datetime import datetime
+from dotenv import load_dotenv
+
+import packer
+import radio
+import tempest_udp
+import txqueue
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables (thresholds in the units shown in messages)
+CHANNEL_INDEX = os.getenv("EVENT_CHANNEL_INDEX", os.getenv("CHANNEL_INDEX", "4"))
+LOCATION_NAME = os.getenv("LOCATION_NAME", "NE Scottsdale")  # Place name used in messages
+EVENT_STRIKES = float(os.getenv("EVENT_STRIKES", "5"))  # Lightning strikes within the window
+EVENT_STRIKE_WINDOW = int(os.getenv("EVENT_STRIKE_WINDOW", "900"))  # Seconds
+EVENT_PRESSURE_DROP = float(os.getenv("EVENT_PRESSURE_DROP", "3"))  # hPa fall over 3 hours
+EVENT_GUST_MPH = float(os.getenv("EVENT_GUST_MPH", "40"))  # Peak gust within 10 minutes
+EVENT_RAIN_RATE = float(os.getenv("EVENT_RAIN_RATE", "1.0"))  # Inches per hour over 10 minutes
+EVENT_COOLDOWN = int(os.getenv("EVENT_COOLDOWN", "1800"))  # Minimum seconds between repeats of one alert
+EVENT_HYSTERESIS = float(os.getenv("EVENT_HYSTERESIS", "0.8"))  # An alert re-arms once below this fraction of its trigger
+
+# Fields of the hub's broadcasts (as kept by tempest_udp) under the names the rules use (those of the REST API)
+FIELD_ALIASES = {"strike_count_1h": "lightning_strike_count_last_1hr"}
+
+
+class SlidingWindow:
+    """Time-based window over (timestamp, value) samples with O(1) amortized updates.
+
+    Keeps a running sum and a monotonic deque for the maximum, so neither
+    needs a rescan of the window when samples arrive or expire.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.samples = deque()
+        self.maxima = deque()
+        self.total = 0.0
+
+    def add(self, ts, value):
+        self.samples.append((ts, value))
+        self.total += value
+        while self.maxima and self.maxima[-1][1] <= value:
+            self.maxima.pop()
+        self.maxima.append((ts, value))
+        self._expire(ts)
+
+    def _expire(self, now):
+        while self.samples and now - self.samples[0][0] > self.seconds:
+            _, value = self.samples.popleft()
+            self.total -= value
+        while self.maxima and now - self.maxima[0][0] > self.seconds:
+            self.maxima.popleft()
+
+    def max(self):
+        return self.maxima[0][1] if self.maxima else None
+
+    def oldest(self):
+        return self.samples[0] if self.samples else None
+
+    def span(self):
+        """Seconds covered by the samples currently in the window"""
+        if not self.samples:
+            return 0
+        return self.samples[-1][0] - self.samples[0][0]
+
+
+class Rule:
+    """One alert condition evaluated over a sliding window.
+
+    mode is one of:
+      'sum'  - total of the field over the window (e.g. strike count)
+      'rate' - total over the window scaled to a per-hour rate (e.g. rain)
+      'max'  - peak of the field over the window (e.g. gusts)
+      'drop' - how far the field has fallen since the start of the window (e.g. pressure)
+
+    With cumulative, the field is a running total (e.g. rain so far today)
+    and the samples are its increases since the previous observation, so
+    sums and rates don't depend on how often observations arrive. A total
+    that goes down has been reset, and its new value is the increase;
+    with rolling, the total is over a trailing period (e.g. strikes in the
+    last hour) and only its increases count, as a fall means old samples
+    left the period.
+
+    The rule fires when the value reaches trigger and re-arms once it falls
+    to clear; a fired rule stays quiet for cooldown seconds regardless.
+    """
+
+    def __init__(self, name, field, mode, window, trigger, message, clear=None, cooldown=EVENT_COOLDOWN,
+                 convert=None, cumulative=False, rolling=False):
+        self.name = name
+        self.field = field
+        self.mode = mode
+        self.trigger = trigger
+        self.clear = trigger * EVENT_HYSTERESIS if clear is None else clear
+        self.cooldown = cooldown
+        self.message = message
+        self.convert = convert
+        self.cumulative = cumulative or rolling
+        self.rolling = rolling
+        self.previous = None
+        self.window = SlidingWindow(window)
+        self.active = False
+        self.last_fired = None
+
+    def value(self):
+        if self.mode == "sum":
+            return self.window.total
+        if self.mode == "rate":
+            return self.window.total * 3600 / self.window.seconds
+        if self.mode == "max":
+            return self.window.max()
+        if self.mode == "drop":
+            # Only meaningful once the window covers most of its period
+            if self.window.span() < self.window.seconds * 0.8:
+                return None
+            return self.window.oldest()[1] - self.window.samples[-1][1]
+        raise ValueError(f"Unknown rule mode: {self.mode}")
+
+    def update(self, ts, obs):
+        """Add a sample; returns the alert text if the rule fires"""
+        raw = obs.get(self.field)
+        if raw is None:
+            return None
+        if self.cumulative:
+            previous, self.previous = self.previous, raw
+            if previous is None:
+                return None
+            if raw >= previous:
+                raw = raw - previous
+            elif self.rolling:
+                raw = 0
+        self.window.add(ts, self.convert(raw) if self.convert else raw)
+
+        value = self.value()
+        if value is None:
+            return None
+
+        if self.active:
+            if value <= self.clear:
+                self.active = False
+            return None
+
+        if value >= self.trigger:
+            self.active = True
+            if self.last_fired is not None and ts - self.last_fired < self.cooldown:
+                return None
+            self.last_fired = ts
+            return self.message.format(value=value)
+        return None
+
+
+def default_rules():
+    """Rules built from the EVENT_* settings, working on Tempest-style observations"""
+    return [
+        # The last hour's count, so strikes between two polls of the REST API are not missed
+        Rule("lightning", "lightning_strike_count_last_1hr", "sum", EVENT_STRIKE_WINDOW, EVENT_STRIKES,
+             "Lightning: {value:.0f} strikes in " + f"{EVENT_STRIKE_WINDOW // 60} min", rolling=True),
+        Rule("pressure", "barometric_pressure", "drop", 3 * 3600, EVENT_PRESSURE_DROP,
+             "Pressure falling fast: -{value:.1f} hPa/3h"),
+        Rule("gust", "wind_gust", "max", 600, EVENT_GUST_MPH,
+             "Wind gust {value:.0f} mph", convert=lambda ms: ms * 2.23694),
+        Rule("rain", "precip_accum_local_day", "rate", 600, EVENT_RAIN_RATE,
+             "Heavy rain: {value:.2f} in/hr", convert=lambda mm: mm * 0.03937, cumulative=True),
+    ]
+
+
+class EventEngine:
+    """Runs every rule over an observation stream and collects alert messages"""
+
+    def __init__(self, rules=None, label=LOCATION_NAME):
+        self.rules = default_rules() if rules is None else rules
+        self.label = label
+        self.last_timestamp = None
+        self._lock = threading.Lock()
+
+    def process(self, obs):
+        """Feed one observation; returns the list of alert messages it triggered"""
+        ts = obs.get("timestamp")
+        if ts is None:
+            return []
+        for alias, name in FIELD_ALIASES.items():
+            if obs.get(name) is None and obs.get(alias) is not None:
+                obs = dict(obs, **{name: obs[alias]})
+        with self._lock:
+            # Polled sources repeat the same observation until a new one is published
+            if self.last_timestamp is not None and ts <= self.last_timestamp:
+                return []
+            self.last_timestamp = ts
+            fired = [text for text in (rule.update(ts, obs) for rule in self.rules) if text]
+        if not fired:
+            return []
+        local = datetime.fromtimestamp(ts).strftime("%H:%M")
+        return [f"WX ALERT {self.label} {local}: {text}" for text in fired]
+
+
+def make_sender(link, channel_index=CHANNEL_INDEX):
+    """Return an observer that feeds an engine and queues its alerts ahead of routine reports"""
+    engine = EventEngine()
+
+    def observe(obs):
+        for message in engine.process(obs):
+            print(f"Event: {message}")
+            # An alert still unsent when the same alert may fire again is no longer worth sending
+            link.send([txqueue.alert(packer.pack([message]), expires_at=time.time() + EVENT_COOLDOWN)], channel_index,
+                      txqueue.ALERT)
+    return observe
+
+
+def main():
+    # Standalone watcher: listen to the local Tempest hub and send alerts as they happen
+    args = radio.parse_args("Send event alerts from the local Tempest hub")
+    link = radio.TransportPool(dry_run=args.dry_run)
+    listener = tempest_udp.TempestListener()
+    listener.observers.append(make_sender(link))
+    try:
+        listener.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        link.close()
+
+if __name__ == "__main__":
+    main()
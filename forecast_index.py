@@ -0,0 +1,163 @@
+"""Time-indexed NWS hourly forecasts, reused until the forecast changes.
+
+An hourly forecast (about 156 periods) is turned into parallel columns
+sorted by start time, so window queries such as "next 2 hours" or "max
+temperature over the next 12 hours" find their periods by binary search
+instead of parsing every startTime in a scan.
+
+Indexes are kept in memory and on disk by index_cache, keyed by forecast URL, along with
+the response's ETag and the forecast's updateTime/generatedAt. While the
+response is unchanged (a fresh or revalidated cache hit) its body is not
+even decoded; a changed body whose forecast has the same version keeps the
+existing index.
+"""
+import bisect
+import time
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+import index_cache
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+FORECAST_INDEX_DIR = os.getenv("FORECAST_INDEX_DIR", os.path.join(CACHE_DIR, "forecasts"))
+
+# Parallel columns of an index; start/end are epoch seconds and offset is the period's UTC offset in seconds
+COLUMNS = ("start", "end", "offset", "temperature", "pop", "wind_speed", "wind_direction", "short_forecast",
+           "is_daytime")
+
+# One forecast hour; start and end are datetimes in the forecast's local time
+Period = namedtuple("Period", ["start", "end", "temperature", "temperature_unit", "pop", "wind_speed",
+                               "wind_direction", "short_forecast", "is_daytime"])
+
+
+def _timestamp(value):
+    if value is None:
+        return time.time()
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+def forecast_version(data):
+    """The forecast's updateTime and generatedAt, which change whenever NWS reissues it"""
+    props = data.get("properties", data)
+    if not props.get("updateTime") and not props.get("generatedAt"):
+        return None
+    return f"{props.get('updateTime')}|{props.get('generatedAt')}"
+
+
+class ForecastIndex:
+    """Hourly forecast periods as columns sorted by start time"""
+
+    def __init__(self, columns, unit="F", version=None, validator=None):
+        self.columns = columns
+        self.unit = unit
+        self.version = version
+        self.validator = validator
+        self.start = columns["start"]
+
+    @classmethod
+    def from_forecast(cls, data, validator=None):
+        """Build an index from an hourly forecast in GeoJSON or JSON-LD form"""
+        props = data.get("properties", data)
+        rows = []
+        unit = "F"
+        for p in props.get("periods", []):
+            start = datetime.fromisoformat(p["startTime"].replace("Z", "+00:00"))
+            end = datetime.fromisoformat(p["endTime"].replace("Z", "+00:00")) if p.get("endTime") else None
+            pop = (p.get("probabilityOfPrecipitation") or {}).get("value")
+            unit = p.get("temperatureUnit") or unit
+            rows.append((int(start.timestamp()), int(end.timestamp()) if end else int(start.timestamp()) + 3600,
+                         int(start.utcoffset().total_seconds()), p.get("temperature"), pop, p.get("windSpeed"),
+                         p.get("windDirection"), p.get("shortForecast"), bool(p.get("isDaytime"))))
+        rows.sort(key=lambda row: row[0])
+        columns = {name: [row[idx] for row in rows] for idx, name in enumerate(COLUMNS)}
+        return cls(columns, unit, forecast_version(data), validator)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["columns"], data.get("unit", "F"), data.get("version"), data.get("validator"))
+
+    def to_dict(self):
+        return {"version": self.version, "validator": self.validator, "unit": self.unit, "columns": self.columns}
+
+    def __len__(self):
+        return len(self.start)
+
+    def period(self, idx):
+        c = self.columns
+        tz = timezone(timedelta(seconds=c["offset"][idx]))
+        return Period(datetime.fromtimestamp(c["start"][idx], tz), datetime.fromtimestamp(c["end"][idx], tz),
+                      c["temperature"][idx], self.unit, c["pop"][idx], c["wind_speed"][idx],
+                      c["wind_direction"][idx], c["short_forecast"][idx], c["is_daytime"][idx])
+
+    def _span(self, start, end):
+        """Index range of the periods starting in [start, end)"""
+        return bisect.bisect_left(self.start, start), bisect.bisect_left(self.start, end)
+
+    def next_hours(self, count, now=None):
+        """The next count periods starting after now"""
+        first = bisect.bisect_right(self.start, _timestamp(now))
+        return [self.period(idx) for idx in range(first, min(first + count, len(self)))]
+
+    def current(self, now=None):
+        """The period in effect at now, or None"""
+        now = _timestamp(now)
+        idx = bisect.bisect_right(self.start, now) - 1
+        if idx >= 0 and self.columns["end"][idx] > now:
+            return self.period(idx)
+        return None
+
+    def between(self, start, end):
+        """Periods starting in [start, end)"""
+        lo, hi = self._span(_timestamp(start), _timestamp(end))
+        return [self.period(idx) for idx in range(lo, hi)]
+
+    def _extreme(self, pick, hours, now):
+        now = _timestamp(now)
+        # Include the hour in effect now, not just the ones starting later
+        lo, hi = self._span(now - 3599, now + hours * 3600)
+        values = [t for t in self.columns["temperature"][lo:hi] if t is not None]
+        return pick(values) if values else None
+
+    def max_temperature(self, hours=12, now=None):
+        """Highest forecast temperature over the next hours, or None"""
+        return self._extreme(max, hours, now)
+
+    def min_temperature(self, hours=12, now=None):
+        """Lowest forecast temperature over the next hours, or None"""
+        return self._extreme(min, hours, now)
+
+    def tonight(self, now=None):
+        """Periods from now (or 6 PM, if later) until 6 AM, in the forecast's local time"""
+        now = _timestamp(now)
+        if not len(self):
+            return []
+        idx = max(0, min(bisect.bisect_right(self.start, now) - 1, len(self) - 1))
+        local = datetime.fromtimestamp(now, timezone(timedelta(seconds=self.columns["offset"][idx])))
+        six_am = local.replace(hour=6, minute=0, second=0, microsecond=0)
+        if local.hour < 6:
+            return self.between(now, six_am)
+        evening = local.replace(hour=18, minute=0, second=0, microsecond=0)
+        return self.between(max(now, evening.timestamp()), six_am + timedelta(days=1))
+
+
+# Forecast URL -> ForecastIndex
+_cache = index_cache.IndexCache(FORECAST_INDEX_DIR, ForecastIndex.from_dict, ForecastIndex.from_forecast,
+                                forecast_version, "forecast_index_total", "forecast index")
+
+
+def load(url, headers=None, follow_redirects=True):
+    """Fetch an hourly forecast and return (index, stale_since), rebuilding the index only when the forecast changed.
+
+    Raises like http_client.get_json. stale_since is set when the response
+    was an old cached copy served after a failed fetch. The index is shared
+    and must not be changed.
+    """
+    return _cache.load(url, headers=headers, follow_redirects=follow_redirects)
@@ -1,12 +1,18 @@
-import requests
-import meshtastic
-import meshtastic.tcp_interface
-import meshtastic.serial_interface
-import time
 import os
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+import alert_store
+import forecast_index
+import http_client
+import metrics
+import packer
+import points_cache
+import radio
+import records
+import templates
+import txqueue
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -14,156 +20,164 @@ load_dotenv()
 LAT = float(os.getenv("LAT", "33.74733"))
 LON = float(os.getenv("LON", "-111.77912"))
 CHANNEL_INDEX = os.getenv("CHANNEL_INDEX", "4")
-MESHTASTIC_INTERFACE = os.getenv("MESHTASTIC_INTERFACE", "tcp")  # 'tcp' or 'serial'
-MESHTASTIC_HOST = os.getenv("MESHTASTIC_HOST", "localhost")  # For TCP
-MESHTASTIC_PORT = os.getenv("MESHTASTIC_PORT")  # For Serial (e.g., COM3, /dev/ttyUSB0)
 USER_AGENT = os.getenv("USER_AGENT", "WeatherApp/1.0 (your.email@example.com)")
+LOCATION_NAME = os.getenv("LOCATION_NAME", "NE Scottsdale")  # Place name used in messages
+GRID_PRODUCTS = os.getenv("GRID_PRODUCTS", "")  # Gridpoint products to add, e.g. 'heat_index,wet_bulb,rain,gust'
+GRID_HOURS = int(os.getenv("GRID_HOURS", "24"))  # Hours ahead the gridpoint products cover
 
-def get_json(url):
-    resp = requests.get(url, headers={"User-Agent": USER_AGENT, "Accept": "application/ld+json"})
-    resp.raise_for_status()
-    return resp.json()
+HEADERS = {"User-Agent": USER_AGENT, "Accept": "application/ld+json"}
 
-def main():
-    # 1) Resolve lat/lon to forecast URLs via NWS /points
-    points_url = f"https://api.weather.gov/points/{LAT},{LON}"
-    points = get_json(points_url)
+def get_json(url, follow_redirects=True):
+    return http_client.get_json(url, headers=HEADERS, follow_redirects=follow_redirects)
+
+def get_forecast(url, follow_redirects=True):
+    """The hourly forecast at url as (forecast_index.ForecastIndex, stale_since)"""
+    return forecast_index.load(url, headers=HEADERS, follow_redirects=follow_redirects)
+
+def get_grid(url, follow_redirects=True):
+    """The gridpoint forecast at url as (gridpoints.Grid, stale_since)"""
+    # Imported here so numpy is only loaded when GRID_PRODUCTS asks for it
+    import gridpoints
+    return gridpoints.load(url, headers=HEADERS, follow_redirects=follow_redirects)
+
+def grid_line(grid, now, tz, products=GRID_PRODUCTS, hours=GRID_HOURS):
+    """(verbose, compact) line with the requested gridpoint products, or None if there is nothing to say"""
+    values = grid.products(hours, now, tz)
+    verbose, compact = [], []
+    for name in [p.strip() for p in products.split(",") if p.strip()]:
+        if name == "heat_index" and values["heat_index_max"] is not None:
+            verbose.append(f"heat index {values['heat_index_max']:.0f}°F")
+            compact.append(f"HI{values['heat_index_max']:.0f}F")
+        elif name == "wet_bulb" and values["wet_bulb_max"] is not None:
+            verbose.append(f"wet-bulb {values['wet_bulb_max']:.0f}°F")
+            compact.append(f"WB{values['wet_bulb_max']:.0f}F")
+        elif name == "rain" and values["rain_total"] is not None:
+            verbose.append(f"rain {values['rain_total']:.2f}in")
+            compact.append(f"R{values['rain_total']:.2f}in")
+        elif name == "gust" and values["gust_max"] is not None:
+            at = values["gust_time"]
+            verbose.append(f"gust {values['gust_max']:.0f} mph at {at.hour % 12 or 12}{at:%p}")
+            compact.append(f"G{values['gust_max']:.0f}@{at.hour % 12 or 12}{at:%p}")
+    if not verbose:
+        return None
+    return f"Next {values['hours']}h: " + ", ".join(verbose), f"{values['hours']}h: " + " ".join(compact)
+
+def build_messages(lat=LAT, lon=LON, label=LOCATION_NAME, dedup=alert_store.ALERT_DEDUP, units=None):
+    """Fetch the hourly forecast and alerts and return the message groups to send.
 
-    # NWS API returns data at root level (no "properties" wrapper)
-    hourly_url = points["forecastHourly"]
-    forecast_url = points["forecast"]
-    city = points.get("relativeLocation", {}).get("city", "Phoenix")
-    state = points.get("relativeLocation", {}).get("state", "AZ")
+    With dedup, alerts already broadcast on an earlier run are only counted
+    and the new ones are recorded as broadcast once the alert group has
+    been sent or stored in the outbox; without it every active alert is
+    listed. units is the templates units profile for the forecast
+    lines (REPORT_UNITS by default).
+    """
+    # Alerts only depend on the coordinates, so fetch them while the forecast is being resolved
+    alerts_url = f"{http_client.NWS_API_URL}/alerts/active?point={lat},{lon}"
+    alerts_future = http_client.submit(get_json, alerts_url)
+    # The raw gridpoint series, shared by every site and product in the grid cell
+    grid_future = None
+    if GRID_PRODUCTS:
+        grid_future = http_client.submit(points_cache.fetch, lat, lon, get_json, "forecastGridData", load=get_grid)
 
-    print(f"Location: {city}, {state}  ({LAT}, {LON})")
+    # 1) Resolve lat/lon to forecast URLs via NWS /points (cached on disk)
+    # 2) Fetch hourly forecast, indexed by time and reused until NWS updates it
+    point, (hourly, hourly_stale) = points_cache.fetch(lat, lon, get_json, "forecastHourly", load=get_forecast)
+
+    hourly_url = point["forecastHourly"]
+    forecast_url = point["forecast"]
+    city = point.get("city") or "Phoenix"
+    state = point.get("state") or "AZ"
+
+    print(f"Location: {city}, {state}  ({lat}, {lon})")
     print(f"Hourly forecast: {hourly_url}")
     print(f"Period forecast: {forecast_url}\n")
 
-    # 2) Fetch hourly forecast
-    hourly = get_json(hourly_url)
-    periods = hourly.get("properties", hourly).get("periods", [])
-
-    # 3) Build forecast text for next 2 hours based on current time
+    # 3) Build forecast text for the next 2 hours starting after the current time
     now = datetime.now(timezone.utc)
-    forecast_lines = ["NE Scottsdale WX Forecast:", "Next 2 hours:"]
-    forecast_count = 0
-    
-    for p in periods:
-        # Parse the forecast start time
-        forecast_time = datetime.fromisoformat(p["startTime"].replace("Z", "+00:00"))
-        
-        # Only include forecasts that are in the future
-        if forecast_time > now and forecast_count < 2:
-            # NWS returns local TZ offset; format concise
-            ts = forecast_time.strftime("%a %I:%M %p")
-            temp = f"{p['temperature']}°{p['temperatureUnit']}"
-            wind = f"{p['windDirection']} {p['windSpeed']}"
-            short = p["shortForecast"]
-            forecast_lines.append(f"{ts}: {temp}, wind {wind}, {short}")
-            forecast_count += 1
-        
-        # Stop once we have 2 future forecasts
-        if forecast_count >= 2:
-            break
-    
+    upcoming = hourly.next_hours(2, now)
+
+    # Derived products over the coming day from the gridpoint series
+    grid_stale = None
+    grid_lines = []
+    if grid_future is not None:
+        try:
+            _, (grid, grid_stale) = grid_future.result()
+            line = grid_line(grid, now, upcoming[0].start.tzinfo if upcoming else None)
+            if line:
+                grid_lines.append(line)
+        except Exception as e:
+            print(f"Error fetching gridpoint data: {e}")
+
     # 4) Check for active alerts for the area
-    alerts_url = f"https://api.weather.gov/alerts/active?point={LAT},{LON}"
-    alerts = get_json(alerts_url)
-    features = alerts.get("features", [])
-    
-    # If no alerts, add it to forecast message; if alerts exist, keep as separate message
-    if not features:
+    alerts = alerts_future.result()
+
+    # Lines are (verbose, compact) pairs; the compact wording is only used when it saves a packet.
+    # Start times keep NWS's local TZ offset. The heading says so if any response is an old copy
+    # served because the API could not be reached
+    template = templates.get("nws_hourly", units)
+    stale = [t for t in (hourly_stale, grid_stale, http_client.stale_since(alerts)) if t is not None]
+    heading = records.Record(label=label, stale_since=min(stale) if stale else None)
+    forecast_lines = template.render(heading, [records.from_nws_period(p) for p in upcoming], count=2)
+    forecast_lines.extend(grid_lines)
+
+    record = None
+    if dedup:
+        # Only alerts (and updates/cancellations) not broadcast on an earlier run. They are recorded
+        # as broadcast once sent or stored in the outbox, so a failed send is retried on the next run
+        store = alert_store.AlertStore()
+        area = alert_store.area_key(lat, lon)
+        new_alerts, active = store.select_new(area, alerts)
+        record = lambda: store.record(area, alerts, new_alerts)
+        if not new_alerts:
+            record()
+    else:
+        new_alerts = alert_store.alert_features(alerts)
+        active = [a.get("event") for a in new_alerts]
+
+    # If no alerts, add it to forecast message; if new alerts exist, keep as separate message
+    alerts_lines = []
+    if not active and not new_alerts:
         # No alerts - add to forecast message
-        forecast_lines.append("No active alerts.")
-        forecast_text = "\r\n".join(forecast_lines)
-        alerts_message = None
+        forecast_lines.append(("No active alerts.", "No alerts."))
+    elif not new_alerts:
+        # Alerts already broadcast are only mentioned
+        forecast_lines.append((f"Alerts in effect: {len(active)}, no changes.", f"Alerts: {len(active)}"))
     else:
-        # Active alerts - keep as separate message
-        forecast_text = "\r\n".join(forecast_lines)
+        # New or changed alerts - keep as separate message
         alerts_lines = ["Active alerts:"]
-        for a in features:
-            info = a["properties"]
-            alerts_lines.append(f"- {info.get('event')}: {info.get('headline')}")
-        alerts_message = "\r\n".join(alerts_lines)
-    
-    # Helper function to split message into 210-char chunks
-    def split_message(msg):
-        messages = []
-        if len(msg) > 210:
-            # First message: 207 chars + "..."
-            messages.append(msg[:207] + "...")
-            remaining = msg[207:]
-            
-            # Additional messages for remainder
-            while remaining:
-                if len(remaining) > 210:
-                    messages.append(remaining[:210])
-                    remaining = remaining[210:]
-                else:
-                    messages.append(remaining)
-                    remaining = ""
-        else:
-            messages.append(msg)
-        return messages
+        for info in new_alerts:
+            prefix = {"Update": "UPDATED ", "Cancel": "CANCELLED "}.get(info.get("messageType"), "")
+            alerts_lines.append(f"- {prefix}{info.get('event')}: {info.get('headline')}")
     
-    # Split forecast message if needed
-    forecast_messages = split_message(forecast_text)
+    # Fit the radio's payload limit - split at line boundaries if needed
+    forecast_messages = template.pack(forecast_lines)
     
     if len(forecast_messages) > 1:
-        print(f"Warning: Forecast split into {len(forecast_messages)} parts (original: {len(forecast_text)} chars)")
+        print(f"Warning: Forecast split into {len(forecast_messages)} parts")
     
-    # Split alerts message if it exists
-    alerts_messages = []
-    if alerts_message:
-        alerts_messages = split_message(alerts_message)
-        if len(alerts_messages) > 1:
-            print(f"Warning: Alerts split into {len(alerts_messages)} parts (original: {len(alerts_message)} chars)")
+    # Active alerts go out at alert priority, ahead of the forecast
+    # Unsent alerts are kept in the outbox until they expire; NWS may still list an alert past its
+    # expiry time, and then it is kept like a routine report
+    expiries = [alert_store.expiry(info) for info in new_alerts]
+    expires_at = max(expiries) if expiries and None not in expiries else None
+    if expires_at is not None and expires_at < now.timestamp():
+        expires_at = None
+    alerts_messages = txqueue.alert(packer.pack(alerts_lines, sep="\r\n"), expires_at,
+                                    on_accepted=record if new_alerts else None)
+    if len(alerts_messages) > 1:
+        print(f"Warning: Alerts split into {len(alerts_messages)} parts")
     
+    return [forecast_messages, alerts_messages]
+
+def main():
+    args = radio.parse_args("Send the NWS hourly forecast and alerts over Meshtastic")
+    http_client.start_run()
+    with metrics.span("render", report="getwx_forecast"):
+        # A dry run lists every active alert and must not mark any as broadcast
+        groups = build_messages(dedup=alert_store.ALERT_DEDUP and not args.dry_run)
+
     # Send message(s) using Meshtastic API
-    try:
-        # Create interface based on configuration
-        if MESHTASTIC_INTERFACE.lower() == "serial":
-            if not MESHTASTIC_PORT:
-                raise ValueError("MESHTASTIC_PORT must be set when using serial interface")
-            interface = meshtastic.serial_interface.SerialInterface(MESHTASTIC_PORT)
-            print(f"Connected via Serial: {MESHTASTIC_PORT}")
-        else:
-            interface = meshtastic.tcp_interface.TCPInterface(hostname=MESHTASTIC_HOST)
-            print(f"Connected via TCP: {MESHTASTIC_HOST}")
-        
-        # Send forecast message(s)
-        for idx, msg in enumerate(forecast_messages, 1):
-            print(f"Sending forecast message part {idx}/{len(forecast_messages)} ({len(msg)} chars)...")
-            interface.sendText(msg, channelIndex=int(CHANNEL_INDEX))
-            print(f"Forecast part {idx} sent successfully!")
-            
-            if idx < len(forecast_messages):
-                print("Waiting 3 seconds before sending next part...")
-                time.sleep(3)
-        
-        # Send alerts message(s) only if there are alerts
-        if alerts_messages:
-            # Wait between forecast and alerts
-            print("Waiting 5 seconds before sending alerts message...")
-            time.sleep(5)
-            
-            for idx, msg in enumerate(alerts_messages, 1):
-                print(f"Sending alerts message part {idx}/{len(alerts_messages)} ({len(msg)} chars): {msg}")
-                interface.sendText(msg, channelIndex=int(CHANNEL_INDEX))
-                print(f"Alerts part {idx} sent successfully!")
-                
-                if idx < len(alerts_messages):
-                    print("Waiting 3 seconds before sending next part...")
-                    time.sleep(3)
-        
-        # Wait a moment before closing to ensure message is queued
-        time.sleep(2)
-        
-        # Close the connection
-        interface.close()
-        print("Connection closed.")
-    except Exception as e:
-        print(f"Error sending messages: {e}")
+    radio.send_once(groups, CHANNEL_INDEX, dry_run=args.dry_run)
 
 if __name__ == "__main__":
     main()
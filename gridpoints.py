@@ -0,0 +1,257 @@
+"""NWS gridpoint forecasts as hourly numpy arrays, and products derived from them.
+
+The raw gridpoint data (a point's forecastGridData) has a time series per
+quantity - temperature, dewpoint, humidity, wind, gusts, sky cover,
+probability of precipitation, QPF and more - each a list of values valid
+over ISO 8601 intervals such as "2025-07-15T19:00:00+00:00/PT3H". Every
+series is expanded onto one common hourly axis with numpy: a level (a
+temperature, a percentage) holds for every hour of its interval, while an
+amount (QPF) is spread evenly over them. Heat index, wet-bulb temperature,
+rain totals and the peak gust are then computed over whole arrays.
+
+Grids are kept in memory and on disk per gridpoint URL by index_cache,
+like forecast_index indexes, so every site and product in one grid cell comes from a
+single download and expansion, reused until NWS updates the forecast.
+"""
+import re
+import os
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+import numpy as np
+
+import index_cache
+import metrics
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+GRIDPOINT_DIR = os.getenv("GRIDPOINT_DIR", os.path.join(CACHE_DIR, "gridpoints"))
+
+# Series ingested and how their values spread over an interval: 'level' or 'amount'
+LAYERS = {
+    "temperature": "level",
+    "dewpoint": "level",
+    "relativeHumidity": "level",
+    "apparentTemperature": "level",
+    "windDirection": "level",
+    "windSpeed": "level",
+    "windGust": "level",
+    "skyCover": "level",
+    "probabilityOfPrecipitation": "level",
+    "quantitativePrecipitation": "amount",
+}
+
+# Arrays hold °C, km/h, mm, percent and degrees; other units NWS may use are converted
+UNITS = {
+    "wmoUnit:degF": lambda v: (v - 32) * 5 / 9,
+    "wmoUnit:m_s-1": lambda v: v * 3.6,
+    "wmoUnit:kn": lambda v: v * 1.852,
+    "wmoUnit:in": lambda v: v * 25.4,
+}
+
+DURATION = re.compile(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+
+def c_to_f(values):
+    return values * 9 / 5 + 32
+
+
+def kmh_to_mph(values):
+    return values / 1.609344
+
+
+def mm_to_in(values):
+    return values / 25.4
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+def duration_hours(duration):
+    """Whole hours in an ISO 8601 duration such as PT3H or P1DT6H (at least 1)"""
+    match = DURATION.match(duration)
+    if not match:
+        raise ValueError(f"Unsupported duration: {duration}")
+    days, hours, minutes, seconds = (int(g or 0) for g in match.groups())
+    return max(1, days * 24 + hours + -(-(minutes * 60 + seconds) // 3600))
+
+
+def _intervals(values):
+    """Start (epoch seconds), length (hours) and value arrays of a series' validTime intervals"""
+    starts = np.empty(len(values), dtype=np.int64)
+    lengths = np.empty(len(values), dtype=np.int64)
+    data = np.empty(len(values))
+    for idx, item in enumerate(values):
+        start, _, duration = item["validTime"].partition("/")
+        starts[idx] = int(datetime.fromisoformat(start.replace("Z", "+00:00")).timestamp())
+        lengths[idx] = duration_hours(duration)
+        data[idx] = np.nan if item.get("value") is None else item["value"]
+    return starts, lengths, data
+
+
+def expand(starts, lengths, values, axis_start, hours, kind="level"):
+    """Spread interval values onto the hourly slots of an axis starting at axis_start.
+
+    Each interval is repeated once per hour it covers and scattered into
+    place in one go; slots no interval covers are NaN.
+    """
+    out = np.full(hours, np.nan)
+    if not len(values):
+        return out
+    if kind == "amount":
+        values = values / lengths
+    # Slot of every covered hour: the interval's first slot plus the hour's offset within the interval
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    slots = np.repeat((starts - axis_start) // 3600, lengths) + offsets
+    filled = np.repeat(values, lengths)
+    keep = (slots >= 0) & (slots < hours)
+    out[slots[keep]] = filled[keep]
+    return out
+
+
+def relative_humidity(temp_c, dewpoint_c):
+    """Relative humidity in percent from temperature and dewpoint (Magnus formula)"""
+    return 100 * np.exp(17.625 * dewpoint_c / (243.04 + dewpoint_c) - 17.625 * temp_c / (243.04 + temp_c))
+
+
+def heat_index(temp_f, rh):
+    """NWS heat index in °F: the Rothfusz regression with its low and high humidity adjustments"""
+    simple = 0.5 * (temp_f + 61.0 + (temp_f - 68.0) * 1.2 + rh * 0.094)
+    t, r = temp_f, rh
+    full = (-42.379 + 2.04901523 * t + 10.14333127 * r - 0.22475541 * t * r - 0.00683783 * t * t
+            - 0.05481717 * r * r + 0.00122874 * t * t * r + 0.00085282 * t * r * r - 0.00000199 * t * t * r * r)
+    dry = (r < 13) & (t >= 80) & (t <= 112)
+    full = np.where(dry, full - (13 - r) / 4 * np.sqrt(np.clip((17 - np.abs(t - 95)) / 17, 0, None)), full)
+    humid = (r > 85) & (t >= 80) & (t <= 87)
+    full = np.where(humid, full + (r - 85) / 10 * (87 - t) / 5, full)
+    return np.where((simple + temp_f) / 2 < 80, simple, full)
+
+
+def wet_bulb(temp_c, rh):
+    """Wet-bulb temperature in °C (Stull 2011, good to about 1 °C at normal pressures)"""
+    return (temp_c * np.arctan(0.151977 * np.sqrt(rh + 8.313659)) + np.arctan(temp_c + rh)
+            - np.arctan(rh - 1.676331) + 0.00391838 * rh ** 1.5 * np.arctan(0.023101 * rh) - 4.686035)
+
+
+def _peak(values):
+    """(largest value, its index), or (None, None) when every value is missing"""
+    if not len(values) or np.all(np.isnan(values)):
+        return None, None
+    idx = int(np.nanargmax(values))
+    return float(values[idx]), idx
+
+
+class Grid:
+    """Gridpoint series on one hourly axis: layers[name][i] is for the hour starting at start + i * 3600"""
+
+    def __init__(self, start, layers, version=None, validator=None):
+        self.start = start
+        self.layers = layers
+        self.version = version
+        self.validator = validator
+        self.hours = len(next(iter(layers.values()))) if layers else 0
+
+    @classmethod
+    def from_gridpoint(cls, data, validator=None):
+        """Expand a gridpoint response (GeoJSON or JSON-LD) onto an hourly axis covering every series"""
+        props = data.get("properties", data)
+        series = {}
+        for name, kind in LAYERS.items():
+            layer = props.get(name) or {}
+            if not layer.get("values"):
+                continue
+            starts, lengths, values = _intervals(layer["values"])
+            convert = UNITS.get(layer.get("uom"))
+            series[name] = (starts, lengths, convert(values) if convert else values, kind)
+        if not series:
+            return cls(0, {}, props.get("updateTime"), validator)
+
+        axis_start = min(int(s[0].min()) for s in series.values()) // 3600 * 3600
+        axis_end = max(int((s[0] + s[1] * 3600).max()) for s in series.values())
+        hours = -(-(axis_end - axis_start) // 3600)
+        layers = {name: expand(starts, lengths, values, axis_start, hours, kind)
+                  for name, (starts, lengths, values, kind) in series.items()}
+        return cls(axis_start, layers, props.get("updateTime"), validator)
+
+    @classmethod
+    def from_dict(cls, data):
+        layers = {name: np.array(values, dtype=float) for name, values in data["layers"].items()}
+        return cls(data["start"], layers, data.get("version"), data.get("validator"))
+
+    def to_dict(self):
+        layers = {name: np.where(np.isnan(values), None, np.round(values, 3)).tolist()
+                  for name, values in self.layers.items()}
+        return {"version": self.version, "validator": self.validator, "start": self.start, "layers": layers}
+
+    def __len__(self):
+        return self.hours
+
+    def times(self):
+        """Epoch seconds of the start of every hour"""
+        return self.start + 3600 * np.arange(self.hours)
+
+    def layer(self, name):
+        """A series by its NWS name; all NaN when the gridpoint doesn't have it"""
+        values = self.layers.get(name)
+        return values if values is not None else np.full(self.hours, np.nan)
+
+    def window(self, hours, now=None):
+        """Slot range (lo, hi) of the next hours, starting with the hour in effect at now"""
+        now = datetime.now(timezone.utc).timestamp() if now is None else _timestamp(now)
+        lo = int(min(max(0, (now - self.start) // 3600), self.hours))
+        return lo, min(lo + hours, self.hours)
+
+    def humidity(self):
+        """Relative humidity, from temperature and dewpoint where NWS gives none"""
+        rh = self.layer("relativeHumidity")
+        derived = relative_humidity(self.layer("temperature"), self.layer("dewpoint"))
+        return np.where(np.isnan(rh), derived, rh)
+
+    def products(self, hours=24, now=None, tz=None):
+        """Derived values over the next hours, in report units (°F, mph, inches).
+
+        Returns a dict with hours (covered by the grid), heat_index_max,
+        wet_bulb_max, rain_total, gust_max and gust_time (when the peak
+        gust is expected, in tz or UTC); values are None where the grid has
+        no data.
+        """
+        lo, hi = self.window(hours, now)
+        temp_c = self.layer("temperature")[lo:hi]
+        rh = self.humidity()[lo:hi]
+        heat, _ = _peak(heat_index(c_to_f(temp_c), rh))
+        wet, _ = _peak(c_to_f(wet_bulb(temp_c, rh)))
+        qpf = self.layer("quantitativePrecipitation")[lo:hi]
+        rain = float(mm_to_in(np.nansum(qpf))) if not np.all(np.isnan(qpf)) else None
+        gust, peak = _peak(kmh_to_mph(self.layer("windGust")[lo:hi]))
+        gust_time = None
+        if peak is not None:
+            gust_time = datetime.fromtimestamp(self.start + (lo + peak) * 3600, tz or timezone.utc)
+        return {"hours": hi - lo, "heat_index_max": heat, "wet_bulb_max": wet, "rain_total": rain,
+                "gust_max": gust, "gust_time": gust_time}
+
+
+def _expand(data):
+    with metrics.span("expand"):
+        return Grid.from_gridpoint(data)
+
+
+# Gridpoint URL -> Grid, for the daemon and multi-site runs
+_cache = index_cache.IndexCache(GRIDPOINT_DIR, Grid.from_dict, _expand,
+                                lambda data: data.get("properties", data).get("updateTime"),
+                                "gridpoint_total", "gridpoint data")
+
+
+def load(url, headers=None, follow_redirects=True):
+    """Fetch a gridpoint forecast and return (grid, stale_since), expanding it only when the forecast changed.
+
+    Raises like http_client.get_json. stale_since is set when the response
+    was an old cached copy served after a failed fetch. The grid is shared
+    and must not be changed.
+    """
+    return _cache.load(url, headers=headers, follow_redirects=follow_redirects)
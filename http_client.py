@@ -0,0 +1,429 @@
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import email.utils
+import random
+import threading
+import time
+import os
+from datetime import datetime
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+
+import metrics
+from response_cache import ResponseCache, freshness_lifetime, parse_cache_control
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))  # Seconds to establish a connection
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "20"))  # Seconds to wait for response data
+MAX_WORKERS = int(os.getenv("HTTP_MAX_WORKERS", "4"))  # Parallel requests (and pooled connections per host)
+HTTP_CACHE = os.getenv("HTTP_CACHE", "true").lower() in ("1", "true", "yes")  # Conditional-request response cache
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(5 * 1024 * 1024)))
+NWS_API_URL = os.getenv("NWS_API_URL", "https://api.weather.gov")  # Override to use a local stand-in
+TEMPEST_API_URL = os.getenv("TEMPEST_API_URL", "https://swd.weatherflow.com/swd/rest")
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))  # Extra attempts after a 429/5xx or connection error
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "1"))  # Base seconds of the exponential backoff between attempts
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))  # Longest wait before a retry, Retry-After included
+RUN_DEADLINE = float(os.getenv("RUN_DEADLINE", "60"))  # Seconds a run may spend fetching before using cached data
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))  # Consecutive failures that open a host's circuit
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "60"))  # Seconds a host is skipped once its circuit opens
+
+# Headers kept with a cached response
+CACHED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control", "Expires")
+
+# Responses worth retrying: rate limited or a temporary server problem
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_lock = threading.Lock()
+_session = None
+_executor = None
+_inflight = {}  # Requests currently being fetched, so concurrent callers can share them
+_breakers = {}
+_deadline = None
+response_cache = ResponseCache(os.path.join(CACHE_DIR, "http"), HTTP_CACHE_MAX_BYTES)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """The run's fetch deadline passed before a response arrived"""
+
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    """Requests to a host are suspended after repeated failures"""
+
+
+class StaleData(dict):
+    """A JSON object served from the cache because a fresh copy could not be fetched"""
+
+    def __init__(self, data, stale_since):
+        super().__init__(data)
+        self.stale_since = stale_since
+
+
+class CircuitBreaker:
+    """Stops calling a host that keeps failing.
+
+    After `failures` consecutive failed attempts the circuit opens and
+    requests fail at once for `cooldown` seconds. Then a single trial
+    request is let through: success closes the circuit, failure opens it
+    for another cooldown.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN, clock=time.monotonic):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self.consecutive = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or self.clock() - self.opened_at < self.cooldown:
+                return False
+            self.trial = True
+            return True
+
+    def record(self, ok):
+        """Record an attempt; returns True if this failure opened the circuit"""
+        with self._lock:
+            if ok:
+                self.consecutive = 0
+                self.opened_at = None
+                self.trial = False
+                return False
+            self.consecutive += 1
+            if self.trial or (self.opened_at is None and self.consecutive >= self.failures):
+                self.opened_at = self.clock()
+                self.trial = False
+                return True
+            return False
+
+
+def get_breaker(host):
+    with _lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker()
+        return breaker
+
+
+def start_run(seconds=RUN_DEADLINE):
+    """Start the fetch deadline for a run.
+
+    Once it passes, requests are no longer made or retried: cached
+    responses are served (marked stale) instead, so the report still goes
+    out on time. A deadline of 0 disables it.
+    """
+    global _deadline
+    _deadline = time.monotonic() + seconds if seconds > 0 else None
+
+
+def remaining():
+    """Seconds left before the run's deadline, or None without one"""
+    return None if _deadline is None else _deadline - time.monotonic()
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header (delay seconds or an HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+
+def backoff_delay(attempt, resp=None):
+    """Seconds before retry number attempt + 1, or None if the server asks for longer than we wait.
+
+    Exponential backoff with full jitter, so runs started by the same cron
+    minute don't retry in step; a Retry-After header takes precedence.
+    """
+    retry_after = parse_retry_after(resp.headers.get("Retry-After")) if resp is not None else None
+    if retry_after is not None:
+        return retry_after if retry_after <= HTTP_BACKOFF_MAX else None
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF * 2 ** attempt))
+
+
+def get_session():
+    """Return the shared session, creating it on first use.
+
+    Reusing one session keeps TLS connections alive between requests to the
+    same host, so only the first call to api.weather.gov pays for the handshake.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _from_cache(url, entry):
+    """Build a Response object from a cached entry"""
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.url = url
+    resp.headers = CaseInsensitiveDict(entry["headers"])
+    resp.encoding = "utf-8"
+    resp._content = entry["body"].encode("utf-8")
+    return resp
+
+
+def _store(key, resp, previous=None):
+    """Cache a 200 (or refresh a revalidated entry) unless the server forbids it"""
+    headers = {name: resp.headers[name] for name in CACHED_HEADERS if name in resp.headers}
+    if previous is not None:
+        # A 304 only carries updated validators and freshness; keep the old body
+        headers = dict(previous["headers"], **headers)
+    if "no-store" in parse_cache_control(headers.get("Cache-Control")):
+        return
+    response_cache.put(key, {
+        "headers": headers,
+        "body": previous["body"] if previous is not None else resp.text,
+        "stored_at": time.time(),
+        "expires_at": freshness_lifetime(headers),
+    })
+
+
+def _attempt(url, host, headers, timeout, follow_redirects):
+    """One timed request on the shared session"""
+    with metrics.span("http", host=host) as fields:
+        resp = get_session().get(url, headers=headers, timeout=timeout, allow_redirects=follow_redirects)
+        size = len(resp.content)
+        fields.update(status=resp.status_code, bytes=size)
+    metrics.inc("http_requests_total", host=host, status=resp.status_code)
+    metrics.inc("http_bytes_total", size, host=host)
+    return resp
+
+
+def _request(url, headers, timeout, follow_redirects):
+    """Request with retries, within the run deadline and the host's circuit breaker.
+
+    429/5xx responses and connection errors are retried up to HTTP_RETRIES
+    times. The last response is returned (or the last error raised) when
+    retries run out or the deadline would pass while waiting.
+    """
+    host = urlsplit(url).hostname or "unknown"
+    breaker = get_breaker(host)
+    attempt = 0
+    while True:
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f"Run deadline passed before fetching from {host}")
+        if not breaker.allow():
+            metrics.inc("circuit_open_total", host=host)
+            raise CircuitOpen(f"Skipping {host} after repeated failures")
+
+        attempt_timeout = timeout
+        if left is not None:
+            attempt_timeout = tuple(min(t, left) for t in (timeout if isinstance(timeout, tuple) else (timeout, timeout)))
+        resp = error = None
+        try:
+            resp = _attempt(url, host, headers, attempt_timeout, follow_redirects)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
+        failed = error is not None or resp.status_code in RETRY_STATUSES
+        if breaker.record(not failed):
+            print(f"{host} failed {breaker.consecutive} times in a row, pausing requests for {breaker.cooldown:.0f} seconds")
+            break
+        if not failed or attempt >= HTTP_RETRIES:
+            break
+
+        delay = backoff_delay(attempt, resp)
+        left = remaining()
+        if delay is None or (left is not None and delay >= left):
+            break
+        reason = error or f"HTTP {resp.status_code}"
+        print(f"Request to {host} failed ({reason}), retrying in {delay:.1f} seconds")
+        metrics.inc("retries_total", stage="http", host=host)
+        time.sleep(delay)
+        attempt += 1
+
+    if error is not None:
+        raise error
+    return resp
+
+
+def _stale(url, entry, reason):
+    """Serve a cached entry, however old, after a failed fetch"""
+    stored = datetime.fromtimestamp(entry.get("stored_at", 0))
+    print(f"Using cached response from {stored:%Y-%m-%d %H:%M} ({reason})")
+    metrics.inc("http_stale_total", host=urlsplit(url).hostname or "unknown")
+    resp = _from_cache(url, entry)
+    resp.stale_since = entry.get("stored_at", 0)
+    return resp
+
+
+def get(url, headers=None, timeout=None, follow_redirects=True, cache=True):
+    """GET a URL through the shared session with connect and read timeouts.
+
+    Responses are cached according to their Cache-Control/Expires headers:
+    fresh entries are served without a request, stale ones are revalidated
+    with If-None-Match/If-Modified-Since and a 304 is served from the cache.
+    When the request fails (after retries, past the run deadline or with
+    the host's circuit open) the cached entry is served however old it is,
+    with resp.stale_since set to when it was stored.
+    """
+    if timeout is None:
+        timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+    if not (cache and HTTP_CACHE):
+        return _request(url, headers, timeout, follow_redirects)
+
+    key = response_cache.make_key(url, headers)
+    entry = response_cache.get(key)
+    if entry is not None and entry.get("expires_at") and entry["expires_at"] > time.time():
+        response_cache.count("hits")
+        metrics.inc("http_cache_hits_total", kind="fresh")
+        return _from_cache(url, entry)
+
+    request_headers = dict(headers or {})
+    if entry is not None:
+        if "ETag" in entry["headers"]:
+            request_headers["If-None-Match"] = entry["headers"]["ETag"]
+        if "Last-Modified" in entry["headers"]:
+            request_headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+
+    try:
+        resp = _request(url, request_headers, timeout, follow_redirects)
+    except requests.exceptions.RequestException as e:
+        if entry is None:
+            raise
+        return _stale(url, entry, e)
+
+    if resp.status_code in RETRY_STATUSES and entry is not None:
+        return _stale(url, entry, f"HTTP {resp.status_code}")
+
+    if resp.status_code == 304 and entry is not None:
+        response_cache.count("hits")
+        response_cache.count("revalidated")
+        metrics.inc("http_cache_hits_total", kind="revalidated")
+        _store(key, resp, previous=entry)
+        return _from_cache(url, entry)
+
+    response_cache.count("misses")
+    if resp.status_code == 200:
+        _store(key, resp)
+    return resp
+
+
+def cache_stats():
+    """Return the response cache hit/miss counters"""
+    return response_cache.stats()
+
+
+def get_checked(url, headers=None, follow_redirects=True):
+    """GET a URL through the cache, raising on HTTP errors.
+
+    With follow_redirects=False a permanent redirect raises an HTTPError, so
+    callers holding a cached URL can tell that it has moved.
+    """
+    resp = get(url, headers=headers, follow_redirects=follow_redirects)
+    if resp.status_code in (301, 308):
+        raise requests.exceptions.HTTPError(f"{resp.status_code} Moved Permanently: {url}", response=resp)
+    resp.raise_for_status()
+    return resp
+
+
+def get_json(url, headers=None, follow_redirects=True):
+    """GET a URL and return the decoded JSON body, raising on HTTP errors.
+
+    With follow_redirects=False a permanent redirect raises an HTTPError, so
+    callers holding a cached URL can tell that it has moved.
+
+    Concurrent calls for the same URL share a single request (for example two
+    sites in the same NWS forecast grid), so the returned body must be
+    treated as read-only.
+    """
+    key = (url, (headers or {}).get("Accept"), follow_redirects)
+    with _lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[key] = future
+    if not leader:
+        return future.result()
+
+    try:
+        resp = get_checked(url, headers=headers, follow_redirects=follow_redirects)
+        with metrics.span("parse"):
+            data = resp.json()
+        if getattr(resp, "stale_since", None) is not None and isinstance(data, dict):
+            data = StaleData(data, resp.stale_since)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(data)
+        return data
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def stale_since(*payloads):
+    """When the oldest of these responses or JSON bodies was cached, if any was served stale; else None"""
+    times = [t for t in (getattr(p, "stale_since", None) for p in payloads) if t is not None]
+    return min(times) if times else None
+
+
+def mark_stale(data, since):
+    """Carry a stale marker over to part of a stale JSON body"""
+    return data if since is None or not isinstance(data, dict) else StaleData(data, since)
+
+
+def stale_field(since):
+    """(verbose, compact) report field saying the data is from the cache, or None"""
+    if since is None:
+        return None
+    local = datetime.fromtimestamp(since).strftime("%H:%M")
+    return (f"STALE data from {local}", f"STALE {local}")
+
+
+def submit(func, *args, **kwargs):
+    """Run func in the shared worker pool and return a Future"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="http")
+    return _executor.submit(func, *args, **kwargs)
+
+
+def fetch_all(urls, headers=None):
+    """Fetch several independent URLs in parallel.
+
+    Takes a dict of name -> URL and returns a dict of name -> JSON body.
+    The first failure is re-raised once all requests have finished.
+    """
+    futures = {name: submit(get_json, url, headers) for name, url in urls.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def close():
+    """Close pooled connections and stop the worker pool"""
+    global _session, _executor
+    with _lock:
+        executor, _executor = _executor, None
+        session, _session = _session, None
+    # Outside the lock: running requests need it to finish
+    if executor is not None:
+        executor.shutdown(wait=True)
+    if session is not None:
+        session.close()
@@ -0,0 +1,93 @@
+"""Indexes built from NWS responses, cached in memory and on disk per URL.
+
+forecast_index and gridpoints both turn a large response into a form that
+is costly to build. An IndexCache keeps the built object for each URL in
+memory (for the daemon and multi-site runs) and as JSON on disk (for the
+next cron run), along with the response's ETag or Last-Modified and the
+forecast's version. While the response is unchanged its body is not even
+decoded; a changed body whose forecast has the same version keeps the
+cached object.
+
+Cached objects are shared between threads and runs, so callers must treat
+them as read-only; whether the response was served stale is returned next
+to the object rather than stored on it.
+"""
+import hashlib
+import json
+import threading
+import os
+
+import http_client
+import metrics
+
+
+class IndexCache:
+    """Objects built from the responses at each URL, rebuilt only when the forecast changes.
+
+    from_dict and to_dict() convert an object to and from JSON; build(data)
+    makes one from a decoded response and version(data) is the forecast's
+    version, or None. Objects must have version and validator attributes.
+    metric names the counter of unchanged/same_version/rebuilt loads.
+    """
+
+    def __init__(self, directory, from_dict, build, version, metric, description):
+        self.directory = directory
+        self.from_dict = from_dict
+        self.build = build
+        self.version = version
+        self.metric = metric
+        self.description = description
+        self._lock = threading.Lock()
+        self._url_locks = {}
+        self._memory = {}  # URL -> object
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest()[:32] + ".json")
+
+    def _read(self, url):
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                return self.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write(self, url, obj):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(url)
+            tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(obj.to_dict(), f, separators=(",", ":"))
+            os.replace(tmp_file, path)
+        except OSError as e:
+            print(f"Could not save {self.description}: {e}")
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def load(self, url, headers=None, follow_redirects=True):
+        """Fetch url and return (object, stale_since).
+
+        Raises like http_client.get_json. stale_since is when the response
+        was cached if it was an old copy served after a failed fetch, else
+        None.
+        """
+        with self._url_lock(url):
+            resp = http_client.get_checked(url, headers=headers, follow_redirects=follow_redirects)
+            validator = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+            obj = self._memory.get(url) or self._read(url)
+            if obj is not None and validator is not None and obj.validator == validator:
+                metrics.inc(self.metric, result="unchanged")
+            else:
+                with metrics.span("parse"):
+                    data = resp.json()
+                if obj is not None and obj.version is not None and obj.version == self.version(data):
+                    metrics.inc(self.metric, result="same_version")
+                else:
+                    obj = self.build(data)
+                    metrics.inc(self.metric, result="rebuilt")
+                obj.validator = validator
+                self._write(url, obj)
+            self._memory[url] = obj
+            return obj, getattr(resp, "stale_since", None)
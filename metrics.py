@@ -0,0 +1,238 @@
+"""Per-stage timing spans and counters, exported for monitoring.
+
+Stages (config, http, parse, expand, model, render, split, connect, pacing, send,
+ack, close, respond) are timed with span() and summed per stage; counters count
+bytes fetched, packets sent, cache hits, retries and errors. The same numbers
+can be written as a Prometheus textfile when the process exits (for the
+node_exporter textfile collector), served on /metrics by the daemon, and
+logged as one JSON line per span.
+"""
+import atexit
+import json
+import sys
+import threading
+import time
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+METRICS_TEXTFILE_DIR = os.getenv("METRICS_TEXTFILE_DIR")  # Write <script>.prom here when a run ends
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Serve /metrics on this port from wx_daemon.py (0 = off)
+METRICS_LOG = os.getenv("METRICS_LOG")  # Append JSON log lines to this file ('-' for stderr)
+
+PREFIX = "wx_"
+SCRIPT = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python"
+
+HELP = {
+    "stage_seconds": "Time spent in each stage",
+    "http_requests_total": "HTTP requests made, by host and status",
+    "http_bytes_total": "Response bytes fetched, by host",
+    "http_cache_hits_total": "Responses served from the cache, fresh or revalidated",
+    "http_stale_total": "Old cached responses served because a fetch failed",
+    "forecast_index_total": "Hourly forecast loads: index unchanged, same forecast version or rebuilt",
+    "better_forecast_total": "Tempest Better Forecast loads: fetched or reused from memory",
+    "gridpoint_total": "Gridpoint forecast loads: grid unchanged, same forecast version or re-expanded",
+    "circuit_open_total": "Requests skipped because the host's circuit was open",
+    "packets_sent_total": "Packets handed to the radio",
+    "packets_dropped_total": "Packets given up on after repeated send failures",
+    "bytes_sent_total": "Payload bytes handed to the radio",
+    "airtime_seconds_total": "Estimated time on air of the packets sent",
+    "responder_queries_total": "Queries received over the mesh, by command and result",
+    "deliveries_total": "Reports sent to each node, by result (delivered, partial, failed, timeout)",
+    "outbox_total": "Outbox items stored, superseded by a newer copy, expired or delivered",
+    "retries_total": "Operations retried after a failure",
+    "errors_total": "Stages that failed",
+    "last_run_timestamp_seconds": "When these metrics were last written",
+}
+
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class Registry:
+    """Counters and per-stage timing summaries for this process"""
+
+    def __init__(self):
+        self.counters = {}
+        self.timings = {}  # (stage, labels) -> [count, total seconds, max seconds]
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with _lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, stage, seconds, **labels):
+        key = _key(stage, labels)
+        with _lock:
+            summary = self.timings.setdefault(key, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += seconds
+            summary[2] = max(summary[2], seconds)
+
+    def snapshot(self):
+        """Counters and stage timings as plain dicts, for JSON"""
+        with _lock:
+            counters = {name + _format_labels(labels): value for (name, labels), value in self.counters.items()}
+            stages = {stage + _format_labels(labels): {"count": c, "seconds": round(t, 6), "max": round(m, 6)}
+                      for (stage, labels), (c, t, m) in self.timings.items()}
+        return {"counters": counters, "stages": stages}
+
+    def render(self, script=SCRIPT):
+        """Prometheus text exposition of everything recorded so far"""
+        with _lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+        lines = []
+
+        def header(name, kind):
+            lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        if timings:
+            header("stage_seconds", "summary")
+            for (stage, labels), (count, total, _) in timings:
+                label_text = _format_labels((("script", script), ("stage", stage)) + labels)
+                lines.append(f"{PREFIX}stage_seconds_sum{label_text} {total:.6f}")
+                lines.append(f"{PREFIX}stage_seconds_count{label_text} {count}")
+            lines.append(f"# HELP {PREFIX}stage_seconds_max Longest single span of each stage")
+            lines.append(f"# TYPE {PREFIX}stage_seconds_max gauge")
+            for (stage, labels), (_, _, longest) in timings:
+                label_text = _format_labels((("script", script), ("stage", stage)) + labels)
+                lines.append(f"{PREFIX}stage_seconds_max{label_text} {longest:.6f}")
+
+        previous = None
+        for (name, labels), value in counters:
+            if name != previous:
+                header(name, "counter")
+                previous = name
+            lines.append(f"{PREFIX}{name}{_format_labels((('script', script),) + labels)} {value:g}")
+
+        header("last_run_timestamp_seconds", "gauge")
+        lines.append(f"{PREFIX}last_run_timestamp_seconds{_format_labels((('script', script),))} {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def inc(name, value=1, **labels):
+    """Add to a counter, e.g. inc("packets_sent_total")"""
+    registry.inc(name, value, **labels)
+
+
+def log(event, **fields):
+    """Write one JSON log line when METRICS_LOG is set"""
+    if not METRICS_LOG:
+        return
+    record = {"time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"), "script": SCRIPT,
+              "event": event}
+    record.update(fields)
+    line = json.dumps(record, default=str)
+    with _log_lock:
+        try:
+            if METRICS_LOG == "-":
+                print(line, file=sys.stderr)
+            else:
+                with open(METRICS_LOG, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except OSError:
+            # Logging must never break a report
+            pass
+
+
+@contextmanager
+def span(stage, **labels):
+    """Time a stage. Yields a dict; fields added to it go into the JSON log line.
+
+    A span that raises counts as an error for its stage; the exception is
+    re-raised.
+    """
+    fields = {}
+    started = time.perf_counter()
+    ok = True
+    try:
+        yield fields
+    except BaseException:
+        ok = False
+        inc("errors_total", stage=stage)
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        registry.observe(stage, seconds, **labels)
+        log("span", stage=stage, seconds=round(seconds, 6), ok=ok, **dict(labels, **fields))
+
+
+def observe(stage, seconds, **labels):
+    """Record time spent in a stage measured elsewhere, such as pacing sleeps"""
+    registry.observe(stage, seconds, **labels)
+    log("span", stage=stage, seconds=round(seconds, 6), ok=True, **labels)
+
+
+def write_textfile(directory=METRICS_TEXTFILE_DIR, script=SCRIPT):
+    """Write <script>.prom atomically, so the collector never reads a partial file"""
+    if not directory:
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{script}.prom")
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(registry.render(script))
+        os.replace(tmp_file, path)
+    except OSError as e:
+        print(f"Could not write metrics: {e}")
+
+
+def _finish():
+    log("run", **registry.snapshot())
+    write_textfile()
+
+
+atexit.register(_finish)
+
+
+def serve(port=METRICS_PORT, host=""):
+    """Serve /metrics from a background thread; returns the server, or None when port is 0"""
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Serving metrics on http://{host or '0.0.0.0'}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,120 @@
+import importlib
+import json
+import time
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+import http_client
+import metrics
+import radio
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+SITES_FILE = os.getenv("SITES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sites.json"))
+SITE_WORKERS = int(os.getenv("SITE_WORKERS", "4"))  # Sites fetched in parallel
+CHANNEL_INDEX = os.getenv("CHANNEL_INDEX", "4")  # Default channel for sites that don't set one
+
+# Site fields each report's build_messages() accepts
+REPORT_ARGS = {
+    "getwx": {"station_id": "tempest_station_id", "label": "label", "units": "units"},
+    "tempest_forecast": {"station_id": "tempest_station_id", "label": "label", "units": "units"},
+    "getwx_forecast": {"lat": "lat", "lon": "lon", "label": "label", "units": "units"},
+    "nws_current_weather": {"lat": "lat", "lon": "lon", "units": "units"},
+}
+# build_messages() options that keep a report from changing persistent state, for dry runs
+DRY_RUN_ARGS = {
+    "getwx": {"store": False},
+    "getwx_forecast": {"dedup": False},
+    "nws_current_weather": {"store": False},
+}
+TEMPEST_REPORTS = ("getwx", "tempest_forecast")
+NWS_REPORTS = ("getwx_forecast", "nws_current_weather")
+
+
+def load_sites(path=SITES_FILE):
+    """Load the site list from a JSON file.
+
+    Each site is an object with a name plus any of: label, lat, lon,
+    tempest_station_id, channel_index, units and reports. Without an explicit
+    reports list a site gets the NWS reports if it has coordinates and the
+    Tempest reports if it has a station.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        sites = json.load(f)
+
+    for site in sites:
+        if "name" not in site:
+            raise ValueError(f"Site is missing a name: {site}")
+        site.setdefault("label", site["name"])
+        site.setdefault("channel_index", CHANNEL_INDEX)
+        if "reports" not in site:
+            reports = []
+            if site.get("lat") is not None and site.get("lon") is not None:
+                reports.extend(NWS_REPORTS)
+            if site.get("tempest_station_id"):
+                reports.extend(TEMPEST_REPORTS)
+            site["reports"] = reports
+        for report in site["reports"]:
+            if report not in REPORT_ARGS:
+                raise ValueError(f"Unknown report '{report}' for site {site['name']}")
+    return sites
+
+
+def build_report(site, report, **options):
+    """Render one report for one site; options are passed on to the report's build_messages()"""
+    module = importlib.import_module(report)
+    kwargs = {arg: site[field] for arg, field in REPORT_ARGS[report].items() if site.get(field) is not None}
+    kwargs.update(options)
+    with metrics.span("render", report=report):
+        return module.build_messages(**kwargs)
+
+
+def build_all(sites, dry_run=False):
+    """Render every report for every site concurrently.
+
+    Returns a list of (site, report, groups) in site order. Identical
+    upstream requests made at the same time (e.g. two sites in the same
+    NWS forecast grid) are fetched only once by http_client, and repeat
+    lookups are served from its caches. A failing site or report is
+    reported and skipped without affecting the others. With dry_run the
+    reports are rendered with DRY_RUN_ARGS.
+    """
+    jobs = [(site, report) for site in sites for report in site["reports"]]
+    with ThreadPoolExecutor(max_workers=SITE_WORKERS, thread_name_prefix="site") as pool:
+        futures = [pool.submit(build_report, site, report, **(DRY_RUN_ARGS.get(report, {}) if dry_run else {}))
+                   for site, report in jobs]
+
+    results = []
+    for (site, report), future in zip(jobs, futures):
+        try:
+            groups = future.result()
+        except Exception as e:
+            print(f"Error building {report} for {site['name']}: {e}")
+            continue
+        if groups:
+            results.append((site, report, groups))
+    return results
+
+
+def main():
+    args = radio.parse_args("Send every site's reports over Meshtastic")
+    http_client.start_run()
+    sites = load_sites()
+    start = time.monotonic()
+    results = build_all(sites, args.dry_run)
+    print(f"Built {len(results)} reports for {len(sites)} sites in {time.monotonic() - start:.1f} seconds")
+
+    if not results:
+        return
+
+    # Send everything over one connection and queue per node, each report to its site's channel
+    for site, report, groups in results:
+        print(f"Queueing {report} for {site['name']} on channel {site['channel_index']}")
+    radio.send_all([(groups, site["channel_index"], f"{report}:{site['name']}") for site, report, groups in results],
+                   dry_run=args.dry_run)
+
+if __name__ == "__main__":
+    main()
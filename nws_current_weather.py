@@ -1,12 +1,17 @@
 import requests
-import meshtastic
-import meshtastic.tcp_interface
-import meshtastic.serial_interface
-import time
 import os
 from datetime import datetime
 from dotenv import load_dotenv
 
+import http_client
+import metrics
+import points_cache
+import radio
+import records
+import templates
+import tsstore
+import wxbinary
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -14,162 +19,135 @@ load_dotenv()
 LAT = float(os.getenv("LAT", "33.74733"))
 LON = float(os.getenv("LON", "-111.77912"))
 USER_AGENT = os.getenv("USER_AGENT", "WeatherApp/1.0 (your.email@example.com)")
-MESHTASTIC_INTERFACE = os.getenv("MESHTASTIC_INTERFACE", "tcp")  # 'tcp' or 'serial'
-MESHTASTIC_HOST = os.getenv("MESHTASTIC_HOST", "localhost")  # For TCP
-MESHTASTIC_PORT = os.getenv("MESHTASTIC_PORT")  # For Serial (e.g., COM3, /dev/ttyUSB0)
 CHANNEL_INDEX = os.getenv("CHANNEL_INDEX", "4")
 
-def get_json(url):
+def get_json(url, follow_redirects=True):
     """Make a request to NWS API with required headers"""
     headers = {
         "User-Agent": USER_AGENT,
         "Accept": "application/geo+json"
     }
-    resp = requests.get(url, headers=headers)
-    resp.raise_for_status()
-    return resp.json()
+    return http_client.get_json(url, headers=headers, follow_redirects=follow_redirects)
 
-def main():
+def fetch_observation(lat=LAT, lon=LON):
+    """Fetch the latest observation from the nearest station.
+
+    Returns (point, properties), where point is the cached /points entry with
+    station_id and station_name; properties is None if no station was found.
+    """
     # Step 1: Get the nearest weather station from the lat/lon point
-    print(f"Looking up weather station for coordinates: {LAT}, {LON}")
-    points_url = f"https://api.weather.gov/points/{LAT},{LON}"
-    points_data = get_json(points_url)
-    
-    # Get observation stations URL
-    stations_url = points_data.get("properties", {}).get("observationStations")
-    if not stations_url:
-        stations_url = points_data.get("observationStations")
+    # (the point and station lookup are cached on disk between runs)
+    print(f"Looking up weather station for coordinates: {lat}, {lon}")
+    point = points_cache.resolve_station(lat, lon, get_json)
     
-    if not stations_url:
+    if not point.get("observationStations"):
         print("Error: Could not find observation stations URL")
-        return
+        return point, None
     
-    # Step 2: Get list of nearby stations
-    print(f"Fetching nearby stations...")
-    stations_data = get_json(stations_url)
-    features = stations_data.get("features", [])
-    
-    if not features:
+    if not point.get("station_id"):
         print("No weather stations found nearby")
-        return
-    
-    # Get the first (closest) station
-    station = features[0]
-    station_id = station.get("properties", {}).get("stationIdentifier")
-    station_name = station.get("properties", {}).get("name")
-    
-    print(f"Using station: {station_name} ({station_id})")
+        return point, None
     
-    # Step 3: Get current observations from the station
-    obs_url = f"https://api.weather.gov/stations/{station_id}/observations/latest"
-    obs_data = get_json(obs_url)
-    
-    props = obs_data.get("properties", {})
-    
-    # Extract weather data
-    timestamp = props.get("timestamp", "N/A")
-    temp_c = props.get("temperature", {}).get("value")
-    humidity = props.get("relativeHumidity", {}).get("value")
-    wind_speed_ms = props.get("windSpeed", {}).get("value")
-    wind_direction = props.get("windDirection", {}).get("value")
-    pressure_pa = props.get("barometricPressure", {}).get("value")
-    description = props.get("textDescription", "N/A")
-    
-    # Convert to US units
-    if temp_c is not None:
-        temp_f = (temp_c * 9/5) + 32
-    else:
-        temp_f = None
+    # Step 2: Get current observations from the station
+    try:
+        obs_data = get_json(f"{http_client.NWS_API_URL}/stations/{point['station_id']}/observations/latest")
+    except requests.exceptions.HTTPError as e:
+        if not points_cache.is_moved(e):
+            raise
+        # Station retired or renamed - look it up again
+        print(f"Station {point['station_id']} is no longer valid, re-resolving...")
+        points_cache.invalidate(lat, lon)
+        point = points_cache.resolve_station(lat, lon, get_json, refresh=True)
+        if not point.get("station_id"):
+            print("No weather stations found nearby")
+            return point, None
+        obs_data = get_json(f"{http_client.NWS_API_URL}/stations/{point['station_id']}/observations/latest")
+    
+    return point, http_client.mark_stale(obs_data.get("properties", {}), http_client.stale_since(obs_data))
+
+# NWS speed units (WMO codes) to m/s
+SPEED_FACTORS = {"km_h-1": 1 / 3.6, "m_s-1": 1.0, "kt": 0.514444}
+
+def normalize_observation(props):
+    """Convert NWS observation properties to Tempest field names and units (C, %, m/s, hPa)"""
+    def value(name, unit_factors):
+        item = props.get(name) or {}
+        raw = item.get("value")
+        if raw is None:
+            return None
+        unit = item.get("unitCode", "").split(":")[-1]
+        return raw * unit_factors.get(unit, 1.0)
+
+    obs = {
+        "air_temperature": value("temperature", {}),
+        "relative_humidity": value("relativeHumidity", {}),
+        "wind_avg": value("windSpeed", SPEED_FACTORS),
+        "wind_gust": value("windGust", SPEED_FACTORS),
+        "wind_direction": value("windDirection", {}),
+        "barometric_pressure": value("barometricPressure", {"Pa": 0.01}),
+    }
+    timestamp = props.get("timestamp")
+    if timestamp:
+        obs["timestamp"] = datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+    return obs
+
+def build_messages(lat=LAT, lon=LON, units=None, store=True):
+    """Fetch the latest observation from the nearest station and return the message groups to send.
+
+    Without store the observation is not added to the station's history
+    (for dry runs); the report uses the rollup as it is.
+    """
+    point, props = fetch_observation(lat, lon)
+    if props is None:
+        return []
     
-    if wind_speed_ms is not None:
-        wind_mph = wind_speed_ms * 2.23694
-    else:
-        wind_mph = None
+    station_id = point["station_id"]
+    station_name = point.get("station_name")
     
-    if pressure_pa is not None:
-        pressure_inHg = pressure_pa * 0.0002953
-    else:
-        pressure_inHg = None
+    print(f"Using station: {station_name} ({station_id})")
     
-    # Format timestamp (convert to local time)
-    if timestamp != "N/A":
-        dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-        local_dt = dt.astimezone()
-        time_str = local_dt.strftime("%H:%M")
+    # Today's high/low and peak gust from the local history of this station
+    obs = normalize_observation(props)
+    if store:
+        rollup = tsstore.record(f"nws-{station_id}", obs)
     else:
-        time_str = "N/A"
-    
-    # Build output message
-    message_lines = []
-    message_lines.append(f"NWS Current Conditions as of {time_str}")
-    message_lines.append(f"Station: {station_name} ({station_id})")
-    message_lines.append(f"Conditions: {description}")
-    if temp_f is not None:
-        message_lines.append(f"Temperature: {temp_f:.1f}°F")
-    if humidity is not None:
-        message_lines.append(f"Humidity: {humidity:.0f}%")
-    if wind_mph is not None and wind_direction is not None:
-        message_lines.append(f"Wind: {wind_mph:.1f} mph from {wind_direction}°")
-    elif wind_mph is not None:
-        message_lines.append(f"Wind Speed: {wind_mph:.1f} mph")
-    if pressure_inHg is not None:
-        message_lines.append(f"Pressure: {pressure_inHg:.2f} inHg")
+        rollup = tsstore.today(f"nws-{station_id}")
+    record = records.with_rollup(records.from_observation(
+        obs, station=station_id, station_name=station_name, conditions=props.get("textDescription"),
+        stale_since=http_client.stale_since(props)), rollup)
+
+    # Lines in both wordings; the compact one is only used when it saves a packet
+    template = templates.get("nws_current", units)
+    message_lines = template.render(record)
     
-    message = "\n".join(message_lines)
+    # Fit the radio's payload limit - split at line boundaries if needed
+    messages_to_send = template.pack(message_lines)
+    if len(messages_to_send) > 1:
+        print(f"Warning: Message split into {len(messages_to_send)} parts")
     
-    # Display the message
+    # Display the message as it will be sent
     print("\n" + "="*50)
-    print(message)
+    print(templates.text(messages_to_send))
     print("="*50)
     
-    # Enforce 210 character limit for Meshtastic - split into multiple messages if needed
-    messages_to_send = []
-    if len(message) > 210:
-        # First message: 207 chars + "..."
-        messages_to_send.append(message[:207] + "...")
-        remaining = message[207:]
-        
-        # Additional messages for remainder
-        while remaining:
-            if len(remaining) > 210:
-                messages_to_send.append(remaining[:210])
-                remaining = remaining[210:]
-            else:
-                messages_to_send.append(remaining)
-                remaining = ""
-        
-        print(f"Warning: Message split into {len(messages_to_send)} parts (original: {len(message)} chars)")
-    else:
-        messages_to_send.append(message)
-    
-    # Send message(s) using Meshtastic API
-    try:
-        # Create interface based on configuration
-        if MESHTASTIC_INTERFACE.lower() == "serial":
-            if not MESHTASTIC_PORT:
-                raise ValueError("MESHTASTIC_PORT must be set when using serial interface")
-            interface = meshtastic.serial_interface.SerialInterface(MESHTASTIC_PORT)
-            print(f"\nConnected via Serial: {MESHTASTIC_PORT}")
-        else:
-            interface = meshtastic.tcp_interface.TCPInterface(hostname=MESHTASTIC_HOST)
-            print(f"\nConnected via TCP: {MESHTASTIC_HOST}")
-        
-        for idx, msg in enumerate(messages_to_send, 1):
-            print(f"\nSending weather message part {idx}/{len(messages_to_send)} ({len(msg)} chars)...")
-            interface.sendText(msg, channelIndex=int(CHANNEL_INDEX))
-            print(f"Part {idx} sent successfully!")
-            
-            # Wait between messages if there are multiple parts
-            if idx < len(messages_to_send):
-                print("Waiting 3 seconds before sending next part...")
-                time.sleep(3)
-        
-        # Wait to ensure final message is queued before closing
-        time.sleep(2)
-        interface.close()
-        print("Connection closed.")
-    except Exception as e:
-        print(f"Error sending message: {e}")
+    return wxbinary.with_payload([messages_to_send], wxbinary.NWS_OBS, obs.get("timestamp", 0), {
+        "temperature": obs["air_temperature"],
+        "humidity": obs["relative_humidity"],
+        "pressure": obs["barometric_pressure"],
+        "wind_avg": obs["wind_avg"],
+        "wind_gust": obs["wind_gust"],
+        "wind_direction": obs["wind_direction"],
+        "pressure_trend": tsstore.tendency_trend(rollup and rollup.get("pressure_tendency")),
+    })
+
+def main():
+    args = radio.parse_args("Send current NWS conditions over Meshtastic")
+    http_client.start_run()
+    with metrics.span("render", report="nws_current_weather"):
+        groups = build_messages(store=not args.dry_run)
+    if groups:
+        # Send message(s) using Meshtastic API
+        radio.send_once(groups, CHANNEL_INDEX, dry_run=args.dry_run)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,211 @@
+"""Durable store-and-forward outbox for rendered reports.
+
+Every report is written to a SQLite outbox before it is transmitted and
+each packet is removed once it has gone out, so a report rendered while
+the Meshtastic node is unreachable is delivered when the node is back
+instead of being lost.
+
+A report supersedes the undelivered copy of the same report (same key)
+for the same node and channel, so after an outage each report goes out
+once, in its latest version, rather than as a backlog. Alerts are never
+superseded; they are dropped once they expire, as are routine reports
+older than OUTBOX_MAX_AGE. A sender claims the items it is about to send
+for a lease, so overlapping runs don't send the same item twice.
+"""
+import sqlite3
+import threading
+import time
+import uuid
+import os
+from collections import namedtuple
+from dotenv import load_dotenv
+
+import metrics
+import txqueue
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+OUTBOX = os.getenv("OUTBOX", "true").lower() in ("1", "true", "yes")  # Keep reports until they have been sent
+OUTBOX_DB = os.getenv("OUTBOX_DB", os.path.join(CACHE_DIR, "outbox.db"))
+OUTBOX_MAX_AGE = int(os.getenv("OUTBOX_MAX_AGE", "10800"))  # Seconds an unsent report (or alert without expiry) is kept
+LEASE = 900  # Seconds a claimed item is left to its sender before others may send it
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target TEXT NOT NULL,
+    channel INTEGER NOT NULL,
+    key TEXT,
+    priority INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    claim TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS items_target ON items (target, priority, id);
+CREATE TABLE IF NOT EXISTS packets (
+    item INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    payload BLOB NOT NULL,
+    is_binary INTEGER NOT NULL,
+    PRIMARY KEY (item, seq)
+);
+"""
+
+# One stored report or alert; packets is a list of (seq, payload) still to send, in order
+Item = namedtuple("Item", ["id", "channel", "priority", "key", "created_at", "packets"])
+
+_lock = threading.Lock()
+
+
+def _placeholders(values):
+    return ",".join("?" * len(values))
+
+
+class Outbox:
+    """Reports waiting to be sent, per target node and channel, kept in SQLite"""
+
+    def __init__(self, path=OUTBOX_DB, max_age=OUTBOX_MAX_AGE, clock=time.time):
+        self.path = path
+        self.max_age = max_age
+        self.clock = clock
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _delete(self, conn, ids):
+        if ids:
+            conn.execute(f"DELETE FROM packets WHERE item IN ({_placeholders(ids)})", ids)
+            conn.execute(f"DELETE FROM items WHERE id IN ({_placeholders(ids)})", ids)
+
+    def put(self, target, channel_index, groups, key=None, priority=txqueue.ROUTINE):
+        """Store a report's message groups for a target and channel; returns the number of items stored.
+
+        Groups made with txqueue.alert() are stored as alerts of their own,
+        kept until their expires_at, and count as accepted once stored
+        (see txqueue.alert). The other groups are stored together
+        as one item under key, replacing an unsent item with the same key.
+        """
+        now = self.clock()
+        routine = [part for parts in groups if not isinstance(parts, txqueue.AlertParts) for part in parts]
+        items = [(key, priority, now + self.max_age, routine)] if routine else []
+        for parts in groups:
+            if isinstance(parts, txqueue.AlertParts) and parts:
+                items.append((None, txqueue.ALERT, getattr(parts, "expires_at", None) or now + self.max_age, list(parts)))
+        if not items:
+            return 0
+
+        with _lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    superseded = []
+                    if key is not None and routine:
+                        superseded = [row[0] for row in conn.execute(
+                            "SELECT id FROM items WHERE target = ? AND channel = ? AND key = ?",
+                            (target, int(channel_index), key))]
+                        self._delete(conn, superseded)
+                    for item_key, item_priority, expires_at, parts in items:
+                        item_id = conn.execute(
+                            "INSERT INTO items (target, channel, key, priority, created_at, expires_at)"
+                            " VALUES (?, ?, ?, ?, ?, ?)",
+                            (target, int(channel_index), item_key, item_priority, now, expires_at)).lastrowid
+                        conn.executemany(
+                            "INSERT INTO packets (item, seq, payload, is_binary) VALUES (?, ?, ?, ?)",
+                            [(item_id, seq, part if isinstance(part, bytes) else part.encode("utf-8"),
+                              isinstance(part, bytes)) for seq, part in enumerate(parts)])
+            finally:
+                conn.close()
+
+        if superseded:
+            print(f"Outbox: replaced {len(superseded)} unsent {key} report(s) for {target}")
+            metrics.inc("outbox_total", len(superseded), result="superseded")
+        metrics.inc("outbox_total", len(items), result="stored")
+        for parts in groups:
+            if isinstance(parts, txqueue.AlertParts) and parts:
+                parts.accepted()
+        return len(items)
+
+    def claim(self, target, limit=None, lease=LEASE, max_priority=None):
+        """Claim the target's next items for lease seconds and return them, most urgent first.
+
+        Expired items are dropped first. Items claimed by another sender
+        whose lease is still running are skipped. max_priority limits the
+        claim to items at least that urgent.
+        """
+        now = self.clock()
+        token = uuid.uuid4().hex
+        with _lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    expired = [row[0] for row in conn.execute("SELECT id FROM items WHERE expires_at < ?", (now,))]
+                    self._delete(conn, expired)
+                    # One statement, so concurrent senders can't claim the same item
+                    conn.execute(
+                        "UPDATE items SET claim = ?, lease_until = ? WHERE id IN ("
+                        " SELECT id FROM items WHERE target = ? AND priority <= ?"
+                        " AND (claim IS NULL OR lease_until < ?) ORDER BY priority, id LIMIT ?)",
+                        (token, now + lease, target, txqueue.ROUTINE if max_priority is None else max_priority,
+                         now, -1 if limit is None else limit))
+                    rows = conn.execute(
+                        "SELECT id, channel, priority, key, created_at FROM items WHERE claim = ? ORDER BY priority, id",
+                        (token,)).fetchall()
+                    packets = {}
+                    if rows:
+                        ids = [row[0] for row in rows]
+                        for item_id, seq, payload, is_binary in conn.execute(
+                                f"SELECT item, seq, payload, is_binary FROM packets WHERE item IN ({_placeholders(ids)})"
+                                " ORDER BY item, seq", ids):
+                            packets.setdefault(item_id, []).append(
+                                (seq, bytes(payload) if is_binary else bytes(payload).decode("utf-8")))
+            finally:
+                conn.close()
+
+        if expired:
+            print(f"Outbox: dropped {len(expired)} expired item(s)")
+            metrics.inc("outbox_total", len(expired), result="expired")
+        return [Item(*row, packets.get(row[0], [])) for row in rows]
+
+    def mark_sent(self, item_id, seq):
+        """Remove a packet that has been sent, and its item once nothing of it is left"""
+        with _lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM packets WHERE item = ? AND seq = ?", (item_id, seq))
+                    left = conn.execute("SELECT COUNT(*) FROM packets WHERE item = ?", (item_id,)).fetchone()[0]
+                    done = not left and conn.execute("DELETE FROM items WHERE id = ?", (item_id,)).rowcount
+            finally:
+                conn.close()
+        if done:
+            metrics.inc("outbox_total", result="delivered")
+
+    def release(self, ids):
+        """Give up the claim on items that were not (completely) sent, so they can be sent again"""
+        ids = list(ids)
+        if not ids:
+            return
+        with _lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(f"UPDATE items SET claim = NULL, lease_until = NULL WHERE id IN ({_placeholders(ids)})",
+                                 ids)
+            finally:
+                conn.close()
+
+    def pending(self, target):
+        """Number of items still waiting to be sent to target"""
+        with _lock:
+            conn = self._connect()
+            try:
+                return conn.execute("SELECT COUNT(*) FROM items WHERE target = ?", (target,)).fetchone()[0]
+            finally:
+                conn.close()
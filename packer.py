@@ -0,0 +1,125 @@
+import os
+from dotenv import load_dotenv
+
+import metrics
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Largest text payload the radio accepts, in UTF-8 bytes (not characters: "°" and "²" take two)
+MAX_PAYLOAD_BYTES = int(os.getenv("MAX_PAYLOAD_BYTES", "200"))
+MAX_PARTS = int(os.getenv("MAX_PARTS", "0"))  # Packets a report may take before low-priority fields are dropped (0 = no limit)
+
+
+def byte_len(text):
+    return len(text.encode("utf-8"))
+
+
+def _split_oversized(field, budget):
+    """Break a field that can't fit in one part at word boundaries (or characters as a last resort)"""
+    chunks = []
+    current = ""
+    for word in field.split():
+        candidate = f"{current} {word}" if current else word
+        if byte_len(candidate) <= budget:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        # A single word longer than a whole part is cut on a character boundary
+        while byte_len(word) > budget:
+            cut = word.encode("utf-8")[:budget].decode("utf-8", errors="ignore")
+            chunks.append(cut)
+            word = word[len(cut):]
+        current = word
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _fill(fields, sep, budget):
+    """Greedily fill parts with whole fields; returns the list of part bodies"""
+    parts = []
+    current = None
+    for field in fields:
+        pieces = [field] if byte_len(field) <= budget else _split_oversized(field, budget)
+        for piece in pieces:
+            if current is not None and byte_len(current) + byte_len(sep) + byte_len(piece) <= budget:
+                current = f"{current}{sep}{piece}"
+            else:
+                if current is not None:
+                    parts.append(current)
+                current = piece
+    if current is not None:
+        parts.append(current)
+    return parts
+
+
+def _pack(fields, sep, max_bytes):
+    fields = [f for f in fields if f]
+    parts = _fill(fields, sep, max_bytes)
+    if len(parts) <= 1:
+        return parts
+
+    # Reserve room for the "i/n " marker; retry if n gains a digit
+    count = len(parts)
+    while True:
+        marker_bytes = len(f"{count}/{count} ")
+        parts = _fill(fields, sep, max_bytes - marker_bytes)
+        if len(str(len(parts))) <= len(str(count)):
+            break
+        count = len(parts)
+    return [f"{idx}/{len(parts)} {part}" for idx, part in enumerate(parts, 1)]
+
+
+def pack(fields, sep=" | ", max_bytes=MAX_PAYLOAD_BYTES):
+    """Pack fields into as few parts as possible, breaking only between fields.
+
+    Every part is at most max_bytes once UTF-8 encoded. When more than one
+    part is needed, each is prefixed with its position ("1/2 ") so
+    receivers can tell which parts belong together.
+    """
+    with metrics.span("split"):
+        return _pack(fields, sep, max_bytes)
+
+
+def _pack_profiles(fields, sep, compact_sep, max_bytes):
+    verbose = [f[0] if isinstance(f, tuple) else f for f in fields]
+    parts = _pack(verbose, sep, max_bytes)
+    if len(parts) <= 1:
+        return parts
+
+    compact = [f[1] if isinstance(f, tuple) else f for f in fields]
+    compact_parts = _pack(compact, sep if compact_sep is None else compact_sep, max_bytes)
+    if len(compact_parts) < len(parts):
+        return compact_parts
+    return parts
+
+
+def pack_profiles(fields, sep=" | ", compact_sep=None, max_bytes=MAX_PAYLOAD_BYTES, max_parts=None):
+    """Pack fields given as (verbose, compact) pairs, choosing the cheaper profile.
+
+    The verbose wording is used unless the compact wording needs fewer
+    packets. Plain strings are used as-is in both profiles.
+
+    Fields may carry a priority as a third item (templates.Template.render
+    gives them one). While the report takes more than max_parts packets
+    (MAX_PARTS by default; 0 for no limit), the field with the highest
+    priority is dropped, the last one first among equals. Fields without
+    a priority, or with priority 0, are always kept.
+    """
+    max_parts = MAX_PARTS if max_parts is None else max_parts
+    with metrics.span("split"):
+        fields = list(fields)
+        parts = _pack_profiles(fields, sep, compact_sep, max_bytes)
+        dropped = 0
+        while max_parts and len(parts) > max_parts:
+            droppable = [idx for idx, f in enumerate(fields) if isinstance(f, tuple) and len(f) > 2 and f[2] > 0]
+            if not droppable:
+                break
+            del fields[max(droppable, key=lambda idx: (fields[idx][2], idx))]
+            dropped += 1
+            parts = _pack_profiles(fields, sep, compact_sep, max_bytes)
+        if dropped:
+            print(f"Dropped {dropped} low-priority field(s) to fit {len(parts)} packet(s)")
+        return parts
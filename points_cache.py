@@ -0,0 +1,153 @@
+import requests
+import json
+import threading
+import time
+import os
+from dotenv import load_dotenv
+
+import http_client
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+POINTS_CACHE_TTL = int(os.getenv("POINTS_CACHE_TTL", str(7 * 24 * 3600)))  # Seconds; /points rarely changes
+
+CACHE_FILE = os.path.join(CACHE_DIR, "nws_points.json")
+
+# Statuses meaning a cached URL or station is no longer valid
+MOVED_STATUSES = (301, 308, 404)
+
+_lock = threading.Lock()
+
+
+def _key(lat, lon):
+    # NWS itself rounds /points coordinates to 4 decimal places
+    return f"{float(lat):.4f},{float(lon):.4f}"
+
+
+def _load():
+    try:
+        with open(CACHE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(entries):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Write to a temp file and rename so overlapping runs never see a partial file
+    tmp_file = f"{CACHE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp_file, CACHE_FILE)
+
+
+def _store(lat, lon, entry):
+    with _lock:
+        entries = _load()
+        entries[_key(lat, lon)] = entry
+        _save(entries)
+
+
+def lookup(lat, lon):
+    """Return the cached entry for a coordinate, or None if missing or expired"""
+    with _lock:
+        entry = _load().get(_key(lat, lon))
+    if entry and time.time() - entry.get("fetched_at", 0) < POINTS_CACHE_TTL:
+        return entry
+    return None
+
+
+def invalidate(lat, lon):
+    """Drop the cached entry for a coordinate"""
+    with _lock:
+        entries = _load()
+        if entries.pop(_key(lat, lon), None) is not None:
+            _save(entries)
+            print(f"Invalidated cached NWS point for {lat}, {lon}")
+
+
+def is_moved(error):
+    """True if an HTTP error means the cached URL or station should be re-resolved"""
+    response = getattr(error, "response", None)
+    return (isinstance(error, requests.exceptions.HTTPError) and response is not None
+            and response.status_code in MOVED_STATUSES)
+
+
+def resolve_point(lat, lon, get_json, refresh=False):
+    """Resolve a coordinate to its NWS forecast URLs and location name.
+
+    get_json is the caller's NWS fetch function; both the JSON-LD and
+    GeoJSON response formats are understood.
+    """
+    entry = None if refresh else lookup(lat, lon)
+    if entry:
+        return entry
+
+    data = get_json(f"{http_client.NWS_API_URL}/points/{lat},{lon}")
+    props = data.get("properties", data)
+    location = props.get("relativeLocation", {})
+    location = location.get("properties", location)
+
+    entry = {
+        "forecastHourly": props.get("forecastHourly"),
+        "forecast": props.get("forecast"),
+        "forecastGridData": props.get("forecastGridData"),
+        "observationStations": props.get("observationStations"),
+        "city": location.get("city"),
+        "state": location.get("state"),
+        "fetched_at": time.time(),
+    }
+    _store(lat, lon, entry)
+    return entry
+
+
+def resolve_station(lat, lon, get_json, refresh=False):
+    """Resolve a coordinate to its point entry plus the nearest observation station.
+
+    Returns the entry with station_id and station_name set, or without them
+    if NWS lists no stations for the point.
+    """
+    entry = resolve_point(lat, lon, get_json, refresh=refresh)
+    if entry.get("station_id"):
+        return entry
+
+    stations_url = entry.get("observationStations")
+    if not stations_url:
+        return entry
+
+    features = get_json(stations_url).get("features", [])
+    if features:
+        # The first station in the list is the closest
+        station = features[0].get("properties", {})
+        entry["station_id"] = station.get("stationIdentifier")
+        entry["station_name"] = station.get("name")
+        _store(lat, lon, entry)
+    return entry
+
+
+def fetch(lat, lon, get_json, field, load=None):
+    """Fetch the URL stored under field for a coordinate.
+
+    Returns (entry, data). If the cached URL has moved or disappeared, the
+    point is re-resolved once and the request retried. load, if given, is
+    used instead of get_json to fetch the URL (e.g. forecast_index.load)
+    and must raise the same way.
+    """
+    load = load or get_json
+    entry = resolve_point(lat, lon, get_json)
+    if not entry.get(field):
+        # Cached before the field was stored
+        entry = resolve_point(lat, lon, get_json, refresh=True)
+    try:
+        return entry, load(entry[field], follow_redirects=False)
+    except requests.exceptions.HTTPError as e:
+        if not is_moved(e):
+            raise
+        print(f"Cached {field} URL is no longer valid ({e.response.status_code}), re-resolving...")
+
+    invalidate(lat, lon)
+    entry = resolve_point(lat, lon, get_json, refresh=True)
+    return entry, load(entry[field])
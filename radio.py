@@ -0,0 +1,492 @@
+import argparse
+import threading
+import time
+import os
+from dotenv import load_dotenv
+
+import metrics
+import outbox
+import txqueue
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+MESHTASTIC_INTERFACE = os.getenv("MESHTASTIC_INTERFACE", "tcp")  # 'tcp' or 'serial'
+MESHTASTIC_HOST = os.getenv("MESHTASTIC_HOST", "localhost")  # For TCP
+MESHTASTIC_PORT = os.getenv("MESHTASTIC_PORT")  # For Serial (e.g., COM3, /dev/ttyUSB0)
+BINARY_PORTNUM = int(os.getenv("BINARY_PORTNUM", "256"))  # App port for binary payloads (256 = PRIVATE_APP)
+DRY_RUN = os.getenv("DRY_RUN", "false").lower() in ("1", "true", "yes")  # Print packets instead of sending them
+MESHTASTIC_TARGETS = os.getenv("MESHTASTIC_TARGETS", "")  # Several nodes, e.g. 'tcp:node1,tcp:node2@4+6,serial:/dev/ttyUSB0@0'
+SEND_TIMEOUT = float(os.getenv("SEND_TIMEOUT", "300"))  # Seconds a run waits for its slowest node before giving up on it
+
+
+def open_interface(kind=MESHTASTIC_INTERFACE, address=None):
+    """Create a Meshtastic interface; by default the one configured with MESHTASTIC_*.
+
+    meshtastic is imported here rather than at the top of the module: it
+    pulls in protobuf, pyserial and pubsub, which would slow down every run
+    (and every dry run) before any weather data is fetched.
+    """
+    if kind.lower() == "serial":
+        port = address or MESHTASTIC_PORT
+        if not port:
+            raise ValueError("MESHTASTIC_PORT must be set when using serial interface")
+        with metrics.span("connect", interface="serial"):
+            import meshtastic.serial_interface
+            interface = meshtastic.serial_interface.SerialInterface(port)
+        print(f"Connected via Serial: {port}")
+    else:
+        host = address or MESHTASTIC_HOST
+        with metrics.span("connect", interface="tcp"):
+            import meshtastic.tcp_interface
+            interface = meshtastic.tcp_interface.TCPInterface(hostname=host)
+        print(f"Connected via TCP: {host}")
+    return interface
+
+
+class Target:
+    """A Meshtastic node to send to, optionally on channels of its own"""
+
+    def __init__(self, kind, address=None, channels=None):
+        self.kind = kind.lower()
+        self.address = address
+        self.channels = channels
+        self.label = f"{self.kind}:{address or (MESHTASTIC_PORT if self.kind == 'serial' else MESHTASTIC_HOST)}"
+
+    def open(self):
+        return open_interface(self.kind, self.address)
+
+    def channels_for(self, channel_index):
+        """The target's own channels, or else the report's channel"""
+        return self.channels or [int(channel_index)]
+
+
+def parse_targets(spec=MESHTASTIC_TARGETS):
+    """Targets from a comma-separated list of tcp:HOST or serial:PORT, each optionally @CH or @CH+CH.
+
+    Without a list, the single node configured with MESHTASTIC_INTERFACE,
+    MESHTASTIC_HOST and MESHTASTIC_PORT is the only target.
+    """
+    targets = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        node, _, channels = item.partition("@")
+        kind, _, address = node.partition(":")
+        if kind.lower() not in ("tcp", "serial") or not address:
+            raise ValueError(f"Invalid Meshtastic target '{item}': use tcp:HOST or serial:PORT, optionally @CHANNEL")
+        targets.append(Target(kind, address, [int(c) for c in channels.split("+")] if channels else None))
+    return targets or [Target(MESHTASTIC_INTERFACE)]
+
+
+class DryRunInterface:
+    """Prints packets instead of sending them; used for --dry-run"""
+
+    def __init__(self, label=None):
+        self.label = label
+        self.isConnected = threading.Event()
+        self.isConnected.set()
+        self.failure = None
+
+    def _show(self, size, channel_index, body, destination=None):
+        target = f"{self.label}, " if self.label else ""
+        direct = f" to {destination}" if destination is not None else ""
+        print(f"[dry run] {target}channel {channel_index}{direct}, {size} bytes, ~{txqueue.airtime(size):.2f}s airtime")
+        print(body)
+
+    def sendText(self, text, channelIndex=0, destinationId=None, **kwargs):
+        self._show(len(text.encode("utf-8")), channelIndex, text, destinationId)
+
+    def sendData(self, data, channelIndex=0, portNum=BINARY_PORTNUM, destinationId=None, **kwargs):
+        self._show(len(data), channelIndex, f"port {portNum}: {data.hex()}", destinationId)
+
+    def close(self):
+        pass
+
+
+def make_queue(interface, label=None, on_done=None):
+    """A transmit queue that sends over an already open interface.
+
+    A dry run paces on a simulated clock, so packets are printed at once
+    but in the order and with the timing the radio would use.
+    """
+    if isinstance(interface, DryRunInterface):
+        clock = txqueue.SimulatedClock()
+        return txqueue.TxQueue(lambda: interface, binary_portnum=BINARY_PORTNUM, clock=clock.clock,
+                               sleep=clock.sleep, label=label, on_done=on_done)
+    return txqueue.TxQueue(lambda: interface, binary_portnum=BINARY_PORTNUM, label=label, on_done=on_done)
+
+
+def submit_items(queue, items):
+    """Queue outbox items, each packet tagged with its (item id, seq)"""
+    for item in items:
+        for seq, payload in item.packets:
+            queue.submit([[payload]], item.channel, item.priority, tag=(item.id, seq), message=("item", item.id))
+
+
+def parse_args(description):
+    """Command line options shared by the report scripts"""
+    with metrics.span("config"):
+        parser = argparse.ArgumentParser(description=description)
+        parser.add_argument("--dry-run", action="store_true", default=DRY_RUN,
+                            help="print the packets that would be sent without connecting to the radio")
+        return parser.parse_args()
+
+
+class Delivery:
+    """Sends jobs to one target over its own connection and queue, and tracks how far it got.
+
+    With an outbox the jobs have already been stored there; once connected
+    the delivery sends everything the outbox holds for the target, which
+    includes reports left over from earlier runs.
+    """
+
+    def __init__(self, target, jobs, dry_run=False, outbox=None, lease=SEND_TIMEOUT):
+        self.target = target
+        self.jobs = jobs
+        self.dry_run = dry_run
+        self.outbox = outbox
+        self.lease = lease
+        self.items = []
+        self.queue = None
+        self.error = None
+        self.done = False
+
+    def _packet_done(self, packet, sent):
+        if sent and packet.tag is not None:
+            self.outbox.mark_sent(*packet.tag)
+
+    def run(self):
+        interface = None
+        try:
+            interface = DryRunInterface(self.target.label) if self.dry_run else self.target.open()
+            if self.outbox is None:
+                self.queue = make_queue(interface, self.target.label)
+                for groups, channel_index, _ in self.jobs:
+                    for channel in self.target.channels_for(channel_index):
+                        self.queue.submit(groups, channel)
+            else:
+                self.queue = make_queue(interface, self.target.label, on_done=self._packet_done)
+                self.items = self.outbox.claim(self.target.label, lease=self.lease)
+                submit_items(self.queue, self.items)
+            self.queue.drain()
+
+            # Wait until the final packet has had time to go out before closing
+            self.queue.flush()
+        except Exception as e:
+            self.error = e
+            print(f"Error sending message to {self.target.label}: {e}")
+        finally:
+            if self.outbox is not None:
+                # Whatever did not go out stays in the outbox for the next run
+                self.outbox.release(item.id for item in self.items)
+            if interface is not None:
+                try:
+                    with metrics.span("close"):
+                        interface.close()
+                except Exception as e:
+                    print(f"Error closing interface {self.target.label}: {e}")
+            self.done = True
+
+    def status(self):
+        """result (delivered, partial, failed or timeout), packets sent and dropped, and the error if any"""
+        queue = self.queue
+        if self.error is not None:
+            result = "failed"
+        elif not self.done:
+            result = "timeout"
+        else:
+            result = "partial" if queue.dropped else "delivered"
+        status = {"target": self.target.label, "result": result,
+                  "sent": queue.packets_sent if queue else 0, "dropped": queue.dropped if queue else 0}
+        if self.error is not None:
+            status["error"] = str(self.error)
+        return status
+
+
+def send_all(jobs, targets=None, dry_run=DRY_RUN, timeout=SEND_TIMEOUT):
+    """Send (groups, channel_index) or (groups, channel_index, key) jobs to every target at once.
+
+    Each target gets its own connection, transmit queue and thread, so a
+    slow or dead node never holds up the others; a node still busy after
+    timeout seconds is reported and left behind. Returns a status dict
+    per target: result (delivered, partial, failed or timeout), packets
+    sent and dropped, and the error if any.
+
+    With OUTBOX (except in a dry run) the jobs are first stored in the
+    outbox under their key, by default the script's name, replacing unsent
+    copies of the same report; what can't be sent now goes out on a later
+    run.
+    """
+    jobs = [tuple(job) if len(job) > 2 else (job[0], job[1], metrics.SCRIPT) for job in jobs]
+    targets = targets or parse_targets()
+    for groups, channel_index, _ in jobs:
+        # An alert counts as sent only once every node has it on every channel
+        txqueue.expect_handoffs(groups, sum(len(t.channels_for(channel_index)) for t in targets))
+    box = None
+    if outbox.OUTBOX and not dry_run:
+        box = outbox.Outbox()
+        for target in targets:
+            for groups, channel_index, key in jobs:
+                for channel in target.channels_for(channel_index):
+                    box.put(target.label, channel, groups, key)
+
+    deliveries = [Delivery(target, jobs, dry_run, box, timeout) for target in targets]
+    threads = [threading.Thread(target=d.run, name=f"send-{d.target.label}", daemon=True) for d in deliveries]
+    for thread in threads:
+        thread.start()
+
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+
+    statuses = [d.status() for d in deliveries]
+    for status in statuses:
+        metrics.inc("deliveries_total", target=status["target"], result=status["result"])
+        if status["result"] == "timeout":
+            print(f"{status['target']}: still sending after {timeout:.0f} seconds, giving up")
+    if len(statuses) > 1:
+        print("Delivery: " + ", ".join(f"{s['target']} {s['result']} ({s['sent']} sent)" for s in statuses))
+    if box is not None:
+        for status in statuses:
+            if status["result"] != "timeout":
+                kept = box.pending(status["target"])
+                if kept:
+                    print(f"{status['target']}: {kept} item(s) kept in the outbox for the next run")
+    print("Connection closed.")
+    return statuses
+
+
+def send_once(groups, channel_index, dry_run=DRY_RUN, key=None):
+    """Connect to every target, send the message groups and disconnect again"""
+    return send_all([(groups, channel_index, key or metrics.SCRIPT)], dry_run=dry_run)
+
+
+class RadioLink:
+    """A persistent, health-checked Meshtastic interface shared between jobs.
+
+    The interface is opened on first use and kept open. Before every send
+    and on each health check the connection state is verified; a dead
+    interface is closed and reopened, with exponential backoff between
+    failed connection attempts.
+
+    Sends go through a shared transmit queue drained by a background
+    worker, so alerts from any job overtake routine reports still waiting
+    for airtime.
+
+    With an outbox, broadcasts are stored there and moved to the queue one
+    item at a time while the node is reachable (alerts may join an item
+    already in flight), so reports rendered during an outage can still be
+    superseded by newer ones before they are sent.
+    """
+
+    def __init__(self, opener=open_interface, max_backoff=300, label=None, outbox=None):
+        self.opener = opener
+        self.max_backoff = max_backoff
+        self.label = label
+        self.outbox = outbox
+        self.interface = None
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._pump_lock = threading.Lock()
+        self._inflight = {}  # Outbox item id -> [packets not yet done, whether any was dropped]
+        self.queue = txqueue.TxQueue(self._interface_for_send, binary_portnum=BINARY_PORTNUM,
+                                     on_error=self._send_failed, label=label, on_done=self._packet_done)
+
+    def _is_healthy(self):
+        if self.interface is None:
+            return False
+        if getattr(self.interface, "failure", None) is not None:
+            return False
+        connected = getattr(self.interface, "isConnected", None)
+        if connected is not None and not connected.is_set():
+            return False
+        return True
+
+    def _drop(self):
+        if self.interface is not None:
+            try:
+                with metrics.span("close"):
+                    self.interface.close()
+            except Exception as e:
+                print(f"Error closing interface: {e}")
+        self.interface = None
+
+    def _connect(self):
+        if time.monotonic() < self._retry_at:
+            raise ConnectionError("Meshtastic reconnect backing off, try again later")
+        try:
+            self.interface = self.opener()
+        except Exception:
+            metrics.inc("retries_total", stage="connect")
+            self._failures += 1
+            delay = min(self.max_backoff, 2 ** self._failures)
+            self._retry_at = time.monotonic() + delay
+            print(f"Connection failed, next attempt in {delay} seconds")
+            raise
+        self._failures = 0
+        self._retry_at = 0.0
+        return self.interface
+
+    def _ensure(self):
+        if not self._is_healthy():
+            if self.interface is not None:
+                print("Meshtastic interface unhealthy, reconnecting...")
+            self._drop()
+            self._connect()
+        return self.interface
+
+    def _check(self):
+        with self._lock:
+            try:
+                self._ensure()
+                return True
+            except Exception as e:
+                print(f"Health check failed: {e}")
+                return False
+
+    def check(self):
+        """Verify the connection and reconnect if needed; returns True when healthy.
+
+        A healthy link resumes sending what is waiting in the outbox.
+        """
+        healthy = self._check()
+        if healthy:
+            self.pump()
+        return healthy
+
+    def _interface_for_send(self):
+        with self._lock:
+            return self._ensure()
+
+    def _send_failed(self, error):
+        # The queue retries the packet; make sure it gets a fresh connection
+        print(f"Error sending message: {error}, reconnecting...")
+        with self._lock:
+            self._drop()
+
+    def send(self, groups, channel_index, priority=txqueue.ROUTINE, destination=None, key=None):
+        """Queue message groups for sending; returns without waiting for airtime.
+
+        With an outbox, broadcasts are stored there under key first; direct
+        messages (replies) always go straight to the queue.
+        """
+        self.queue.start()
+        if self.outbox is None or destination is not None:
+            self.queue.submit(groups, channel_index, priority, destination)
+            return
+        self.outbox.put(self.label, channel_index, groups, key, priority)
+        self.pump()
+
+    def pump(self):
+        """Move the next outbox item to the transmit queue while the node is reachable.
+
+        One item is in flight at a time, except that alerts join at once.
+        """
+        if self.outbox is None:
+            return
+        with self._pump_lock:
+            if self._inflight:
+                max_priority = txqueue.ALERT
+            elif self._check():
+                max_priority = None
+            else:
+                return
+            items = self.outbox.claim(self.label, limit=1, max_priority=max_priority)
+            for item in items:
+                self._inflight[item.id] = [len(item.packets), False]
+            submit_items(self.queue, items)
+
+    def _packet_done(self, packet, sent):
+        if packet.tag is None:
+            return
+        item_id, seq = packet.tag
+        if sent:
+            self.outbox.mark_sent(item_id, seq)
+        with self._pump_lock:
+            state = self._inflight.get(item_id)
+            if state is None:
+                return
+            state[0] -= 1
+            state[1] = state[1] or not sent
+            if state[0] > 0:
+                return
+            del self._inflight[item_id]
+            if state[1]:
+                # Dropped packets are sent again once the node is reachable
+                self.outbox.release([item_id])
+                return
+        self.pump()
+
+    def close(self):
+        self.queue.stop()
+        target = f" {self.label}" if self.label else ""
+        print(f"Transmit queue{target}: {self.queue.metrics()}")
+        if self.outbox is not None:
+            with self._pump_lock:
+                self.outbox.release(list(self._inflight))
+                self._inflight.clear()
+            kept = self.outbox.pending(self.label)
+            if kept:
+                print(f"Outbox{target}: {kept} item(s) kept for the next run")
+        with self._lock:
+            self._drop()
+        print(f"Connection{target} closed.")
+
+
+class TransportPool:
+    """A RadioLink to every target, used like a single RadioLink.
+
+    Each node has its own connection, health checks, transmit queue and
+    worker, so a report is sent to all nodes at once and a slow or dead
+    node only delays its own queue. Targets with channels of their own get
+    every report on those channels.
+    """
+
+    def __init__(self, targets=None, dry_run=False):
+        self.links = []
+        # A dry run sends nothing, so it must not leave anything in the outbox either
+        box = outbox.Outbox() if outbox.OUTBOX and not dry_run else None
+        for target in targets or parse_targets():
+            opener = (lambda label=target.label: DryRunInterface(label)) if dry_run else target.open
+            self.links.append((target, RadioLink(opener=opener, label=target.label, outbox=box)))
+
+    def send(self, groups, channel_index, priority=txqueue.ROUTINE, key=None):
+        """Queue message groups on every target; returns without waiting for airtime.
+
+        key names the report, so that an unsent copy still in the outbox is
+        replaced by this one.
+        """
+        txqueue.expect_handoffs(groups, sum(len(t.channels_for(channel_index)) for t, _ in self.links))
+        for target, link in self.links:
+            for channel in target.channels_for(channel_index):
+                link.send(groups, channel, priority, key=key)
+
+    def reply(self, interface, groups, channel_index, destination):
+        """Queue a direct message on the node whose interface received the message being answered"""
+        for _, link in self.links:
+            if link.interface is interface:
+                break
+        else:
+            link = self.links[0][1]
+        link.send(groups, channel_index, txqueue.REPLY, destination)
+
+    def check(self):
+        """Health check every target; returns True when all are healthy"""
+        return all([link.check() for _, link in self.links])
+
+    def status(self):
+        """Transmit queue counters per target"""
+        return {target.label: link.queue.metrics() for target, link in self.links}
+
+    def close(self):
+        """Give every queue its chance to finish, in parallel, then disconnect"""
+        threads = [threading.Thread(target=link.close, name=f"close-{target.label}")
+                   for target, link in self.links]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
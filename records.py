@@ -0,0 +1,187 @@
+"""Normalized weather records that report templates render from.
+
+Each source (a Tempest observation from the REST API, the hub's UDP
+broadcasts or the Better Forecast, an NWS observation, a day or hour of
+the Tempest forecast, a period of the NWS hourly forecast) is converted
+once into a Record. A Record has the same fields, in the same units,
+whatever it came from: °C, m/s, hPa, mm, percent, degrees, W/m², W, and
+epoch seconds for times. Fields a source doesn't have are None.
+"""
+import re
+import time
+from datetime import datetime
+
+import http_client
+
+FIELDS = (
+    "time",              # When the observation was made or the forecast period starts
+    "tz",                # Time zone to show times in; None for the machine's
+    "label",             # Place name of the site
+    "station",           # Station id
+    "station_name",
+    "conditions",        # Text description, e.g. "Partly Cloudy"
+    "temperature",
+    "feels_like",
+    "humidity",
+    "pressure",          # Sea level pressure
+    "pressure_trend",    # 'rising', 'falling' or 'steady'
+    "wind_avg",
+    "wind_max",          # Top of a forecast wind speed range
+    "wind_gust",
+    "wind_direction",
+    "wind_cardinal",     # e.g. "NW"
+    "rain",              # Rain so far today
+    "strikes",           # Lightning strikes in the last hour
+    "solar_radiation",
+    "uv",
+    "panel_power",       # Estimated output of the node's solar panel
+    "temp_high",
+    "temp_low",
+    "precip_probability",
+    "precip_type",
+    "sunrise",
+    "sunset",
+    "day_high",          # Today's high, low and peak gust so far, from the tsstore rollup
+    "day_low",
+    "peak_gust",
+    "stale_since",       # When the data was cached, if it is an old copy served after a failed fetch
+)
+
+
+class Record:
+    """One observation or forecast period in report units; see FIELDS"""
+
+    __slots__ = FIELDS
+
+    def __init__(self, **values):
+        for name in FIELDS:
+            setattr(self, name, values.pop(name, None))
+        if values:
+            raise TypeError(f"Unknown record fields: {', '.join(values)}")
+
+    def replace(self, **values):
+        """A copy with some fields changed"""
+        fields = {name: getattr(self, name) for name in FIELDS}
+        fields.update(values)
+        return Record(**fields)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in FIELDS if getattr(self, name) is not None}
+
+    def __repr__(self):
+        return f"Record({', '.join(f'{k}={v!r}' for k, v in self.as_dict().items())})"
+
+
+def _first(obs, *names):
+    for name in names:
+        if obs.get(name) is not None:
+            return obs[name]
+    return None
+
+
+def from_observation(obs, **extra):
+    """A Record from an observation with Tempest field names and units.
+
+    That is a Tempest REST or UDP observation, the Better Forecast's
+    current conditions (better_forecast.observation) or an NWS observation
+    after nws_current_weather.normalize_observation. extra sets further
+    fields, e.g. label or panel_power.
+    """
+    extra.setdefault("stale_since", http_client.stale_since(obs))
+    return Record(
+        time=obs.get("timestamp"),
+        temperature=obs.get("air_temperature"),
+        feels_like=obs.get("feels_like"),
+        humidity=obs.get("relative_humidity"),
+        pressure=obs.get("barometric_pressure"),
+        pressure_trend=obs.get("pressure_trend"),
+        wind_avg=obs.get("wind_avg"),
+        wind_gust=obs.get("wind_gust"),
+        wind_direction=obs.get("wind_direction"),
+        rain=obs.get("precip_accum_local_day"),
+        # The REST API and the Better Forecast count the last hour; the UDP listener keeps a running hour
+        strikes=_first(obs, "lightning_strike_count_last_1hr", "strike_count_1h",
+                       "lightning_strike_count", "strike_count"),
+        solar_radiation=obs.get("solar_radiation"),
+        uv=obs.get("uv"),
+        **extra)
+
+
+def with_rollup(record, rollup):
+    """The record with today's high, low and peak gust from a tsstore rollup, if the rollup is for today"""
+    now = record.time or time.time()
+    if not rollup or rollup.get("day") != datetime.fromtimestamp(now).date().isoformat():
+        return record
+    return record.replace(day_high=rollup.get("temp_max"), day_low=rollup.get("temp_min"),
+                          peak_gust=rollup.get("gust_max"))
+
+
+def from_tempest_day(day, tz=None, **extra):
+    """A Record from one day of the Better Forecast"""
+    return Record(
+        time=day.get("day_start_local"),
+        tz=tz,
+        conditions=day.get("conditions"),
+        temp_high=day.get("air_temp_high"),
+        temp_low=day.get("air_temp_low"),
+        precip_probability=day.get("precip_probability"),
+        precip_type=day.get("precip_type", "none"),
+        wind_avg=day.get("wind_avg"),
+        wind_direction=day.get("wind_direction"),
+        wind_cardinal=day.get("wind_direction_cardinal") or None,
+        sunrise=day.get("sunrise"),
+        sunset=day.get("sunset"),
+        **extra)
+
+
+def from_tempest_hour(hour, tz=None, **extra):
+    """A Record from one hour of the Better Forecast"""
+    return Record(
+        time=hour.get("time"),
+        tz=tz,
+        conditions=hour.get("conditions"),
+        temperature=hour.get("air_temperature"),
+        feels_like=hour.get("feels_like"),
+        humidity=hour.get("relative_humidity"),
+        precip_probability=hour.get("precip_probability", 0),
+        precip_type=hour.get("precip_type"),
+        wind_avg=hour.get("wind_avg"),
+        wind_gust=hour.get("wind_gust"),
+        wind_direction=hour.get("wind_direction"),
+        wind_cardinal=hour.get("wind_direction_cardinal") or None,
+        uv=hour.get("uv"),
+        **extra)
+
+
+# NWS wind speeds are text like "10 mph" or "5 to 10 km/h"
+_SPEED_FACTORS = {"mph": 0.44704, "km/h": 1 / 3.6, "kt": 0.514444, "m/s": 1.0}
+_SPEED = re.compile(r"(\d+(?:\.\d+)?)(?:\s*to\s*(\d+(?:\.\d+)?))?\s*(mph|km/h|kt|m/s)?")
+
+
+def parse_wind_speed(text):
+    """(low, high) in m/s from an NWS wind speed text, or (None, None)"""
+    match = _SPEED.search(text or "")
+    if not match:
+        return None, None
+    factor = _SPEED_FACTORS.get(match.group(3) or "mph")
+    low = float(match.group(1)) * factor
+    high = float(match.group(2)) * factor if match.group(2) else None
+    return low, high
+
+
+def from_nws_period(period, **extra):
+    """A Record from a forecast_index.Period of the NWS hourly forecast"""
+    temperature = period.temperature
+    if temperature is not None and period.temperature_unit == "F":
+        temperature = (temperature - 32) * 5 / 9
+    wind_avg, wind_max = parse_wind_speed(period.wind_speed)
+    return Record(
+        time=period.start.timestamp(),
+        tz=period.start.tzinfo,
+        conditions=period.short_forecast,
+        temperature=temperature,
+        precip_probability=period.pop,
+        wind_avg=wind_avg,
+        wind_max=wind_max,
+        wind_cardinal=period.wind_direction or None,
+        **extra)
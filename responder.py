@@ -0,0 +1,285 @@
+"""Answers weather queries sent over the mesh.
+
+Listens for text messages on the Meshtastic interface and answers
+commands such as "wx", "fc", "alerts" and "wx <site>" with a direct
+message to the node that asked. Answers come from an in-memory cache that
+a background job keeps warm by rendering the reports with their own
+build_messages(), so a query is answered from memory and never waits for
+an upstream fetch.
+
+Each node may ask RESPONDER_LIMIT times and all nodes together
+RESPONDER_TOTAL_LIMIT times per RESPONDER_WINDOW seconds; replies also go
+through the transmit queue's duty-cycle pacing, ahead of scheduled reports
+but behind alerts.
+"""
+import signal
+import sys
+import threading
+import time
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+import getwx
+import http_client
+import metrics
+import multi_site
+import packer
+import radio
+import wxbinary
+from scheduler import Scheduler
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+RESPONDER_REFRESH = os.getenv("RESPONDER_REFRESH", "300")  # Schedule for re-rendering the cached answers
+RESPONDER_LIMIT = int(os.getenv("RESPONDER_LIMIT", "3"))  # Queries answered per node within the window
+RESPONDER_TOTAL_LIMIT = int(os.getenv("RESPONDER_TOTAL_LIMIT", "20"))  # Queries answered from all nodes within the window
+RESPONDER_WINDOW = int(os.getenv("RESPONDER_WINDOW", "600"))  # Seconds
+
+BROADCAST = 0xFFFFFFFF  # Node number of packets sent to the whole channel
+DRY_RUN_NODE = 0x00000001  # Node that queries typed on stdin appear to come from in a dry run
+
+# Commands, the reports that can answer them in order of preference, and the report's
+# message group that is the answer (None for all of them)
+COMMANDS = {
+    "wx": (("getwx", "nws_current_weather"), None),
+    "fc": (("getwx_forecast",), 0),
+    "alerts": (("getwx_forecast",), 1),
+    "tf": (("tempest_forecast",), None),
+}
+ANSWERING_REPORTS = {report for reports, _ in COMMANDS.values() for report in reports}
+
+
+class RateLimiter:
+    """At most limit events per key within a sliding window of seconds"""
+
+    def __init__(self, limit, window, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self.events = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Record an event for key and return True, or return False when key is over its limit"""
+        now = self.clock()
+        with self._lock:
+            events = self.events.setdefault(key, deque())
+            while events and now - events[0] >= self.window:
+                events.popleft()
+            if len(events) >= self.limit:
+                return False
+            events.append(now)
+            return True
+
+
+def local_site():
+    """The site configured in .env (LAT, LON and the Tempest station), answered when no site is named"""
+    reports = list(multi_site.NWS_REPORTS)
+    if getwx.API_TOKEN and getwx.STATION_ID:
+        reports.extend(multi_site.TEMPEST_REPORTS)
+    elif getwx.TEMPEST_SOURCE.lower() == "udp":
+        reports.append("getwx")
+    return {"name": None, "label": getwx.LOCATION_NAME, "reports": reports}
+
+
+def load_sites():
+    """Sites from SITES_FILE when there is one, so that "wx <site>" works.
+
+    A site can be asked about every report its coordinates and station
+    allow, not just the ones it broadcasts on schedule.
+    """
+    if not os.path.exists(multi_site.SITES_FILE):
+        return []
+    sites = []
+    for site in multi_site.load_sites():
+        reports = []
+        if site.get("lat") is not None and site.get("lon") is not None:
+            reports.extend(multi_site.NWS_REPORTS)
+        if site.get("tempest_station_id"):
+            reports.extend(multi_site.TEMPEST_REPORTS)
+        sites.append(dict(site, reports=reports))
+    return sites
+
+
+def readable(parts):
+    """Message parts to reply with; binary payloads are decoded, as a reply is read on a phone"""
+    text = [part for part in parts if not isinstance(part, bytes)]
+    if text or not parts:
+        return text
+    lines = []
+    for part in parts:
+        report = wxbinary.decode(part)
+        lines.append(", ".join(f"{key} {value}" for key, value in report.items()
+                               if key not in ("version", "report_type", "timestamp")))
+    return packer.pack(lines)
+
+
+class Responder:
+    """Answers queries from a cache of rendered reports and replies over a radio.TransportPool"""
+
+    def __init__(self, link, sites=None):
+        self.link = link
+        self.sites = [local_site()] + list(sites or [])
+        self.cache = {}  # (site name, report) -> message groups of its last successful render
+        self.per_node = RateLimiter(RESPONDER_LIMIT, RESPONDER_WINDOW)
+        self.total = RateLimiter(RESPONDER_TOTAL_LIMIT, RESPONDER_WINDOW)
+
+    def _render(self, site, report):
+        # Every active alert is an answer, and rendering one must not mark it as broadcast
+        options = {"dedup": False} if report == "getwx_forecast" else {}
+        return multi_site.build_report(site, report, **options)
+
+    def refresh(self):
+        """Re-render every site's reports into the cache; a report that fails keeps its previous answer"""
+        http_client.start_run()
+        jobs = [(site, report) for site in self.sites for report in site["reports"] if report in ANSWERING_REPORTS]
+        with ThreadPoolExecutor(max_workers=multi_site.SITE_WORKERS, thread_name_prefix="responder") as pool:
+            futures = [pool.submit(self._render, site, report) for site, report in jobs]
+
+        for (site, report), future in zip(jobs, futures):
+            try:
+                groups = future.result()
+            except Exception as e:
+                print(f"Error rendering {report} for {site['label']}: {e}")
+                continue
+            self.cache[(site["name"], report)] = [list(parts) for parts in groups]
+
+    def _site(self, name):
+        if not name:
+            return self.sites[0]
+        name = name.strip().lower()
+        for site in self.sites[1:]:
+            if name in (site["name"].lower(), site["label"].lower()):
+                return site
+        return None
+
+    def _help(self):
+        lines = ["Commands: " + ", ".join(COMMANDS) + " [site]"]
+        if len(self.sites) > 1:
+            lines.append("Sites: " + ", ".join(site["name"] for site in self.sites[1:]))
+        return packer.pack(lines, sep=" ")
+
+    def answer(self, text):
+        """Answer a query from the cache; never fetches anything.
+
+        Returns (command, result, parts) where result is one of answered,
+        no_data, unavailable, unknown_site, help or unknown (not a command,
+        parts is None).
+        """
+        words = text.strip().split(None, 1)
+        command = words[0].lower() if words else ""
+        if command in ("help", "?"):
+            return "help", "help", self._help()
+        if command not in COMMANDS:
+            return "other", "unknown", None
+
+        site = self._site(words[1] if len(words) > 1 else None)
+        if site is None:
+            return command, "unknown_site", packer.pack([f"Unknown site '{words[1].strip()}'."] + self._help(), sep=" ")
+
+        reports, group = COMMANDS[command]
+        available = [report for report in reports if report in site["reports"]]
+        if not available:
+            return command, "unavailable", [f"{command} is not available for {site['label']}."]
+        for report in available:
+            groups = self.cache.get((site["name"], report))
+            if groups is None:
+                continue
+            if group is None:
+                parts = [part for parts in groups for part in parts]
+            else:
+                parts = groups[group] if group < len(groups) else []
+            parts = readable(parts)
+            if not parts and command == "alerts":
+                parts = [f"{site['label']}: No active alerts."]
+            if parts:
+                return command, "answered", parts
+        return command, "no_data", [f"No {command} for {site['label']} yet, try again in a few minutes."]
+
+    def on_receive(self, packet, interface):
+        """Answer a text message; subscribed to meshtastic.receive.text"""
+        try:
+            with metrics.span("respond") as fields:
+                self._respond(packet, interface, fields)
+        except Exception as e:
+            print(f"Error answering query: {e}")
+
+    def _respond(self, packet, interface, fields):
+        sender = packet.get("from")
+        my_node = getattr(getattr(interface, "myInfo", None), "my_node_num", None)
+        if sender is None or sender == my_node:
+            return
+        text = (packet.get("decoded") or {}).get("text") or ""
+        direct = packet.get("to", BROADCAST) != BROADCAST
+
+        command, result, parts = self.answer(text)
+        if result == "unknown":
+            # Channel chatter is ignored; a direct message that isn't a command gets the help text
+            if not direct:
+                return
+            command, result, parts = "help", "help", self._help()
+
+        sender_id = packet.get("fromId") or sender
+        if not self.per_node.allow(sender) or not self.total.allow(None):
+            result = "limited"
+        fields.update(command=command, result=result)
+        metrics.inc("responder_queries_total", command=command, result=result)
+        print(f"Query from {sender_id}: {text.strip()!r} -> {result}")
+        if result != "limited":
+            self.link.reply(interface, [parts], packet.get("channel", 0), sender)
+
+    def listen(self):
+        """Subscribe to text messages received on any of the link's interfaces.
+
+        pubsub only holds a weak reference to the listener, so the Responder
+        must stay referenced for as long as it should answer.
+        """
+        # pubsub is installed with meshtastic, which is only imported once an interface is opened
+        from pubsub import pub
+        pub.subscribe(self.on_receive, "meshtastic.receive.text")
+
+
+def read_queries(responder, stream=sys.stdin):
+    """Answer queries typed on stdin as direct messages from a test node; used for --dry-run"""
+    for line in stream:
+        if line.strip():
+            responder.on_receive({"from": DRY_RUN_NODE, "fromId": f"!{DRY_RUN_NODE:08x}", "to": 0,
+                                  "decoded": {"text": line}}, None)
+
+
+def main():
+    args = radio.parse_args("Answer weather queries sent over the mesh")
+    scheduler = Scheduler()
+    link = radio.TransportPool(dry_run=args.dry_run)
+    responder = Responder(link, load_sites())
+    scheduler.add_job("responder", RESPONDER_REFRESH, responder.refresh)
+    scheduler.idle_hooks.append(link.check)
+
+    # Stop cleanly on Ctrl+C or SIGTERM (e.g. from systemd)
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    link.check()
+    if args.dry_run:
+        # No packets arrive in a dry run, so answer queries typed on stdin until it ends
+        scheduler.run_pending()
+
+        def console():
+            read_queries(responder)
+            stop_event.set()
+        threading.Thread(target=console, name="queries", daemon=True).start()
+    else:
+        responder.listen()
+    try:
+        scheduler.run_forever(stop_event)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        link.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import email.utils
+import hashlib
+import json
+import threading
+import time
+import os
+from collections import OrderedDict
+
+
+def parse_cache_control(value):
+    """Parse a Cache-Control header into a dict of directive -> value (or True)"""
+    directives = {}
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') if arg else True
+    return directives
+
+
+def freshness_lifetime(headers, now=None):
+    """Return the absolute expiry time for a response, or None if it must be revalidated"""
+    now = time.time() if now is None else now
+    directives = parse_cache_control(headers.get("Cache-Control"))
+    if "no-cache" in directives or "no-store" in directives:
+        return None
+
+    age = 0
+    try:
+        age = int(headers.get("Age", 0))
+    except ValueError:
+        pass
+
+    if "max-age" in directives:
+        try:
+            return now + int(directives["max-age"]) - age
+        except ValueError:
+            return None
+
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            return email.utils.parsedate_to_datetime(expires).timestamp()
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+class ResponseCache:
+    """Size-bounded HTTP response cache kept in memory and on disk.
+
+    Entries are dicts holding the body, the validators (ETag and
+    Last-Modified) and the time the entry stops being fresh. The disk copy
+    lets separate cron runs share the cache; the in-memory copy serves the
+    daemon without touching the disk. When either copy grows past max_bytes
+    the least recently used entries are evicted.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(url, headers=None):
+        # Responses differ by Accept type, so it is part of the key. Hashing keeps
+        # API tokens in query strings out of file names.
+        accept = (headers or {}).get("Accept", "")
+        return hashlib.sha256(f"{accept} {url}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _remember(self, key, entry):
+        size = len(entry["body"])
+        if key in self.memory:
+            self.memory_bytes -= len(self.memory.pop(key)["body"])
+        self.memory[key] = entry
+        self.memory_bytes += size
+        while self.memory_bytes > self.max_bytes and len(self.memory) > 1:
+            _, old = self.memory.popitem(last=False)
+            self.memory_bytes -= len(old["body"])
+            self.evictions += 1
+
+    def get(self, key):
+        """Return the cached entry for key, or None"""
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                return entry
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._remember(key, entry)
+            return entry
+
+    def put(self, key, entry):
+        """Store an entry in memory and on disk, evicting old entries as needed"""
+        with self._lock:
+            self._remember(key, entry)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp_file = f"{self._path(key)}.{os.getpid()}.tmp"
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump(entry, f)
+                os.replace(tmp_file, self._path(key))
+                self._evict_disk()
+            except OSError as e:
+                print(f"Warning: could not write HTTP cache entry: {e}")
+
+    def _evict_disk(self):
+        files = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        # Oldest written first
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.evictions += 1
+            except OSError:
+                pass
+
+    def count(self, counter):
+        """Increment one of the hits/misses/revalidated counters"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "evictions": self.evictions,
+            "entries": len(self.memory),
+            "bytes": self.memory_bytes,
+        }
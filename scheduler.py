@@ -0,0 +1,181 @@
+import time
+from datetime import datetime, timedelta
+
+# Allowed ranges for the five cron fields: minute, hour, day of month, month, day of week
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def parse_cron_field(field, low, high):
+    """Expand one cron field (e.g. '*/15', '1-5', '0,30') into a set of values"""
+    values = set()
+    for item in field.split(","):
+        step = 1
+        has_step = "/" in item
+        if has_step:
+            item, step_str = item.split("/", 1)
+            step = int(step_str)
+            if step < 1:
+                raise ValueError(f"Invalid cron step: {field}")
+
+        if item == "*":
+            start, end = low, high
+        elif "-" in item:
+            start_str, end_str = item.split("-", 1)
+            start, end = int(start_str), int(end_str)
+        else:
+            start = int(item)
+            # 'n/step' means from n to the end of the range
+            end = high if has_step else start
+
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron field out of range ({low}-{high}): {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Standard 5-field cron expression: minute hour day-of-month month day-of-week"""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expression}")
+        self.expression = expression
+        parsed = [parse_cron_field(f, low, high) for f, (low, high) in zip(fields, CRON_FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # Both 0 and 7 mean Sunday
+        self.weekdays = {d % 7 for d in weekdays}
+        # Cron matches either day field when both are restricted
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, dt):
+        dom = dt.day in self.days
+        dow = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return dow
+        if self.any_weekday:
+            return dom
+        return dom or dow
+
+    def next_after(self, dt):
+        """Return the first matching minute strictly after dt"""
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                # Jump to the first day of the next month
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        raise ValueError(f"Cron expression never matches: {self.expression}")
+
+    def __repr__(self):
+        return f"cron({self.expression})"
+
+
+class IntervalSchedule:
+    """Run every N seconds, starting immediately"""
+
+    def __init__(self, seconds):
+        if seconds <= 0:
+            raise ValueError(f"Interval must be positive: {seconds}")
+        self.seconds = seconds
+
+    def first_run(self, now):
+        return now
+
+    def next_after(self, dt):
+        return dt + timedelta(seconds=self.seconds)
+
+    def __repr__(self):
+        return f"every {self.seconds}s"
+
+
+def parse_schedule(spec):
+    """Parse a schedule spec: a number of seconds or a 5-field cron expression"""
+    spec = spec.strip()
+    if spec.isdigit():
+        return IntervalSchedule(int(spec))
+    return CronSchedule(spec)
+
+
+class Job:
+    def __init__(self, name, schedule, func, now):
+        self.name = name
+        self.schedule = schedule
+        self.func = func
+        first_run = getattr(schedule, "first_run", None)
+        self.next_run = first_run(now) if first_run else schedule.next_after(now)
+        self.runs = 0
+        self.failures = 0
+
+
+class Scheduler:
+    """Runs jobs one at a time in the order they fall due.
+
+    Jobs never overlap, so they can safely share a single radio interface.
+    A job that overruns its slot is not run again to catch up; it is simply
+    rescheduled from the time it finished.
+    """
+
+    def __init__(self, clock=datetime.now, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.jobs = []
+        self.idle_hooks = []
+
+    def add_job(self, name, spec, func):
+        schedule = parse_schedule(spec) if isinstance(spec, str) else spec
+        job = Job(name, schedule, func, self.clock())
+        self.jobs.append(job)
+        print(f"Scheduled {name}: {schedule}, first run at {job.next_run:%Y-%m-%d %H:%M:%S}")
+        return job
+
+    def run_pending(self):
+        """Run every job that is due; returns the number of jobs run"""
+        ran = 0
+        for job in sorted(self.jobs, key=lambda j: j.next_run):
+            if job.next_run > self.clock():
+                continue
+            print(f"\n[{self.clock():%Y-%m-%d %H:%M:%S}] Running {job.name}")
+            try:
+                job.func()
+            except Exception as e:
+                job.failures += 1
+                print(f"Job {job.name} failed: {e}")
+            job.runs += 1
+            job.next_run = job.schedule.next_after(max(job.next_run, self.clock()))
+            ran += 1
+        return ran
+
+    def seconds_until_next(self):
+        if not self.jobs:
+            return None
+        next_run = min(job.next_run for job in self.jobs)
+        return max(0.0, (next_run - self.clock()).total_seconds())
+
+    def run_forever(self, stop_event=None, max_sleep=30):
+        """Run jobs until stop_event is set, calling idle hooks between waits"""
+        while stop_event is None or not stop_event.is_set():
+            self.run_pending()
+            for hook in self.idle_hooks:
+                try:
+                    hook()
+                except Exception as e:
+                    print(f"Idle hook failed: {e}")
+            wait = self.seconds_until_next()
+            wait = max_sleep if wait is None else min(wait, max_sleep)
+            if stop_event is not None:
+                stop_event.wait(wait)
+            else:
+                self.sleep(wait)
@@ -0,0 +1,276 @@
+"""Solar energy model for the power budget of solar-powered nodes.
+
+Harvest so far today comes from the observed irradiance (solar_radiation)
+stored by tsstore, integrated over time. Expected harvest for the rest of
+today and tomorrow comes from the hourly Tempest better_forecast: the
+forecast has no irradiance, so each hour gets clear-sky irradiance for the
+station's position (Haurwitz model, averaged over the hour) scaled by a
+cloud factor for the hour's forecast icon.
+
+Nodes are described by panel and battery profiles (NODES_FILE). A panel's
+output, temperature derating included, is linear in three irradiance
+terms - G, G * (T - 25) and G² - so those are integrated once over the
+time axis, and every panel's energy is a matrix product of its
+coefficients with the integrals; per-node totals are a bincount. A fleet
+of thousands of nodes costs little more than one. Without NODES_FILE there
+is one node using PANEL_SIZE and PANEL_EFFICIENCY, like getwx.py.
+"""
+import json
+import time
+import os
+from datetime import date, datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+import numpy as np
+
+import tsstore
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+NODES_FILE = os.getenv("NODES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "nodes.json"))
+PANEL_SIZE = float(os.getenv("PANEL_SIZE", "0.04"))  # m², for the default node
+PANEL_EFFICIENCY = float(os.getenv("PANEL_EFFICIENCY", "0.20"))  # For the default node
+BATTERY_WH = float(os.getenv("BATTERY_WH", "0"))  # Battery capacity of the default node (0 = not reported)
+NODE_LOAD_W = float(os.getenv("NODE_LOAD_W", "0.5"))  # Average power drawn by the default node
+SOLAR_MAX_GAP = int(os.getenv("SOLAR_MAX_GAP", "3600"))  # Seconds; longer gaps between observations count as unknown
+
+# Panel and battery profile defaults
+PANEL_DEFAULTS = {"losses": 0.85, "temp_coeff": -0.004, "noct": 45.0}  # Wiring/controller losses, power per °C, NOCT °C
+BATTERY_DEFAULTS = {"capacity_wh": 0.0, "usable": 0.8}  # Fraction of capacity that may be used
+
+# Fraction of clear-sky irradiance reaching the panel under each Tempest forecast icon (without -day/-night)
+CLOUD_FACTORS = {
+    "clear": 1.0,
+    "windy": 0.95,
+    "partly-cloudy": 0.7,
+    "cloudy": 0.4,
+    "foggy": 0.35,
+    "rainy": 0.3,
+    "sleet": 0.3,
+    "snow": 0.3,
+    "thunderstorm": 0.25,
+}
+POSSIBLE_FACTOR = 0.6  # "possibly-rainy" and the like: some showers in an otherwise sunny period
+UNKNOWN_FACTOR = 0.7
+SUBSTEPS = 4  # Clear-sky irradiance samples per forecast hour
+
+
+def cloud_factor(icon):
+    base = (icon or "").replace("-day", "").replace("-night", "")
+    if base.startswith("possibly-"):
+        return POSSIBLE_FACTOR
+    return CLOUD_FACTORS.get(base, UNKNOWN_FACTOR)
+
+
+def cos_zenith(ts, lat, lon):
+    """Cosine of the solar zenith angle at epoch seconds ts (NOAA's fractional-year approximation)"""
+    ts = np.asarray(ts, dtype=float)
+    moments = ts.astype("datetime64[s]")
+    day_of_year = (moments - moments.astype("datetime64[Y]")).astype(float) / 86400
+    gamma = 2 * np.pi / 365 * day_of_year
+    eqtime = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                       - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma) - 0.006758 * np.cos(2 * gamma)
+            + 0.000907 * np.sin(2 * gamma) - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+    solar_minutes = (ts % 86400) / 60 + eqtime + 4 * lon
+    hour_angle = np.radians(solar_minutes / 4 - 180)
+    phi = np.radians(lat)
+    return np.sin(phi) * np.sin(decl) + np.cos(phi) * np.cos(decl) * np.cos(hour_angle)
+
+
+def clear_sky(ts, lat, lon):
+    """Clear-sky global horizontal irradiance in W/m² (Haurwitz)"""
+    cz = cos_zenith(ts, lat, lon)
+    safe = np.where(cz > 0.01, cz, 1.0)
+    return np.where(cz > 0.01, 1098 * safe * np.exp(-0.057 / safe), 0.0)
+
+
+def basis(ghi, temp_c):
+    """The irradiance terms panel output is linear in: G, G * (T - 25) and G², stacked on a last axis"""
+    ghi = np.nan_to_num(np.asarray(ghi, dtype=float))
+    temp_c = np.nan_to_num(np.asarray(temp_c, dtype=float), nan=25.0)
+    return np.stack(np.broadcast_arrays(ghi, ghi * (temp_c - 25), ghi * ghi), axis=-1)
+
+
+def _profile(entry, profiles, defaults, kind):
+    if isinstance(entry, str):
+        if entry not in profiles:
+            raise ValueError(f"Unknown {kind} profile '{entry}'")
+        entry = profiles[entry]
+    return dict(defaults, **entry)
+
+
+class Fleet:
+    """Every node's panels and batteries as flat arrays.
+
+    Panel p belongs to node owner[p] and produces rating[p] watts per W/m²
+    of irradiance before losses and temperature derating.
+    """
+
+    def __init__(self, nodes, panels=None, batteries=None):
+        panels = panels or {}
+        batteries = batteries or {}
+        self.names = []
+        rows = []
+        capacity = []
+        load = []
+        for idx, node in enumerate(nodes):
+            if "name" not in node:
+                raise ValueError(f"Node is missing a name: {node}")
+            self.names.append(node["name"])
+            for entry in node.get("panels", []):
+                panel = _profile(entry, panels, PANEL_DEFAULTS, "panel")
+                if "watts" in panel:
+                    rating = panel["watts"] / 1000  # Rated at 1000 W/m²
+                else:
+                    rating = panel["area"] * panel["efficiency"]
+                rows.append((idx, rating, panel["losses"], panel["temp_coeff"], panel["noct"]))
+            usable = 0.0
+            for entry in node.get("batteries", []):
+                battery = _profile(entry, batteries, BATTERY_DEFAULTS, "battery")
+                usable += battery["capacity_wh"] * battery["usable"]
+            capacity.append(usable)
+            load.append(float(node.get("load_w", NODE_LOAD_W)))
+
+        table = np.array(rows, dtype=float).reshape(-1, 5)
+        self.owner = table[:, 0].astype(int)
+        self.rating = table[:, 1]
+        self.losses = table[:, 2]
+        self.temp_coeff = table[:, 3]
+        self.noct = table[:, 4]
+        self.capacity_wh = np.array(capacity)
+        self.load_w = np.array(load)
+
+    def __len__(self):
+        return len(self.names)
+
+    def coefficients(self):
+        """Per-panel weights of the basis() terms, shape (panels, 3).
+
+        Output is rating * losses * G * (1 + temp_coeff * (cell - 25)) with
+        the cell temperature at air + (noct - 20) / 800 * G, which expands
+        to a weighted sum of G, G * (air - 25) and G².
+        """
+        scale = self.rating * self.losses
+        return np.stack([scale, scale * self.temp_coeff, scale * self.temp_coeff * (self.noct - 20) / 800], axis=1)
+
+    def power(self, ghi, temp_c):
+        """Watts per panel for irradiance and air temperature arrays: shape (panels,) + ghi.shape"""
+        return np.moveaxis(basis(ghi, temp_c) @ self.coefficients().T, -1, 0)
+
+    def per_node(self, panel_wh):
+        """Sum per-panel values into per-node values"""
+        return np.bincount(self.owner, weights=panel_wh, minlength=len(self))
+
+
+def load_fleet(path=NODES_FILE):
+    """Nodes from NODES_FILE, or the single node configured with PANEL_SIZE and PANEL_EFFICIENCY.
+
+    The file holds "nodes", each with a name, load_w and lists of panels
+    and batteries given inline or by the name of an entry in the file's
+    "panels" and "batteries" profiles.
+    """
+    if not os.path.exists(path):
+        node = {"name": "node", "load_w": NODE_LOAD_W,
+                "panels": [{"area": PANEL_SIZE, "efficiency": PANEL_EFFICIENCY}],
+                "batteries": [{"capacity_wh": BATTERY_WH}] if BATTERY_WH else []}
+        return Fleet([node])
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    return Fleet(config.get("nodes", []), config.get("panels"), config.get("batteries"))
+
+
+def observed(series, day=None):
+    """Timestamps, irradiance (W/m²) and air temperature (°C) stored for a local day, as arrays"""
+    store = tsstore.SeriesStore(series)
+    try:
+        with open(store.day_path(day or date.today().isoformat()), "rb") as f:
+            data = f.read()
+    except OSError:
+        data = b""
+    dtype = tsstore.record_dtype()
+    usable = len(data) - len(data) % dtype.itemsize
+    records = np.frombuffer(data[:usable], dtype=dtype)
+    scales = {name: (scale, fmt) for name, scale, fmt in tsstore.FIELDS}
+
+    def column(name):
+        scale, fmt = scales[name]
+        values = records[name].astype(float)
+        values[records[name] == tsstore.MISSING[fmt]] = np.nan
+        return values / scale
+
+    return records["timestamp"].astype(float), column("solar_radiation"), column("air_temperature")
+
+
+def harvested(fleet, ts, ghi, temp_c, max_gap=SOLAR_MAX_GAP):
+    """Wh per node from observed samples, integrated with the trapezoid rule; gaps over max_gap add nothing"""
+    if len(ts) < 2:
+        return np.zeros(len(fleet))
+    terms = basis(ghi, temp_c)
+    dt = np.diff(ts)
+    dt = np.where(dt <= max_gap, dt, 0.0)
+    integrals = ((terms[1:] + terms[:-1]) / 2 * dt[:, None]).sum(axis=0) / 3600
+    return fleet.per_node(fleet.coefficients() @ integrals)
+
+
+def forecast_hours(forecast):
+    """Start times, cloud factors and air temperatures of the hourly better_forecast as arrays"""
+    hourly = (forecast.get("forecast") or {}).get("hourly") or []
+    starts = np.array([h.get("time", 0) for h in hourly], dtype=float)
+    temps = np.array([np.nan if h.get("air_temperature") is None else h["air_temperature"] for h in hourly],
+                     dtype=float)
+    # Few distinct icons: look each up once and index
+    icons, inverse = np.unique([h.get("icon") or "" for h in hourly], return_inverse=True)
+    factors = np.array([cloud_factor(icon) for icon in icons])[inverse] if len(hourly) else np.zeros(0)
+    return starts, factors, temps
+
+
+def expected(fleet, starts, factors, temps, lat, lon, windows):
+    """Expected Wh per node within each (start, end) window, from the hourly forecast.
+
+    Returns an array of shape (len(windows), nodes). Hours are sampled
+    SUBSTEPS times for the clear-sky irradiance, and each hour counts for
+    the fraction of it inside a window.
+    """
+    if not len(starts):
+        return np.zeros((len(windows), len(fleet)))
+    samples = starts[:, None] + (np.arange(SUBSTEPS) + 0.5) * 3600 / SUBSTEPS
+    ghi = clear_sky(samples, lat, lon) * factors[:, None]
+    hourly = basis(ghi, temps[:, None]).mean(axis=1)  # (hours, 3): each term's mean over the hour, in Wh
+    bounds = np.array(windows, dtype=float)
+    overlap = np.clip(np.minimum(starts + 3600, bounds[:, 1:]) - np.maximum(starts, bounds[:, :1]), 0, 3600) / 3600
+    panel_wh = overlap @ hourly @ fleet.coefficients().T  # (windows, panels)
+    return np.array([fleet.per_node(row) for row in panel_wh])
+
+
+def outlook(fleet, forecast, observations, now=None):
+    """Energy outlook per node.
+
+    forecast is a better_forecast response and observations is
+    (timestamps, irradiance, temperature) for today, as from observed().
+    Returns a dict of per-node arrays: so_far, rest_of_today, tomorrow
+    and need (Wh drawn in a day), and days (of load the usable battery
+    covers; 0 without a battery), plus names.
+    """
+    now = time.time() if now is None else now
+    tz = timezone(timedelta(minutes=forecast.get("timezone_offset_minutes", 0)))
+    midnight = datetime.fromtimestamp(now, tz).replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow = (midnight + timedelta(days=1)).timestamp()
+    day_after = (midnight + timedelta(days=2)).timestamp()
+
+    starts, factors, temps = forecast_hours(forecast)
+    rest, ahead = expected(fleet, starts, factors, temps, forecast.get("latitude", 0.0),
+                           forecast.get("longitude", 0.0), [(now, tomorrow), (tomorrow, day_after)])
+    ts, ghi, temp_c = observations
+    today = ts >= midnight.timestamp()
+    need = fleet.load_w * 24
+    return {
+        "names": fleet.names,
+        "so_far": harvested(fleet, ts[today], ghi[today], temp_c[today]) if len(ts) else None,
+        "rest_of_today": rest,
+        "tomorrow": ahead,
+        "need": need,
+        "days": np.divide(fleet.capacity_wh, need, out=np.zeros(len(fleet)), where=need > 0),
+    }
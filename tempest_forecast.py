@@ -1,176 +1,152 @@
 import requests
-import meshtastic
-import meshtastic.tcp_interface
-import meshtastic.serial_interface
 import time
 import os
-from datetime import datetime
 from dotenv import load_dotenv
 
+import better_forecast
+import http_client
+import metrics
+import radio
+import records
+import templates
+import wxbinary
+
 # Load environment variables from .env file
 load_dotenv()
 
 # Configuration from environment variables
 TEMPEST_STATION_ID = os.getenv("TEMPEST_STATION_ID")
-TEMPEST_API_TOKEN = os.getenv("TEMPEST_API_TOKEN")
-MESHTASTIC_INTERFACE = os.getenv("MESHTASTIC_INTERFACE", "tcp")  # 'tcp' or 'serial'
-MESHTASTIC_HOST = os.getenv("MESHTASTIC_HOST", "localhost")  # For TCP
-MESHTASTIC_PORT = os.getenv("MESHTASTIC_PORT")  # For Serial (e.g., COM3, /dev/ttyUSB0)
 CHANNEL_INDEX = os.getenv("CHANNEL_INDEX", "0")
+LOCATION_NAME = os.getenv("LOCATION_NAME", "NE Scottsdale")  # Place name used in messages
+TEMPEST_PRODUCTS = os.getenv("TEMPEST_PRODUCTS", "today")  # Products to send, e.g. 'current,today,outlook,hours'
+TEMPEST_DAYS = int(os.getenv("TEMPEST_DAYS", "5"))  # Days in the multi-day outlook
+TEMPEST_HOURS = int(os.getenv("TEMPEST_HOURS", "6"))  # Hours in the next-hours forecast
+
+
+def _pack(template, lines, label):
+    # Fit the radio's payload limit - split at line boundaries if needed
+    messages_to_send = template.pack(lines)
+    if len(messages_to_send) > 1:
+        print(f"Warning: {label} split into {len(messages_to_send)} parts")
+
+    # Display the message as it will be sent
+    print("\n" + "="*50)
+    print(templates.text(messages_to_send))
+    print("="*50)
+    return messages_to_send
+
+
+def render_current(data, label=LOCATION_NAME, units=None):
+    """Current conditions, in the same format as getwx.py"""
+    # Imported here so the Tempest UDP listener and tsstore are only loaded when asked for
+    import getwx
+    obs = better_forecast.observation(data)
+    if obs is None:
+        print("Error: No current conditions in the forecast")
+        return []
+    return getwx.render_messages(obs, label, units=units)
+
+
+def render_today(data, label=LOCATION_NAME, units=None):
+    """Today's forecast"""
+    daily_forecasts = better_forecast.daily(data)
+    if not daily_forecasts:
+        print("Error: No forecast data available")
+        return []
+    
+    # Get today's forecast (first day)
+    today = daily_forecasts[0]
+    record = records.from_tempest_day(today, better_forecast.tz(data), label=label,
+                                      stale_since=http_client.stale_since(data))
+    if record.time is None:
+        record.time = time.time()
+
+    # Lines in both wordings; the compact one is only used when it saves a packet
+    template = templates.get("tempest_today", units)
+    messages_to_send = _pack(template, template.render(record), "Forecast")
+    return wxbinary.with_payload([messages_to_send], wxbinary.DAILY_FORECAST, record.time, {
+        "temp_high": record.temp_high,
+        "temp_low": record.temp_low,
+        "precip_probability": record.precip_probability,
+        "wind_avg": record.wind_avg,
+        "wind_direction": record.wind_direction,
+    })
+
+
+def render_outlook(data, label=LOCATION_NAME, days=TEMPEST_DAYS, units=None):
+    """One line per day for the next days, today first"""
+    tz = better_forecast.tz(data)
+    outlook = [records.from_tempest_day(day, tz) for day in better_forecast.daily(data)[:days]]
+    if not outlook:
+        print("Error: No forecast data available")
+        return []
+
+    template = templates.get("tempest_outlook", units)
+    heading = records.Record(label=label, stale_since=http_client.stale_since(data))
+    return [_pack(template, template.render(heading, outlook, count=len(outlook)), "Outlook")]
 
-# Validate required configuration
-if not TEMPEST_STATION_ID or not TEMPEST_API_TOKEN:
-    raise ValueError("TEMPEST_STATION_ID and TEMPEST_API_TOKEN environment variables must be set")
+
+def render_hours(data, label=LOCATION_NAME, hours=TEMPEST_HOURS, units=None):
+    """One line per hour for the next hours, starting with the current one"""
+    tz = better_forecast.tz(data)
+    upcoming = [records.from_tempest_hour(hour, tz) for hour in better_forecast.hourly(data)[:hours]]
+    if not upcoming:
+        print("Error: No hourly forecast available")
+        return []
+
+    template = templates.get("tempest_hours", units)
+    heading = records.Record(label=label, stale_since=http_client.stale_since(data))
+    return [_pack(template, template.render(heading, upcoming, count=len(upcoming)), "Hourly forecast")]
+
+
+# Products that can be rendered from one Better Forecast payload
+RENDERERS = {
+    "current": render_current,
+    "today": render_today,
+    "outlook": render_outlook,
+    "hours": render_hours,
+}
+
+
+def parse_products(products):
+    """Product names from a comma-separated string or a list"""
+    if isinstance(products, str):
+        products = [name.strip().lower() for name in products.split(",") if name.strip()]
+    for name in products:
+        if name not in RENDERERS:
+            raise ValueError(f"Unknown Tempest product '{name}'; expected some of: {', '.join(RENDERERS)}")
+    return list(products)
+
+
+def build_messages(station_id=TEMPEST_STATION_ID, label=LOCATION_NAME, products=TEMPEST_PRODUCTS, units=None):
+    """Fetch the Better Forecast once and return the message groups of every product to send.
+
+    The payload is reused for TEMPEST_FORECAST_TTL seconds, so rendering
+    other products (or the same ones for another slot) soon after makes no
+    further request.
+    """
+    products = parse_products(products)
+    data = better_forecast.fetch(station_id)
+
+    # Check if we have valid forecast data
+    if "forecast" not in data:
+        print("Error: Invalid forecast data received")
+        return []
+
+    groups = []
+    for name in products:
+        groups.extend(RENDERERS[name](data, label, units=units))
+    return groups
 
 def main():
+    args = radio.parse_args("Send the Tempest daily forecast over Meshtastic")
+    http_client.start_run()
     try:
-        # Get Tempest Better Forecast data
-        print(f"Fetching Better Forecast for station {TEMPEST_STATION_ID}...")
-        forecast_url = f"https://swd.weatherflow.com/swd/rest/better_forecast?station_id={TEMPEST_STATION_ID}&token={TEMPEST_API_TOKEN}"
-        
-        response = requests.get(forecast_url)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        # Check if we have valid forecast data
-        if "forecast" not in data or "daily" not in data["forecast"]:
-            print("Error: Invalid forecast data received")
-            return
-        
-        daily_forecasts = data["forecast"]["daily"]
-        
-        if not daily_forecasts:
-            print("Error: No forecast data available")
-            return
-        
-        # Get today's forecast (first day)
-        today = daily_forecasts[0]
-        
-        # Extract forecast data
-        day_num = today.get("day_num", "N/A")
-        conditions = today.get("conditions", "N/A")
-        icon = today.get("icon", "")
-        
-        # Temperature data (convert from Celsius to Fahrenheit)
-        temp_high_c = today.get("air_temp_high")
-        temp_low_c = today.get("air_temp_low")
-        
-        if temp_high_c is not None:
-            temp_high = (temp_high_c * 9/5) + 32
-        else:
-            temp_high = None
-        
-        if temp_low_c is not None:
-            temp_low = (temp_low_c * 9/5) + 32
-        else:
-            temp_low = None
-        
-        # Precipitation
-        precip_probability = today.get("precip_probability")
-        precip_type = today.get("precip_type", "none")
-        precip_icon = today.get("precip_icon", "")
-        
-        # Wind
-        wind_avg = today.get("wind_avg")
-        wind_direction = today.get("wind_direction")
-        wind_direction_cardinal = today.get("wind_direction_cardinal", "")
-        
-        # Sunrise/Sunset (Unix timestamps)
-        sunrise = today.get("sunrise")
-        sunset = today.get("sunset")
-        
-        # Convert timestamps to local time
-        if sunrise:
-            sunrise_dt = datetime.fromtimestamp(sunrise)
-            sunrise_str = sunrise_dt.strftime("%H:%M")
-        else:
-            sunrise_str = "N/A"
-        
-        if sunset:
-            sunset_dt = datetime.fromtimestamp(sunset)
-            sunset_str = sunset_dt.strftime("%H:%M")
-        else:
-            sunset_str = "N/A"
-        
-        # Build output message
-        current_date = datetime.now().strftime("%a %d %b")
-        message_lines = []
-        message_lines.append(f"Daily Wx Forecast for NE Scottsdale on {current_date}:")
-        message_lines.append(f"Conditions: {conditions}")
-        
-        if temp_high is not None and temp_low is not None:
-            message_lines.append(f"High/Low: {temp_high:.0f}°F / {temp_low:.0f}°F")
-        elif temp_high is not None:
-            message_lines.append(f"High: {temp_high:.0f}°F")
-        
-        if precip_probability is not None:
-            message_lines.append(f"Precip Chance: {precip_probability}% ({precip_type})")
-        
-        if wind_avg is not None:
-            wind_mph = wind_avg * 2.23694  # Convert m/s to mph
-            if wind_direction_cardinal:
-                message_lines.append(f"Wind: {wind_mph:.0f} mph {wind_direction_cardinal}")
-            else:
-                message_lines.append(f"Wind: {wind_mph:.0f} mph")
-        
-        message_lines.append(f"Sunrise: {sunrise_str} | Sunset: {sunset_str}")
-        
-        message = "\n".join(message_lines)
-        
-        # Display the message
-        print("\n" + "="*50)
-        print(message)
-        print("="*50)
-        
-        # Enforce 210 character limit for Meshtastic - split into multiple messages if needed
-        messages_to_send = []
-        if len(message) > 210:
-            # First message: 207 chars + "..."
-            messages_to_send.append(message[:207] + "...")
-            remaining = message[207:]
-            
-            # Additional messages for remainder
-            while remaining:
-                if len(remaining) > 210:
-                    messages_to_send.append(remaining[:210])
-                    remaining = remaining[210:]
-                else:
-                    messages_to_send.append(remaining)
-                    remaining = ""
-            
-            print(f"Warning: Message split into {len(messages_to_send)} parts (original: {len(message)} chars)")
-        else:
-            messages_to_send.append(message)
-        
-        # Send message(s) using Meshtastic API
-        try:
-            # Create interface based on configuration
-            if MESHTASTIC_INTERFACE.lower() == "serial":
-                if not MESHTASTIC_PORT:
-                    raise ValueError("MESHTASTIC_PORT must be set when using serial interface")
-                interface = meshtastic.serial_interface.SerialInterface(MESHTASTIC_PORT)
-                print(f"\nConnected via Serial: {MESHTASTIC_PORT}")
-            else:
-                interface = meshtastic.tcp_interface.TCPInterface(hostname=MESHTASTIC_HOST)
-                print(f"\nConnected via TCP: {MESHTASTIC_HOST}")
-            
-            for idx, msg in enumerate(messages_to_send, 1):
-                print(f"\nSending forecast message part {idx}/{len(messages_to_send)} ({len(msg)} chars)...")
-                interface.sendText(msg, channelIndex=int(CHANNEL_INDEX))
-                print(f"Part {idx} sent successfully!")
-                
-                # Wait between messages if there are multiple parts
-                if idx < len(messages_to_send):
-                    print("Waiting 3 seconds before sending next part...")
-                    time.sleep(3)
-            
-            # Wait to ensure final message is queued before closing
-            time.sleep(2)
-            interface.close()
-            print("Connection closed.")
-        except Exception as e:
-            print(f"Error sending message: {e}")
+        with metrics.span("render", report="tempest_forecast"):
+            groups = build_messages()
+        if groups:
+            # Send message(s) using Meshtastic API
+            radio.send_once(groups, CHANNEL_INDEX, dry_run=args.dry_run)
         
     except requests.exceptions.HTTPError as e:
         print(f"HTTP Error: {e}")
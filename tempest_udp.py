@@ -0,0 +1,300 @@
+import argparse
+import json
+import socket
+import threading
+import time
+import os
+from collections import deque
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+UDP_PORT = int(os.getenv("TEMPEST_UDP_PORT", "50222"))  # Port the Tempest hub broadcasts on
+UDP_WAIT = float(os.getenv("TEMPEST_UDP_WAIT", "75"))  # Seconds to wait for a first observation (hub sends one a minute)
+STATION_ELEVATION = float(os.getenv("STATION_ELEVATION", "0"))  # Meters, to reduce station pressure to sea level
+WINDOW_SECONDS = 3 * 3600  # History kept for pressure trend and rolling totals
+
+# Field positions in an obs_st "obs" array (Tempest UDP API v171)
+OBS_ST_FIELDS = [
+    "timestamp", "wind_lull", "wind_avg", "wind_gust", "wind_direction", "wind_sample_interval",
+    "station_pressure", "air_temperature", "relative_humidity", "brightness", "uv",
+    "solar_radiation", "precip", "precip_type", "lightning_strike_avg_distance",
+    "strike_count", "battery", "report_interval",
+]
+
+
+def sea_level_pressure(station_pressure, elevation, temp_c):
+    """Reduce station pressure (mb) to sea level using the hypsometric formula"""
+    if not elevation:
+        return station_pressure
+    return station_pressure * (1 - 0.0065 * elevation / (temp_c + 0.0065 * elevation + 273.15)) ** -5.257
+
+
+def feels_like(temp_c, humidity, wind_ms):
+    """Heat index when hot, wind chill when cold, otherwise the air temperature (all C)"""
+    temp_f = temp_c * 9/5 + 32
+    wind_mph = wind_ms * 2.23694
+    if temp_f >= 80 and humidity is not None:
+        # Rothfusz regression used by NWS
+        hi = (-42.379 + 2.04901523 * temp_f + 10.14333127 * humidity
+              - 0.22475541 * temp_f * humidity - 0.00683783 * temp_f ** 2
+              - 0.05481717 * humidity ** 2 + 0.00122874 * temp_f ** 2 * humidity
+              + 0.00085282 * temp_f * humidity ** 2 - 0.00000199 * temp_f ** 2 * humidity ** 2)
+        return (hi - 32) * 5/9
+    if temp_f <= 50 and wind_mph > 3:
+        wc = 35.74 + 0.6215 * temp_f - 35.75 * wind_mph ** 0.16 + 0.4275 * temp_f * wind_mph ** 0.16
+        return (wc - 32) * 5/9
+    return temp_c
+
+
+def pressure_trend(history, now, current):
+    """Tempest-style trend from the 3-hour pressure change: rising, falling or steady"""
+    past = [p for ts, p in history if now - ts >= WINDOW_SECONDS - 600]
+    if not past:
+        return "unknown"
+    change = current - past[-1]
+    if change > 1:
+        return "rising"
+    if change < -1:
+        return "falling"
+    return "steady"
+
+
+class TempestListener:
+    """Collects Tempest hub UDP broadcasts and keeps the latest observation.
+
+    obs_st packets are normalized into the same dict shape as an observation
+    from the REST API, so getwx.py can render them unchanged. A rolling
+    window of recent observations backs the pressure trend, daily rain and
+    hourly strike totals. rapid_wind packets refresh the wind fields between
+    observations and evt_strike events are kept for the last hour. Functions
+    added to observers are called with each new observation.
+    """
+
+    def __init__(self, port=UDP_PORT, elevation=STATION_ELEVATION):
+        self.port = port
+        self.elevation = elevation
+        self.latest = None
+        self.window = deque()  # (timestamp, observation) for the last WINDOW_SECONDS
+        self.strikes = deque()  # (timestamp, distance_km, energy)
+        self.rapid_wind = None  # (timestamp, speed m/s, direction)
+        self.rain_day = None
+        self.rain_today = 0.0
+        self.packets = 0
+        self.observers = []
+        self._lock = threading.Lock()
+        self._received = threading.Event()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def handle_packet(self, data):
+        """Process one UDP datagram; malformed or foreign ones are skipped"""
+        try:
+            packet = json.loads(data.decode("utf-8") if isinstance(data, bytes) else data)
+        except ValueError:
+            return
+        if not isinstance(packet, dict):
+            return
+        self.packets += 1
+        try:
+            kind = packet.get("type")
+            if kind == "obs_st":
+                for values in packet.get("obs") or []:
+                    self._on_observation(values)
+            elif kind == "rapid_wind":
+                ts, speed, direction = packet["ob"][:3]
+                with self._lock:
+                    self.rapid_wind = (ts, speed, direction)
+            elif kind == "evt_strike":
+                ts, distance, energy = packet["evt"][:3]
+                with self._lock:
+                    self.strikes.append((ts, distance, energy))
+                    self._trim(ts)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            print(f"Skipping malformed {packet.get('type')} packet: {e!r}")
+
+    def _trim(self, now):
+        while self.window and now - self.window[0][0] > WINDOW_SECONDS:
+            self.window.popleft()
+        while self.strikes and now - self.strikes[0][0] > 3600:
+            self.strikes.popleft()
+
+    def _on_observation(self, values):
+        if len(values) < len(OBS_ST_FIELDS):
+            raise ValueError(f"obs_st row has {len(values)} of {len(OBS_ST_FIELDS)} fields")
+        raw = dict(zip(OBS_ST_FIELDS, values))
+        ts = raw["timestamp"]
+        temp_c = raw["air_temperature"]
+        pressure = raw["station_pressure"]
+
+        with self._lock:
+            # Daily rain resets at local midnight, like precip_accum_local_day
+            day = datetime.fromtimestamp(ts).date()
+            if day != self.rain_day:
+                self.rain_day = day
+                self.rain_today = 0.0
+            self.rain_today += raw["precip"] or 0.0
+
+            obs = dict(raw)
+            if temp_c is not None and pressure is not None:
+                obs["barometric_pressure"] = sea_level_pressure(pressure, self.elevation, temp_c)
+                obs["pressure_trend"] = pressure_trend(
+                    [(t, o["barometric_pressure"]) for t, o in self.window if "barometric_pressure" in o],
+                    ts, obs["barometric_pressure"])
+            if temp_c is not None:
+                obs["feels_like"] = feels_like(temp_c, raw["relative_humidity"], raw["wind_avg"] or 0.0)
+            obs["precip_accum_local_day"] = self.rain_today
+            obs["strike_count_1h"] = (sum(o.get("strike_count") or 0 for t, o in self.window if ts - t < 3600)
+                                      + (raw["strike_count"] or 0))
+
+            self.window.append((ts, obs))
+            self._trim(ts)
+            self.latest = obs
+
+        self._received.set()
+        for observer in list(self.observers):
+            try:
+                observer(obs)
+            except Exception as e:
+                print(f"Observer failed: {e}")
+
+    def observation(self):
+        """Return the latest observation with the freshest rapid wind applied, or None"""
+        with self._lock:
+            if self.latest is None:
+                return None
+            obs = dict(self.latest)
+            if self.rapid_wind and self.rapid_wind[0] > obs["timestamp"]:
+                obs["wind_avg"] = self.rapid_wind[1]
+                obs["wind_direction"] = self.rapid_wind[2]
+            return obs
+
+    def recent_strikes(self):
+        """Return (timestamp, distance_km, energy) for lightning strikes in the last hour"""
+        with self._lock:
+            return list(self.strikes)
+
+    def history(self):
+        """Return the observations in the rolling window, oldest first"""
+        with self._lock:
+            return [obs for _, obs in self.window]
+
+    def wait_for_observation(self, timeout=UDP_WAIT):
+        """Start listening if needed and block until an observation is available"""
+        self.start()
+        self._received.wait(timeout)
+        return self.observation()
+
+    def serve(self):
+        """Receive datagrams until stop() is called"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(("", self.port))
+        sock.settimeout(1.0)
+        print(f"Listening for Tempest UDP broadcasts on port {self.port}")
+        try:
+            while not self._stop.is_set():
+                try:
+                    data, _ = sock.recvfrom(4096)
+                except socket.timeout:
+                    continue
+                self.handle_packet(data)
+        finally:
+            sock.close()
+
+    def start(self):
+        """Serve in a background thread (no-op if already running)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.serve, name="tempest-udp", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_listener():
+    """Return the process-wide listener, started on first use"""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = TempestListener()
+            _listener.start()
+        return _listener
+
+
+def replay(path, host="127.0.0.1", port=UDP_PORT, speed=0.0):
+    """Send captured packets (one JSON object per line) to a listener.
+
+    With speed > 0 the original spacing between packet timestamps is kept,
+    divided by speed; with speed 0 packets are sent back to back.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    last_ts = None
+    sent = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            packet = json.loads(line)
+            ts = packet_timestamp(packet)
+            if speed > 0 and last_ts is not None and ts is not None:
+                time.sleep(max(0.0, ts - last_ts) / speed)
+            last_ts = ts if ts is not None else last_ts
+            sock.sendto(line.encode("utf-8"), (host, port))
+            sent += 1
+    sock.close()
+    print(f"Replayed {sent} packets to {host}:{port}")
+    return sent
+
+
+def packet_timestamp(packet):
+    """Epoch time of a packet, or None for types without one"""
+    if packet.get("type") == "obs_st" and packet.get("obs"):
+        return packet["obs"][0][0]
+    if packet.get("type") == "rapid_wind":
+        return packet["ob"][0]
+    if packet.get("type") == "evt_strike":
+        return packet["evt"][0]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Listen for or replay Tempest hub UDP broadcasts")
+    sub = parser.add_subparsers(dest="command")
+    listen_cmd = sub.add_parser("listen", help="print observations as they arrive (default)")
+    listen_cmd.add_argument("--port", type=int, default=UDP_PORT)
+    replay_cmd = sub.add_parser("replay", help="send captured packets from a JSON-lines file")
+    replay_cmd.add_argument("file")
+    replay_cmd.add_argument("--host", default="127.0.0.1")
+    replay_cmd.add_argument("--port", type=int, default=UDP_PORT)
+    replay_cmd.add_argument("--speed", type=float, default=0.0,
+                            help="playback speed relative to capture time (0 = as fast as possible)")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        replay(args.file, args.host, args.port, args.speed)
+        return
+
+    listener = TempestListener(port=getattr(args, "port", UDP_PORT))
+    listener.observers.append(lambda obs: print(json.dumps(obs)))
+    try:
+        listener.serve()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+"""Declarative report templates, compiled once into render functions.
+
+A template is data: the separators of its two profiles and a list of
+fields, each a verbose and a compact wording written as format strings
+over records.Record fields, e.g. "Wind:{wind_avg} {wind_avg.unit}". A
+field lists the Record fields it requires (by default every field it
+mentions); it is left out when one of them is missing, and other missing
+values read "N/A". A field may instead be a list of alternatives, the
+first whose requirements are met being used. Its priority says what to
+give up when a report has to fit in packer.MAX_PARTS packets: fields with
+the highest number are dropped first, priority 0 never.
+
+Values are converted to the units profile (REPORT_UNITS, or per site) and
+formatted with the profile's precision unless the placeholder has its own
+format spec; {name.unit} and {name.short} are the unit symbols. Times take
+a strftime spec ("%H:%M" by default; "%-I" is the hour without leading
+zero). Templates may also have rows, rendered once for each record of a
+list (the days of an outlook), and extras: values the caller passes in
+that are not part of a Record.
+
+Templates are compiled the first time they are used in a units profile:
+the format strings are parsed and every placeholder is bound to its
+converter and format, so rendering a report is a few attribute lookups and
+string formats per field. The built-in TEMPLATES can be overridden, a
+whole template at a time, from TEMPLATES_FILE.
+"""
+import json
+import string
+import threading
+import os
+from datetime import datetime
+from dotenv import load_dotenv
+
+import packer
+import records
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+REPORT_UNITS = os.getenv("REPORT_UNITS", "imperial")  # Units in messages: 'imperial' or 'metric'
+TEMPLATES_FILE = os.getenv("TEMPLATES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates.json"))
+
+# Quantity of each numeric Record field
+QUANTITIES = {
+    "temperature": "temperature",
+    "feels_like": "temperature",
+    "temp_high": "temperature",
+    "temp_low": "temperature",
+    "day_high": "temperature",
+    "day_low": "temperature",
+    "wind_avg": "speed",
+    "wind_max": "speed",
+    "wind_gust": "speed",
+    "peak_gust": "speed",
+    "pressure": "pressure",
+    "rain": "rain",
+    "humidity": "percent",
+    "precip_probability": "percent",
+    "wind_direction": "angle",
+    "strikes": "count",
+    "uv": "count",
+    "solar_radiation": "irradiance",
+    "panel_power": "power",
+}
+TIMES = ("time", "sunrise", "sunset", "stale_since")
+
+# Units profile -> quantity -> (conversion from Record units or None, default format, unit, short unit)
+_COMMON = {
+    "percent": (None, ".0f", "%", "%"),
+    "angle": (None, ".0f", "°", ""),
+    "count": (None, ".0f", "", ""),
+    "irradiance": (None, ".0f", "W/m²", "W/m2"),
+    "power": (None, ".2f", "W", "W"),
+}
+PROFILES = {
+    "imperial": dict(_COMMON, **{
+        "temperature": (lambda c: c * 9 / 5 + 32, ".0f", "°F", "F"),
+        "speed": (lambda mps: mps * 2.23694, ".0f", "mph", "mph"),
+        "pressure": (lambda hpa: hpa * 0.02953, ".2f", "inHg", "inHg"),
+        "rain": (lambda mm: mm * 0.03937, ".2f", "in", "in"),
+    }),
+    "metric": dict(_COMMON, **{
+        "temperature": (None, ".0f", "°C", "C"),
+        "speed": (lambda mps: mps * 3.6, ".0f", "km/h", "km/h"),
+        "pressure": (None, ".0f", "hPa", "hPa"),
+        "rain": (None, ".1f", "mm", "mm"),
+    }),
+}
+
+# Shown after the heading when a report is made from an old copy served after a failed fetch
+STALE = {"verbose": "STALE data from {stale_since}", "compact": "STALE {stale_since}"}
+
+TEMPLATES = {
+    # getwx.py
+    "tempest_current": {
+        "sep": " | ",
+        "compact_sep": " ",
+        "fields": [
+            {"verbose": "WX {label} as of {time}: Temp:{temperature}{temperature.unit}",
+             "compact": "WX {label} {time} T:{temperature}{temperature.short}", "requires": []},
+            STALE,
+            {"verbose": "Feels Like: {feels_like}{feels_like.unit}", "compact": "FL:{feels_like}{feels_like.short}",
+             "priority": 2},
+            {"verbose": "Humidity:{humidity}%", "compact": "H:{humidity}%", "priority": 1},
+            {"verbose": "Barometer:{pressure} {pressure.unit} and {pressure_trend}",
+             "compact": "B:{pressure} {pressure_trend}", "requires": ["pressure"], "priority": 1},
+            {"verbose": "Wind:{wind_avg} {wind_avg.unit} at {wind_direction}°",
+             "compact": "W:{wind_avg}{wind_avg.short}@{wind_direction}", "requires": ["wind_avg"]},
+            {"verbose": "High so far {day_high}{day_high.unit}, low {day_low}{day_low.unit}",
+             "compact": "Hi:{day_high}{day_high.short} Lo:{day_low}{day_low.short}", "priority": 2},
+            {"verbose": "Peak gust {peak_gust} {peak_gust.unit}", "compact": "PG:{peak_gust}{peak_gust.short}",
+             "priority": 2},
+            {"verbose": "Rain:{rain} {rain.unit}", "compact": "R:{rain}{rain.short}", "priority": 1},
+            {"verbose": "Lightning Strikes:{strikes}", "compact": "L:{strikes}", "priority": 2},
+            {"verbose": "Solar Index:{solar_radiation} {solar_radiation.unit}",
+             "compact": "S:{solar_radiation}{solar_radiation.short}", "priority": 3},
+            {"verbose": "Est panel power:{panel_power:.2f} W", "compact": "PV:{panel_power:.1f}W", "priority": 3},
+        ],
+    },
+    # nws_current_weather.py
+    "nws_current": {
+        "sep": "\n",
+        "compact_sep": " ",
+        "fields": [
+            {"verbose": "NWS Current Conditions as of {time}", "compact": "NWS {time}", "requires": []},
+            {"verbose": "Station: {station_name} ({station})", "compact": "{station}", "requires": []},
+            STALE,
+            {"verbose": "Conditions: {conditions}", "compact": "{conditions}", "requires": []},
+            {"verbose": "Temperature: {temperature:.1f}{temperature.unit}",
+             "compact": "T:{temperature}{temperature.short}"},
+            {"verbose": "Humidity: {humidity}%", "compact": "H:{humidity}%", "priority": 1},
+            [
+                {"verbose": "Wind: {wind_avg:.1f} {wind_avg.unit} from {wind_direction}°",
+                 "compact": "W:{wind_avg}{wind_avg.short}@{wind_direction}"},
+                {"verbose": "Wind Speed: {wind_avg:.1f} {wind_avg.unit}", "compact": "W:{wind_avg}{wind_avg.short}"},
+            ],
+            {"verbose": "Pressure: {pressure} {pressure.unit}", "compact": "P:{pressure}", "priority": 1},
+            {"verbose": "High so far {day_high}{day_high.unit}, low {day_low}{day_low.unit}",
+             "compact": "Hi:{day_high}{day_high.short} Lo:{day_low}{day_low.short}", "priority": 2},
+            {"verbose": "Peak gust {peak_gust} {peak_gust.unit}", "compact": "PG:{peak_gust}{peak_gust.short}",
+             "priority": 2},
+        ],
+    },
+    # getwx_forecast.py; extras: count (hours)
+    "nws_hourly": {
+        "sep": "\r\n",
+        "compact_sep": "\n",
+        "extras": ["count"],
+        "fields": [
+            {"verbose": "{label} WX Forecast:", "compact": "{label} WX:", "requires": []},
+            STALE,
+            {"verbose": "Next {count} hours:", "compact": "Next {count}h:", "requires": []},
+        ],
+        "rows": [
+            {"verbose": "{time:%a %I:%M %p}: {temperature}{temperature.unit}, wind {wind_cardinal} {wind_range} "
+                        "{wind_avg.unit}, {conditions}",
+             "compact": "{time:%a %-I%p} {temperature}{temperature.short} {wind_cardinal}{wind_range} {conditions}",
+             "requires": []},
+        ],
+    },
+    # tempest_forecast.py, product "today"
+    "tempest_today": {
+        "sep": "\n",
+        "compact_sep": " ",
+        "fields": [
+            {"verbose": "Daily Wx Forecast for {label} on {time:%a %d %b}:", "compact": "{label} Fcst {time:%a %d %b}:",
+             "requires": []},
+            STALE,
+            {"verbose": "Conditions: {conditions}", "compact": "{conditions}", "requires": []},
+            [
+                {"verbose": "High/Low: {temp_high}{temp_high.unit} / {temp_low}{temp_low.unit}",
+                 "compact": "H/L:{temp_high}/{temp_low}{temp_low.short}"},
+                {"verbose": "High: {temp_high}{temp_high.unit}", "compact": "H:{temp_high}{temp_high.short}"},
+            ],
+            {"verbose": "Precip Chance: {precip_probability}% ({precip_type})",
+             "compact": "P:{precip_probability}% {precip_type}", "requires": ["precip_probability"], "priority": 1},
+            [
+                {"verbose": "Wind: {wind_avg} {wind_avg.unit} {wind_cardinal}",
+                 "compact": "W:{wind_avg}{wind_avg.short} {wind_cardinal}", "priority": 1},
+                {"verbose": "Wind: {wind_avg} {wind_avg.unit}", "compact": "W:{wind_avg}{wind_avg.short}", "priority": 1},
+            ],
+            {"verbose": "Sunrise: {sunrise} | Sunset: {sunset}", "compact": "Sun {sunrise}-{sunset}", "requires": [],
+             "priority": 2},
+        ],
+    },
+    # tempest_forecast.py, product "outlook"; extras: count (days)
+    "tempest_outlook": {
+        "sep": "\n",
+        "compact_sep": " ",
+        "extras": ["count"],
+        "fields": [
+            {"verbose": "{count}-Day Outlook for {label}:", "compact": "{label} {count}d:", "requires": []},
+            STALE,
+        ],
+        "rows": [
+            [
+                {"verbose": "{time:%a %d}: {conditions}, {temp_high}/{temp_low}{temp_low.unit}, "
+                            "precip {precip_probability}%",
+                 "compact": "{time:%a} {temp_high}/{temp_low}{temp_low.short} {precip_probability}% {conditions}",
+                 "requires": ["temp_high", "temp_low"]},
+                {"verbose": "{time:%a %d}: {conditions}, precip {precip_probability}%",
+                 "compact": "{time:%a} {precip_probability}% {conditions}", "requires": []},
+            ],
+        ],
+    },
+    # tempest_forecast.py, product "hours"; extras: count (hours)
+    "tempest_hours": {
+        "sep": "\n",
+        "compact_sep": " ",
+        "extras": ["count"],
+        "fields": [
+            {"verbose": "Next {count} hours for {label}:", "compact": "{label} {count}h:", "requires": []},
+            STALE,
+        ],
+        "rows": [
+            [
+                {"verbose": "{time:%I:%M %p}: {temperature}{temperature.unit}, {conditions}, "
+                            "precip {precip_probability}%, wind {wind_avg} {wind_avg.unit} {wind_cardinal}",
+                 "compact": "{time:%-I%p} {temperature}{temperature.short} {precip_probability}% "
+                            "{wind_avg}{wind_cardinal} {conditions}",
+                 "requires": ["wind_cardinal"]},
+                {"verbose": "{time:%I:%M %p}: {temperature}{temperature.unit}, {conditions}, "
+                            "precip {precip_probability}%, wind {wind_avg} {wind_avg.unit}",
+                 "compact": "{time:%-I%p} {temperature}{temperature.short} {precip_probability}% "
+                            "{wind_avg} {conditions}",
+                 "requires": []},
+            ],
+        ],
+    },
+}
+
+_lock = threading.Lock()
+_compiled = {}  # (template name, units) -> Template
+_overrides = None
+
+
+def _number(name, spec, profile):
+    convert, default, _, _ = profile[QUANTITIES[name]]
+    spec = spec or default
+
+    def render(record, extra):
+        value = getattr(record, name)
+        return format(convert(value) if convert else value, spec)
+    return render
+
+
+def _time(name, spec):
+    spec = spec or "%H:%M"
+    # The cache time is the machine's, like the rest of its messages
+    local_tz = name == "stale_since"
+
+    def render(record, extra):
+        local = datetime.fromtimestamp(getattr(record, name), None if local_tz else record.tz)
+        return local.strftime(spec.replace("%-I", str(local.hour % 12 or 12)))
+    return render
+
+
+def _wind_range(spec, profile):
+    """Forecast wind speed, or its range ("5-10") when the forecast gives one"""
+    low = _number("wind_avg", spec, profile)
+    high = _number("wind_max", spec, profile)
+
+    def render(record, extra):
+        if record.wind_max is None or record.wind_max == record.wind_avg:
+            return low(record, extra)
+        return f"{low(record, extra)}-{high(record, extra)}"
+    return render
+
+
+def _text(name):
+    def render(record, extra):
+        return str(getattr(record, name))
+    return render
+
+
+def _extra(name, spec):
+    def render(record, extra):
+        value = extra.get(name)
+        return "N/A" if value is None else format(value, spec)
+    return render
+
+
+def _missing(render, name):
+    """Read "N/A" when the value is missing"""
+    source = "wind_avg" if name == "wind_range" else name
+
+    def guarded(record, extra):
+        return "N/A" if getattr(record, source) is None else render(record, extra)
+    return guarded
+
+
+def _compile_text(text, profile, extras, where):
+    """Parse a format string into literals and render functions; returns (pieces, record fields used)"""
+    pieces, used = [], []
+    for literal, name, spec, _ in string.Formatter().parse(text):
+        if literal:
+            pieces.append(literal)
+        if name is None:
+            continue
+        base, _, attr = name.partition(".")
+        quantity = QUANTITIES.get("wind_avg" if base == "wind_range" else base)
+        if attr:
+            if attr not in ("unit", "short") or quantity is None:
+                raise ValueError(f"Unknown placeholder {{{name}}} in template {where}")
+            pieces.append(profile[quantity][2 if attr == "unit" else 3])
+            continue
+        if name in extras:
+            pieces.append(_extra(name, spec))
+            continue
+        if name == "wind_range":
+            render = _wind_range(spec, profile)
+        elif name in TIMES:
+            render = _time(name, spec)
+        elif name in QUANTITIES:
+            render = _number(name, spec, profile)
+        elif name in records.FIELDS:
+            render = _text(name)
+        else:
+            raise ValueError(f"Unknown placeholder {{{name}}} in template {where}")
+        pieces.append(_missing(render, name))
+        used.append("wind_avg" if name == "wind_range" else name)
+    return pieces, used
+
+
+def _compile_field(spec, profile, extras, where):
+    """A field as a tuple of alternatives: (required fields, priority, verbose pieces, compact pieces)"""
+    alternatives = []
+    for option in spec if isinstance(spec, list) else [spec]:
+        verbose, used = _compile_text(option["verbose"], profile, extras, where)
+        compact, compact_used = _compile_text(option.get("compact", option["verbose"]), profile, extras, where)
+        requires = option.get("requires")
+        if requires is None:
+            requires = list(dict.fromkeys(used + compact_used))
+        for name in requires:
+            if name not in records.FIELDS:
+                raise ValueError(f"Unknown required field '{name}' in template {where}")
+        alternatives.append((tuple(requires), int(option.get("priority", 0)), verbose, compact))
+    return tuple(alternatives)
+
+
+def _join(pieces, record, extra):
+    return "".join([piece if piece.__class__ is str else piece(record, extra) for piece in pieces])
+
+
+class Template:
+    """A compiled template; see the module docstring"""
+
+    def __init__(self, name, spec, units):
+        if units not in PROFILES:
+            raise ValueError(f"Unknown units '{units}'; expected one of: {', '.join(PROFILES)}")
+        profile = PROFILES[units]
+        self.name = name
+        self.units = units
+        self.sep = spec.get("sep", "\n")
+        self.compact_sep = spec.get("compact_sep", self.sep)
+        extras = frozenset(spec.get("extras", ()))
+        self.fields = [_compile_field(field, profile, extras, name) for field in spec.get("fields", [])]
+        self.rows = [_compile_field(field, profile, extras, name) for field in spec.get("rows", [])]
+
+    @staticmethod
+    def _render(fields, record, extra, out):
+        for alternatives in fields:
+            for requires, priority, verbose, compact in alternatives:
+                for name in requires:
+                    if getattr(record, name) is None:
+                        break
+                else:
+                    out.append((_join(verbose, record, extra), _join(compact, record, extra), priority))
+                    break
+
+    def render(self, record, rows=(), **extra):
+        """(verbose, compact, priority) fields for a record, then for each record in rows"""
+        out = []
+        self._render(self.fields, record, extra, out)
+        for row in rows:
+            self._render(self.rows, row, extra, out)
+        return out
+
+    def pack(self, fields, max_parts=None):
+        """Pack rendered fields into packets with the template's separators"""
+        return packer.pack_profiles(fields, sep=self.sep, compact_sep=self.compact_sep, max_parts=max_parts)
+
+
+def load_overrides(path=TEMPLATES_FILE):
+    """Templates from TEMPLATES_FILE by name, or {} when there is no such file"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        overrides = json.load(f)
+    for name in overrides:
+        if name not in TEMPLATES:
+            raise ValueError(f"Unknown template '{name}' in {path}; expected some of: {', '.join(TEMPLATES)}")
+    return overrides
+
+
+def get(name, units=None):
+    """The compiled template for a units profile (REPORT_UNITS by default), compiling it on first use"""
+    global _overrides
+    units = (units or REPORT_UNITS).lower()
+    template = _compiled.get((name, units))
+    if template is not None:
+        return template
+    with _lock:
+        if _overrides is None:
+            _overrides = load_overrides()
+        template = _compiled.get((name, units))
+        if template is None:
+            template = _compiled[(name, units)] = Template(name, _overrides.get(name, TEMPLATES[name]), units)
+    return template
+
+
+def text(messages):
+    """Packed messages for the console, parts separated by a blank line"""
+    return "\n\n".join(messages)
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The modules are scripts at the top of the repository, not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep caches, histories and outboxes written by the tests out of the real cache directory
+os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="weather-tests-")
@@ -0,0 +1,142 @@
+import json
+import math
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import backfill
+import http_client
+import tempest_udp
+import tsstore
+
+DEVICE_ID = 456
+ELEVATION = 500.0
+
+
+def obs_row(ts):
+    """An obs_st row: a temperature that follows the time of day and 0.1 mm of rain a minute from 1 to 2 AM"""
+    local = datetime.fromtimestamp(ts)
+    rain = 0.1 if local.hour == 1 else 0.0
+    temp = 20 + 5 * math.sin(ts / 43200 * math.pi)
+    return [ts, 0.5, 2.0, 3.5, 180, 3, 960.0, temp, 40, 1000, 2.1, 300, rain, 0, 0, 0, 2.6, 1]
+
+
+class TempestStandIn(BaseHTTPRequestHandler):
+    """The Tempest REST API's /stations and /observations/device, with one observation a minute"""
+
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.requests.append(url.path)
+        if url.path.startswith("/stations/"):
+            body = {"stations": [{"station_meta": {"elevation": ELEVATION},
+                                  "devices": [{"device_id": 123, "device_type": "HB"},
+                                              {"device_id": DEVICE_ID, "device_type": "ST"}]}]}
+        elif url.path == f"/observations/device/{DEVICE_ID}":
+            start, end = int(query["time_start"][0]), int(query["time_end"][0])
+            first = start + (-start % 60)
+            body = {"type": "obs_st", "device_id": DEVICE_ID, "obs": [obs_row(t) for t in range(first, end + 1, 60)]}
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def api(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TempestStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    TempestStandIn.requests = []
+    monkeypatch.setattr(http_client, "TEMPEST_API_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(backfill, "API_TOKEN", "token")
+    monkeypatch.setattr(backfill, "BACKFILL_BATCH", 2)
+    try:
+        yield TempestStandIn
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def midnight(day):
+    return int(time.mktime(day.timetuple()))
+
+
+def test_backfill_from_device_history(api, tmp_path):
+    first = date.today() - timedelta(days=5)
+    start, end = midnight(first), midnight(first + timedelta(days=3))
+    series = f"backfill-{tmp_path.name}"
+
+    added = backfill.backfill(start, end, station_id="12345", series=series)
+
+    assert added == (end - start) // 60
+    assert api.requests[0] == "/stations/12345"
+    assert api.requests.count(f"/observations/device/{DEVICE_ID}") == 3
+    store = tsstore.SeriesStore(series)
+    for offset in range(3):
+        day = first + timedelta(days=offset)
+        records = store.read(day.isoformat())
+        assert len(records) == (midnight(day + timedelta(days=1)) - midnight(day)) // 60
+        assert all(datetime.fromtimestamp(r["timestamp"]).date() == day for r in records)
+        # Station pressure reduced to sea level with the station's elevation, like the live listener
+        row = obs_row(records[0]["timestamp"])
+        expected = tempest_udp.sea_level_pressure(row[6], ELEVATION, row[7])
+        assert records[0]["barometric_pressure"] == pytest.approx(expected, abs=0.05)
+        # The day's rain starts from zero at midnight and reaches 60 minutes of 0.1 mm
+        assert records[0]["precip_accum_local_day"] == 0
+        assert records[-1]["precip_accum_local_day"] == pytest.approx(6.0)
+
+    # A second run resumes after the completed range and fetches nothing
+    api.requests.clear()
+    assert backfill.backfill(start, end, station_id="12345", series=series) == 0
+    assert f"/observations/device/{DEVICE_ID}" not in api.requests
+
+
+def test_backfill_keeps_days_older_than_the_retention(api, tmp_path):
+    first = date.today() - timedelta(days=tsstore.TS_RETENTION_DAYS + 10)
+    series = f"retention-{tmp_path.name}"
+    store = tsstore.SeriesStore(series)
+    os.makedirs(store.directory)
+    older = (first - timedelta(days=1)).isoformat()
+    with open(store.day_path(older), "wb") as f:
+        f.write(tsstore.pack_record({"timestamp": midnight(first) - 3600}))
+
+    backfill.backfill(midnight(first), midnight(first + timedelta(days=1)), device_id=DEVICE_ID,
+                      series=series, elevation=0)
+    assert store.retention_days() == tsstore.TS_RETENTION_DAYS + 10
+
+    # The next observation starts a new day and purges the history, but not the backfilled day
+    store.append({"timestamp": time.time(), "air_temperature": 21.0})
+    assert len(store.read(first.isoformat())) == (midnight(first + timedelta(days=1)) - midnight(first)) // 60
+    assert not os.path.exists(store.day_path(older))
+
+
+def test_backfill_an_earlier_range_after_a_later_one(api, tmp_path):
+    recent = date.today() - timedelta(days=3)
+    earlier = recent - timedelta(days=10)
+    series = f"ranges-{tmp_path.name}"
+
+    assert backfill.backfill(midnight(recent), midnight(recent + timedelta(days=1)), device_id=DEVICE_ID,
+                             series=series, elevation=0) > 0
+    added = backfill.backfill(midnight(earlier), midnight(earlier + timedelta(days=1)), device_id=DEVICE_ID,
+                              series=series, elevation=0)
+
+    assert added == (midnight(earlier + timedelta(days=1)) - midnight(earlier)) // 60
+    assert len(tsstore.SeriesStore(series).read(earlier.isoformat())) == added
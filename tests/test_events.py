@@ -0,0 +1,34 @@
+import events
+
+
+def feed(engine, field, values, step):
+    fired = []
+    for i, value in enumerate(values):
+        fired += engine.process({"timestamp": 1760700000 + i * step, field: value})
+    return fired
+
+
+def test_lightning_from_rest_polled_every_five_minutes():
+    # The REST API's last hour count, polled less often than the strikes are counted
+    fired = feed(events.EventEngine(), "lightning_strike_count_last_1hr", [0, 1, 4, 6, 6], 300)
+    assert len(fired) == 1
+    assert "Lightning: 6 strikes in 15 min" in fired[0]
+
+
+def test_lightning_from_udp_hourly_count():
+    fired = feed(events.EventEngine(), "strike_count_1h", [0, 2, 4, 5], 60)
+    assert len(fired) == 1
+    assert "Lightning: 5 strikes" in fired[0]
+
+
+def test_strikes_leaving_the_hour_are_not_new_strikes():
+    fired = feed(events.EventEngine(), "lightning_strike_count_last_1hr", [40, 38, 36, 35, 37], 300)
+    assert fired == []
+
+
+def test_rain_rate_from_the_days_total():
+    # 1 mm per minute is about 2.4 in/hr, seen every minute or every five minutes alike
+    for step in (60, 300):
+        totals = [i * step / 60 for i in range(900 // step + 1)]
+        fired = feed(events.EventEngine(), "precip_accum_local_day", totals, step)
+        assert any("Heavy rain" in text for text in fired), step
@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+import alert_store
+import forecast_index
+import getwx_forecast
+import points_cache
+import txqueue
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures", "bench")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class StubInterface:
+    def __init__(self, failing=False):
+        self.failing = failing
+        self.sent = []
+
+    def sendText(self, text, **kwargs):
+        if self.failing:
+            raise OSError("node unreachable")
+        self.sent.append(text)
+
+
+@pytest.fixture
+def nws(monkeypatch, tmp_path):
+    """build_messages against the recorded forecast and alerts, with its own alert database"""
+    hourly = forecast_index.ForecastIndex.from_forecast(load_fixture("nws_forecast_hourly.json"))
+    point = {"forecastHourly": "https://nws/hourly", "forecast": "https://nws/forecast", "city": "Scottsdale",
+             "state": "AZ"}
+    monkeypatch.setattr(points_cache, "fetch", lambda lat, lon, get_json, field, load=None: (point, (hourly, None)))
+    monkeypatch.setattr(getwx_forecast, "get_json", lambda url, follow_redirects=True: load_fixture("nws_alerts.json"))
+    monkeypatch.setattr(getwx_forecast, "GRID_PRODUCTS", "")
+    store = alert_store.AlertStore
+    monkeypatch.setattr(alert_store, "AlertStore", lambda: store(str(tmp_path / "alerts.db")))
+    monkeypatch.setattr(txqueue, "RETRY_DELAY", 0)
+
+
+def send(groups, failing=False):
+    """Send the groups through a transmit queue on a stub radio; returns the texts sent"""
+    clock = txqueue.SimulatedClock()
+    interface = StubInterface(failing)
+    queue = txqueue.TxQueue(lambda: interface, clock=clock.clock, sleep=clock.sleep, ack_pacing=False)
+    queue.submit(groups, 0)
+    queue.drain()
+    return interface.sent
+
+
+def alert_texts(groups):
+    return [part for parts in groups if isinstance(parts, txqueue.AlertParts) for part in parts]
+
+
+def test_alert_recorded_only_once_sent(nws):
+    groups = getwx_forecast.build_messages(dedup=True)
+    assert any("Extreme Heat Warning" in text for text in alert_texts(groups))
+    # Selecting the alert does not record it
+    assert alert_texts(getwx_forecast.build_messages(dedup=True))
+
+    send(groups)
+    groups = getwx_forecast.build_messages(dedup=True)
+    assert alert_texts(groups) == []
+    assert any("Alerts in effect: 1" in text or "Alerts: 1" in text for parts in groups for text in parts)
+
+
+def test_alert_offered_again_after_a_failed_send(nws):
+    groups = getwx_forecast.build_messages(dedup=True)
+    assert send(groups, failing=True) == []
+    groups = getwx_forecast.build_messages(dedup=True)
+    assert alert_texts(groups)
+    send(groups)
+    assert alert_texts(getwx_forecast.build_messages(dedup=True)) == []
+
+
+def test_without_dedup_every_alert_is_listed_and_nothing_recorded(nws, tmp_path):
+    for _ in range(2):
+        groups = getwx_forecast.build_messages(dedup=False)
+        send(groups)
+        assert alert_texts(groups)
+    assert not os.path.exists(tmp_path / "alerts.db")
@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_client
+from response_cache import ResponseCache
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Serves {"path": ...} with the status in `status`, holding each request until `release` is set"""
+
+    status = 200
+    requests = []
+    arrived = threading.Event()
+    release = threading.Event()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        self.arrived.set()
+        self.release.wait(5)
+        data = json.dumps({"path": self.path}).encode("utf-8")
+        self.send_response(self.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    StandIn.status = 200
+    StandIn.requests = []
+    StandIn.arrived = threading.Event()
+    StandIn.release = threading.Event()
+    StandIn.release.set()
+    monkeypatch.setattr(http_client, "response_cache", ResponseCache(str(tmp_path / "http"), 1024 * 1024))
+    monkeypatch.setattr(http_client, "_breakers", {})
+    monkeypatch.setattr(http_client, "_deadline", None)
+    monkeypatch.setattr(http_client, "HTTP_CACHE", True)
+    monkeypatch.setattr(http_client, "HTTP_BACKOFF", 0)
+    try:
+        yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    finally:
+        StandIn.release.set()
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def breaker(failures):
+    http_client._breakers["127.0.0.1"] = http_client.CircuitBreaker(failures=failures, cooldown=60)
+    return http_client._breakers["127.0.0.1"]
+
+
+def test_breaker_opens_after_repeated_failures(server, monkeypatch):
+    monkeypatch.setattr(http_client, "HTTP_RETRIES", 5)
+    breaker(3)
+    StandIn.status = 503
+
+    # Retries stop as soon as the circuit opens, not when they run out
+    with pytest.raises(requests.exceptions.HTTPError):
+        http_client.get_json(f"{server}/failing")
+    assert len(StandIn.requests) == 3
+
+    # While it is open the host is not called at all
+    with pytest.raises(http_client.CircuitOpen):
+        http_client.get_json(f"{server}/failing")
+    assert len(StandIn.requests) == 3
+
+
+def test_stale_copy_served_while_the_breaker_is_open(server, monkeypatch):
+    monkeypatch.setattr(http_client, "HTTP_RETRIES", 0)
+    breaker(1)
+    url = f"{server}/forecast"
+    fresh = http_client.get_json(url)
+    assert fresh == {"path": "/forecast"}
+    assert http_client.stale_since(fresh) is None
+    stored_at = time.time()
+
+    # The failure opens the circuit and falls back to the cached copy
+    StandIn.status = 503
+    stale = http_client.get_json(url)
+    assert stale == fresh
+    assert stale.stale_since == pytest.approx(stored_at, abs=5)
+
+    # With the circuit open, the cached copy is served without a request
+    requests_made = len(StandIn.requests)
+    stale = http_client.get_json(url)
+    assert stale == fresh
+    assert http_client.stale_since(stale) == pytest.approx(stored_at, abs=5)
+    assert len(StandIn.requests) == requests_made
+
+
+def test_concurrent_calls_share_one_request(server):
+    StandIn.release.clear()
+    url = f"{server}/grid"
+    results = []
+
+    def fetch():
+        results.append(http_client.get_json(url))
+
+    threads = [threading.Thread(target=fetch) for _ in range(4)]
+    threads[0].start()
+    assert StandIn.arrived.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Give the followers time to find the request in flight before it completes
+    time.sleep(0.2)
+    StandIn.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert StandIn.requests == ["/grid"]
+    assert len(results) == 4
+    assert all(result is results[0] for result in results)
@@ -0,0 +1,58 @@
+import packer
+from packer import byte_len
+
+
+def test_parts_fit_the_payload_in_bytes_not_characters():
+    # "°" takes two bytes and the emoji four, so counting characters would overflow
+    fields = [f"Temp {n}°F ⛈️ storms" for n in range(20)]
+    parts = packer.pack_profiles(fields, max_bytes=60)
+    assert len(parts) > 1
+    assert all(byte_len(part) <= 60 for part in parts)
+    assert all(len(part) < 60 for part in parts)
+    # Every field survives whole, in order, behind its "i/n " marker
+    bodies = [part.split(" ", 1)[1] for part in parts]
+    assert " | ".join(bodies).split(" | ") == fields
+    assert [part.split(" ", 1)[0] for part in parts] == [f"{i}/{len(parts)}" for i in range(1, len(parts) + 1)]
+
+
+def test_oversized_field_is_cut_on_a_character_boundary():
+    parts = packer.pack_profiles(["°" * 50], max_bytes=30)
+    assert all(byte_len(part) <= 30 for part in parts)
+    assert "".join(part.split(" ", 1)[1] for part in parts) == "°" * 50
+
+
+def test_verbose_profile_used_when_it_fits_in_one_packet():
+    fields = [("Temperature: 72°F", "T72"), ("Humidity: 40%", "H40")]
+    assert packer.pack_profiles(fields, max_bytes=200) == ["Temperature: 72°F | Humidity: 40%"]
+
+
+def test_compact_profile_used_when_it_takes_fewer_packets():
+    fields = [("Temperature: 72°F", "T72"), ("Humidity: 40%", "H40"), "🌧"]
+    assert packer.pack_profiles(fields, compact_sep=" ", max_bytes=24) == ["T72 H40 🌧"]
+
+
+def test_verbose_profile_kept_when_compact_saves_nothing():
+    fields = [("Temperature: 72°F", "Temp: 72°F"), "Humidity: 40%"]
+    parts = packer.pack_profiles(fields, max_bytes=24)
+    assert parts == ["1/2 Temperature: 72°F", "2/2 Humidity: 40%"]
+
+
+def test_highest_priority_fields_dropped_first_to_fit_max_parts(capsys):
+    fields = [
+        ("Temperature: 72°F", "Temperature: 72°F", 0),
+        ("Wind: 5 mph", "Wind: 5 mph", 2),
+        ("Humidity: 40%", "Humidity: 40%", 1),
+        ("UV index: 3", "UV index: 3", 2),
+        "Storms ⛈️",
+    ]
+    parts = packer.pack_profiles(fields, max_bytes=50, max_parts=1)
+    # Both priority 2 fields go (the later one first); the priority 1 field is kept
+    assert parts == ["Temperature: 72°F | Humidity: 40% | Storms ⛈️"]
+    assert "Dropped 2 low-priority field(s) to fit 1 packet(s)" in capsys.readouterr().out
+
+
+def test_fields_without_a_priority_are_never_dropped():
+    fields = [("Temperature: 72°F", "Temp 72°F", 0), "Storms ⛈️ nearby", ("Wind: 5 mph", "W5", 1)]
+    parts = packer.pack_profiles(fields, max_bytes=24, max_parts=1)
+    # Dropping the wind isn't enough, but the rest stays rather than being cut further
+    assert parts == ["1/2 Temperature: 72°F", "2/2 Storms ⛈️ nearby"]
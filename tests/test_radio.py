@@ -0,0 +1,117 @@
+import os
+
+import pytest
+
+import outbox
+import radio
+import txqueue
+
+
+class StubInterface:
+    def __init__(self, failing=False):
+        self.failing = failing
+        self.sent = []
+
+    def sendText(self, text, channelIndex=0, **kwargs):
+        if self.failing:
+            raise OSError("node unreachable")
+        self.sent.append((channelIndex, text))
+
+    def close(self):
+        pass
+
+
+class StubTarget:
+    def __init__(self, label, channels=None, failing=False):
+        self.label = label
+        self.channels = channels
+        self.interface = StubInterface(failing)
+
+    def open(self):
+        return self.interface
+
+    def channels_for(self, channel_index):
+        return self.channels or [int(channel_index)]
+
+
+@pytest.fixture
+def no_outbox(monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX", False)
+    monkeypatch.setattr(txqueue, "RETRY_DELAY", 0)
+
+
+@pytest.fixture
+def link(tmp_path):
+    """A RadioLink with an outbox in the test CACHE_DIR and a queue that paces on a simulated clock"""
+    interface = StubInterface()
+    state = {"reachable": True}
+
+    def opener():
+        if not state["reachable"]:
+            raise OSError("node unreachable")
+        return interface
+
+    store = outbox.Outbox(path=os.path.join(outbox.CACHE_DIR, f"outbox-{tmp_path.name}.db"))
+    link = radio.RadioLink(opener=opener, label="tcp:node", outbox=store)
+    clock = txqueue.SimulatedClock()
+    link.queue = txqueue.TxQueue(link._interface_for_send, on_error=link._send_failed, label=link.label,
+                                 on_done=link._packet_done, clock=clock.clock, sleep=clock.sleep)
+    link.interface_stub = interface
+    link.state = state
+    return link
+
+
+def test_alert_accepted_once_every_target_sent_it(no_outbox):
+    accepted = []
+    targets = [StubTarget("tcp:a"), StubTarget("tcp:b", channels=[1, 2])]
+    alert = txqueue.alert(["part 1", "part 2"], on_accepted=lambda: accepted.append(True))
+    radio.send_all([([["report"], alert], 0)], targets=targets)
+    assert targets[0].interface.sent == [(0, "part 1"), (0, "part 2"), (0, "report")]
+    assert sorted(targets[1].interface.sent) == [(1, "part 1"), (1, "part 2"), (1, "report"),
+                                                 (2, "part 1"), (2, "part 2"), (2, "report")]
+    assert accepted == [True]
+
+
+def test_alert_missed_by_one_target_is_not_accepted(no_outbox):
+    accepted = []
+    targets = [StubTarget("tcp:a"), StubTarget("tcp:b", failing=True)]
+    alert = txqueue.alert(["part 1"], on_accepted=lambda: accepted.append(True))
+    statuses = radio.send_all([([alert], 0)], targets=targets)
+    assert [s["result"] for s in statuses] == ["delivered", "partial"]
+    assert targets[0].interface.sent == [(0, "part 1")]
+    assert accepted == []
+
+
+def test_report_queued_while_unreachable_is_replaced_not_duplicated(link):
+    link.state["reachable"] = False
+    for report in ("Temp 70F", "Temp 72F"):
+        link.outbox.put("tcp:node", 0, [[report]], key="getwx")
+        link.pump()
+    assert link._inflight == {}
+    assert link.outbox.pending("tcp:node") == 1
+
+    link.state["reachable"] = True
+    link._retry_at = 0.0
+    assert link.check()
+    link.queue.drain()
+    assert link.interface_stub.sent == [(0, "Temp 72F")]
+    assert link.outbox.pending("tcp:node") == 0
+
+
+def test_alert_joins_the_item_in_flight(link):
+    link.outbox.put("tcp:node", 0, [["1/2 forecast", "2/2 forecast"]], key="forecast")
+    link.outbox.put("tcp:node", 0, [["Temp 72F"]], key="getwx")
+    link.pump()
+    assert len(link._inflight) == 1
+
+    # The alert goes straight to the queue; the second report waits for the first to finish
+    link.outbox.put("tcp:node", 0, [txqueue.alert(["Tornado warning"])])
+    link.pump()
+    assert len(link._inflight) == 2
+    assert len(link.queue.heap) == 3
+
+    link.queue.drain()
+    assert link.interface_stub.sent == [(0, "Tornado warning"), (0, "1/2 forecast"), (0, "2/2 forecast"),
+                                        (0, "Temp 72F")]
+    assert link.outbox.pending("tcp:node") == 0
+    assert link._inflight == {}
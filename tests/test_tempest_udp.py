@@ -0,0 +1,98 @@
+import json
+import os
+import socket
+import time
+
+import pytest
+
+import tempest_udp
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures", "tempest_udp.jsonl")
+
+
+def fixture_lines():
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def check_capture(listener):
+    """What the listener should hold after the whole capture: six one-minute observations ending at 1760700300"""
+    obs = listener.observation()
+    assert obs["timestamp"] == 1760700300
+    assert obs["air_temperature"] == pytest.approx(36.6)
+    assert obs["wind_gust"] == pytest.approx(1.27)
+    # Two observations with 0.25 mm each
+    assert obs["precip_accum_local_day"] == pytest.approx(0.5)
+    assert obs["strike_count_1h"] == 2
+    assert obs["barometric_pressure"] == pytest.approx(1017.07)
+    # Five minutes of history is too short for a 3 hour trend
+    assert obs["pressure_trend"] == "unknown"
+    # The last rapid_wind is older than the last observation, so the observation's own wind stands
+    assert obs["wind_avg"] == pytest.approx(0.72)
+    assert [ts for ts, _, _ in listener.recent_strikes()] == [1760700250]
+    assert [o["timestamp"] for o in listener.history()] == list(range(1760700000, 1760700301, 60))
+
+
+def test_handle_packet_replays_capture():
+    listener = tempest_udp.TempestListener(port=0, elevation=0)
+    seen = []
+    listener.observers.append(seen.append)
+    for line in fixture_lines():
+        listener.handle_packet(line.encode("utf-8"))
+    assert listener.packets == len(fixture_lines())
+    assert len(seen) == 6
+    check_capture(listener)
+
+
+def test_rapid_wind_newer_than_observation_is_applied():
+    listener = tempest_udp.TempestListener(port=0, elevation=0)
+    for line in fixture_lines():
+        listener.handle_packet(line)
+    listener.handle_packet(json.dumps({"type": "rapid_wind", "ob": [1760700310, 4.2, 200]}))
+    obs = listener.observation()
+    assert (obs["wind_avg"], obs["wind_direction"]) == (4.2, 200)
+
+
+@pytest.mark.parametrize("data", [
+    b"\xff not json",
+    b'{"type": "device_status"}',
+    b'{"type": "rapid_wind"}',
+    b'{"type": "rapid_wind", "ob": 5}',
+    b'{"type": "evt_strike", "evt": [1]}',
+    b'{"type": "obs_st", "obs": [[1760700000, 0.18, 0.22]]}',
+    b'{"type": "obs_st", "obs": [null]}',
+    b'[1, 2, 3]',
+    b'"obs_st"',
+])
+def test_bad_datagrams_are_ignored(data):
+    listener = tempest_udp.TempestListener(port=0, elevation=0)
+    listener.handle_packet(data)
+    assert listener.observation() is None
+    assert listener.recent_strikes() == []
+    # The listener keeps going with the next good packet
+    for line in fixture_lines():
+        listener.handle_packet(line)
+    check_capture(listener)
+
+
+def test_replay_over_udp():
+    port = free_port()
+    listener = tempest_udp.TempestListener(port=port, elevation=0)
+    listener.start()
+    try:
+        time.sleep(0.2)
+        sent = tempest_udp.replay(FIXTURE, host="127.0.0.1", port=port)
+        assert sent == len(fixture_lines())
+        deadline = time.monotonic() + 5
+        while listener.packets < sent and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        listener.stop()
+    assert listener.packets == sent
+    check_capture(listener)
@@ -0,0 +1,109 @@
+from datetime import datetime
+
+import pytest
+
+import packer
+import records
+import templates
+
+OBS = {
+    "timestamp": 1760700000,
+    "air_temperature": 20.0,
+    "feels_like": 18.5,
+    "relative_humidity": 55,
+    "barometric_pressure": 1013.2,
+    "pressure_trend": "steady",
+    "wind_avg": 4.5,
+    "wind_direction": 270,
+    "precip_accum_local_day": 2.54,
+    "strike_count": 3,
+    "solar_radiation": 500,
+}
+PANEL_POWER = 75.0
+
+
+def inline_fields(obs, label):
+    """getwx's (verbose, compact) fields as they were written inline before templates"""
+    local = datetime.fromtimestamp(obs["timestamp"]).strftime("%H:%M")
+    temp_f = (obs["air_temperature"] * 9/5) + 32
+    feel_f = (obs["feels_like"] * 9/5) + 32
+    humidity = obs["relative_humidity"]
+    pressure_inHg = obs["barometric_pressure"] * 0.02953
+    trend = obs["pressure_trend"]
+    wind_speed_mph = obs["wind_avg"] * 2.23694
+    wind_direction = obs["wind_direction"]
+    rainfall_in = obs["precip_accum_local_day"] * 0.03937
+    lightning_strikes = obs["strike_count"]
+    solar_radiation = obs["solar_radiation"]
+    panel_power = PANEL_POWER
+    return [
+        (f"WX {label} as of {local}: Temp:{temp_f:.0f}°F", f"WX {label} {local} T:{temp_f:.0f}F"),
+        (f"Feels Like: {feel_f:.0f}°F", f"FL:{feel_f:.0f}F"),
+        (f"Humidity:{humidity}%", f"H:{humidity}%"),
+        # The barometer unit now reads 'inHg', like nws_current_weather's
+        (f"Barometer:{pressure_inHg:.2f} inHg and {trend}", f"B:{pressure_inHg:.2f} {trend}"),
+        (f"Wind:{wind_speed_mph:.0f} mph at {wind_direction}°", f"W:{wind_speed_mph:.0f}mph@{wind_direction}"),
+        (f"Rain:{rainfall_in:.2f} in", f"R:{rainfall_in:.2f}in"),
+        (f"Lightning Strikes:{lightning_strikes}", f"L:{lightning_strikes}"),
+        (f"Solar Index:{solar_radiation} W/m²", f"S:{solar_radiation}W/m2"),
+        (f"Est panel power:{panel_power:.2f} W", f"PV:{panel_power:.1f}W"),
+    ]
+
+
+@pytest.fixture
+def fresh(monkeypatch):
+    """An empty compiled-template cache without TEMPLATES_FILE overrides, counting compilations"""
+    compiled = []
+
+    class Counting(templates.Template):
+        def __init__(self, name, spec, units):
+            compiled.append((name, units))
+            super().__init__(name, spec, units)
+
+    monkeypatch.setattr(templates, "_compiled", {})
+    monkeypatch.setattr(templates, "_overrides", {})
+    monkeypatch.setattr(templates, "Template", Counting)
+    return compiled
+
+
+def test_templates_compile_once_per_units_profile(fresh):
+    imperial = templates.get("tempest_current", "imperial")
+    assert templates.get("tempest_current", "IMPERIAL") is imperial
+    metric = templates.get("tempest_current", "metric")
+    assert metric is not imperial
+    assert templates.get("tempest_current", "metric") is metric
+    assert fresh == [("tempest_current", "imperial"), ("tempest_current", "metric")]
+
+
+def test_unknown_units_profile_is_rejected(fresh):
+    with pytest.raises(ValueError, match="Unknown units"):
+        templates.get("tempest_current", "furlongs")
+
+
+def test_rendering_matches_the_inline_strings(fresh):
+    record = records.from_observation(OBS, label="Home", panel_power=PANEL_POWER)
+    template = templates.get("tempest_current", "imperial")
+    fields = template.render(record)
+    expected = inline_fields(OBS, "Home")
+    assert [(verbose, compact) for verbose, compact, _ in fields] == expected
+    # Both wordings pack into the same packets
+    for max_bytes in (packer.MAX_PAYLOAD_BYTES, 60):
+        assert (packer.pack_profiles(fields, sep=" | ", compact_sep=" ", max_bytes=max_bytes)
+                == packer.pack_profiles(expected, sep=" | ", compact_sep=" ", max_bytes=max_bytes))
+
+
+def test_rendering_in_metric_units(fresh):
+    record = records.from_observation(OBS, label="Home", panel_power=PANEL_POWER)
+    local = datetime.fromtimestamp(OBS["timestamp"]).strftime("%H:%M")
+    fields = templates.get("tempest_current", "metric").render(record)
+    assert [(verbose, compact) for verbose, compact, _ in fields] == [
+        (f"WX Home as of {local}: Temp:20°C", f"WX Home {local} T:20C"),
+        ("Feels Like: 18°C", "FL:18C"),
+        ("Humidity:55%", "H:55%"),
+        ("Barometer:1013 hPa and steady", "B:1013 steady"),
+        ("Wind:16 km/h at 270°", "W:16km/h@270"),
+        ("Rain:2.5 mm", "R:2.5mm"),
+        ("Lightning Strikes:3", "L:3"),
+        ("Solar Index:500 W/m²", "S:500W/m2"),
+        ("Est panel power:75.00 W", "PV:75.0W"),
+    ]
@@ -0,0 +1,194 @@
+import pytest
+
+import txqueue
+
+
+class FakeInterface:
+    """Records what a meshtastic interface is asked to send, and when on the simulated clock"""
+
+    def __init__(self, clock, failures=0):
+        self.clock = clock
+        self.failures = failures
+        self.sent = []
+
+    def _send(self, payload, kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("radio busy")
+        self.sent.append((self.clock.now, payload, kwargs))
+
+    def sendText(self, text, **kwargs):
+        self._send(text, kwargs)
+
+    def sendData(self, data, **kwargs):
+        self._send(data, kwargs)
+
+
+@pytest.fixture
+def radio():
+    clock = txqueue.SimulatedClock()
+    return clock, FakeInterface(clock)
+
+
+def make_queue(clock, interface, **kwargs):
+    kwargs.setdefault("ack_pacing", False)
+    return txqueue.TxQueue(lambda: interface, clock=clock.clock, sleep=clock.sleep, **kwargs)
+
+
+def test_alerts_go_before_routine_packets_queued_earlier(radio):
+    clock, interface = radio
+    queue = make_queue(clock, interface)
+    queue.submit([["r1", "r2"]], 0)
+    queue.submit([txqueue.alert(["a1", "a2"])], 0)
+    queue.drain()
+    assert [payload for _, payload, _ in interface.sent] == ["a1", "a2", "r1", "r2"]
+    assert queue.packets_sent == 4
+
+
+def test_duty_cycle_and_minimum_gap(radio):
+    clock, interface = radio
+    # The bucket holds 2 seconds of airtime and refills at 0.1 s per second
+    queue = make_queue(clock, interface, duty_cycle=0.1, window=20, min_gap=0.5)
+    payload = "x" * 150
+    each = txqueue.airtime(len(payload))
+    queue.submit([[payload] * 5], 0)
+    queue.drain()
+
+    times = [t for t, _, _ in interface.sent]
+    assert len(times) == 5
+    for earlier, later in zip(times, times[1:]):
+        assert later - earlier >= each + 0.5 - 1e-6
+    # Airtime sent by any moment never exceeds the bucket plus what it refilled since the start
+    for count, t in enumerate(times, start=1):
+        assert count * each <= 2.0 + 0.1 * t + each + 1e-6
+    assert times[-1] > 4 * (each + 0.5)
+
+
+def test_binary_payloads_and_direct_messages(radio):
+    clock, interface = radio
+    queue = make_queue(clock, interface, binary_portnum=300)
+    queue.submit([[b"\x01\x02"]], 2, destination="!abcd1234")
+    queue.drain()
+    (_, payload, kwargs), = interface.sent
+    assert payload == b"\x01\x02"
+    assert kwargs == {"channelIndex": 2, "destinationId": "!abcd1234", "portNum": 300}
+
+
+def test_failed_send_is_retried_in_order_after_a_delay(radio):
+    clock, interface = radio
+    interface.failures = 1
+    done = []
+    queue = make_queue(clock, interface, on_done=lambda packet, sent: done.append((packet.payload, sent)))
+    queue.submit([["part 1", "part 2"]], 0)
+    queue.drain()
+    assert [payload for _, payload, _ in interface.sent] == ["part 1", "part 2"]
+    assert interface.sent[0][0] >= txqueue.RETRY_DELAY
+    assert done == [("part 1", True), ("part 2", True)]
+
+
+def test_alert_is_accepted_once_every_part_is_sent(radio):
+    clock, interface = radio
+    accepted = []
+    queue = make_queue(clock, interface)
+    parts = txqueue.alert(["a1", "a2"], on_accepted=lambda: accepted.append(clock.now))
+    queue.submit([parts], 0)
+    queue.send_next()
+    assert accepted == []
+    queue.drain()
+    assert accepted == [interface.sent[-1][0]]
+    # Submitting the same alert again, e.g. to a second node, does not accept it twice
+    queue.submit([parts], 0)
+    queue.drain()
+    assert len(accepted) == 1
+
+
+def test_dropped_alert_is_never_accepted(radio):
+    clock, interface = radio
+    interface.failures = txqueue.MAX_ATTEMPTS
+    accepted, done = [], []
+    queue = make_queue(clock, interface, on_done=lambda packet, sent: done.append((packet.payload, sent)))
+    queue.submit([txqueue.alert(["a1", "a2"], on_accepted=lambda: accepted.append(True))], 0)
+    queue.drain()
+    # a1 fails every attempt; a2 waits behind it and is then sent
+    assert done == [("a1", False), ("a2", True)]
+    assert queue.dropped == 1
+    assert accepted == []
+    assert queue.unsent == {}
+
+
+def test_retry_holds_back_only_its_own_message(radio):
+    clock, interface = radio
+    interface.failures = 1
+    queue = make_queue(clock, interface)
+    queue.submit([["r1", "r2"]], 0)
+    queue.submit([["other"]], 0)
+    queue.send_next()
+    # r1 failed and waits; r2 waits behind it, but an alert and another message go ahead
+    queue.submit([txqueue.alert(["alert"])], 0)
+    queue.drain()
+    sent = [(t, payload) for t, payload, _ in interface.sent]
+    assert [payload for _, payload in sent] == ["alert", "other", "r1", "r2"]
+    assert sent[1][0] < txqueue.RETRY_DELAY <= sent[2][0]
+
+
+class AckingClock(txqueue.SimulatedClock):
+    """A simulated clock that delivers the node's acks when their time comes"""
+
+    def __init__(self):
+        super().__init__()
+        self.due = []
+
+    def sleep(self, seconds):
+        super().sleep(seconds)
+        for entry in [e for e in self.due if e[0] <= self.now]:
+            self.due.remove(entry)
+            entry[1]({"decoded": {"routing": {"errorReason": "NONE"}}})
+
+
+class AckingInterface(FakeInterface):
+    def __init__(self, clock, ack_after):
+        super().__init__(clock)
+        self.ack_after = ack_after
+
+    def sendText(self, text, **kwargs):
+        super().sendText(text, **kwargs)
+        if self.ack_after is not None:
+            self.clock.due.append((self.clock.now + self.ack_after, kwargs["onResponse"]))
+
+
+def test_ack_pacing_waits_for_the_ack():
+    clock = AckingClock()
+    interface = AckingInterface(clock, ack_after=3.0)
+    queue = make_queue(clock, interface, ack_pacing=True, ack_timeout=30, min_gap=0)
+    queue.submit([["one", "two"]], 0)
+    queue.drain()
+    (first, _, kwargs), (second, _, _) = interface.sent
+    assert kwargs["wantAck"] is True
+    assert 3.0 <= second - first < 3.0 + txqueue.ACK_POLL + 1e-6
+    assert (queue.acks, queue.ack_timeouts) == (2, 0)
+
+
+def test_ack_timeout_moves_on():
+    clock = AckingClock()
+    interface = AckingInterface(clock, ack_after=None)
+    queue = make_queue(clock, interface, ack_pacing=True, ack_timeout=30, min_gap=0)
+    queue.submit([["one", "two"]], 0)
+    queue.drain()
+    (first, _, _), (second, _, _) = interface.sent
+    assert second - first == pytest.approx(30.0)
+    assert (queue.acks, queue.ack_timeouts) == (0, 2)
+
+
+def test_alert_on_several_channels_waits_for_all_of_them(radio):
+    clock, interface = radio
+    accepted = []
+    queue = make_queue(clock, interface)
+    parts = txqueue.alert(["a1", "a2"], on_accepted=lambda: accepted.append(True))
+    txqueue.expect_handoffs([parts], 2)
+    queue.submit([parts], 1)
+    queue.submit([parts], 2)
+    for _ in range(3):
+        queue.send_next()
+    assert accepted == []
+    queue.drain()
+    assert accepted == [True]
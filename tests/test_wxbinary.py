@@ -0,0 +1,108 @@
+import struct
+
+import pytest
+
+import wxbinary
+
+FULL = {
+    "temperature": 21.3,
+    "feels_like": -4.5,
+    "humidity": 67,
+    "pressure": 1013.2,
+    "wind_avg": 3.4,
+    "wind_gust": 12.7,
+    "wind_direction": 275,
+    "rain_day": 4.2,
+    "strike_count": 17,
+    "solar_radiation": 812,
+    "uv": 6.3,
+    "pressure_trend": "falling",
+    "temp_high": 33.9,
+    "temp_low": -12.1,
+    "precip_probability": 40,
+}
+
+
+def test_round_trip_every_field():
+    payload = wxbinary.encode(wxbinary.TEMPEST_OBS, 1717000000, FULL)
+    assert len(payload) == wxbinary.HEADER.size + 26
+    report = wxbinary.decode(payload)
+    assert report.pop("version") == wxbinary.VERSION
+    assert report.pop("report_type") == "tempest_obs"
+    assert report.pop("timestamp") == 1717000000
+    assert report.keys() == FULL.keys()
+    for name, value in FULL.items():
+        assert report[name] == pytest.approx(value), name
+
+
+def test_absent_fields_are_left_out_of_the_bitmap():
+    values = {"temperature": 18.0, "wind_gust": None, "uv": 2.0, "pressure_trend": "rising"}
+    payload = wxbinary.encode(wxbinary.NWS_OBS, 1717000000, values)
+    bitmap = wxbinary.HEADER.unpack_from(payload)[3]
+    expected = {wxbinary.FIELD_INDEX[name] for name in ("temperature", "uv", "pressure_trend")}
+    assert {idx for idx in range(len(wxbinary.FIELDS)) if bitmap & (1 << idx)} == expected
+    assert len(payload) == wxbinary.HEADER.size + 2 + 1 + 1
+    assert wxbinary.decode(payload) == {
+        "version": wxbinary.VERSION,
+        "report_type": "nws_obs",
+        "timestamp": 1717000000,
+        "temperature": 18.0,
+        "uv": 2.0,
+        "pressure_trend": "rising",
+    }
+
+
+def test_no_fields():
+    payload = wxbinary.encode(wxbinary.DAILY_FORECAST, 0, {})
+    assert payload == wxbinary.HEADER.pack(wxbinary.VERSION, wxbinary.DAILY_FORECAST, 0, 0)
+    assert wxbinary.decode(payload)["report_type"] == "daily_forecast"
+
+
+def test_unknown_pressure_trend_is_sent_as_unknown():
+    payload = wxbinary.encode(wxbinary.NWS_OBS, 0, {"pressure_trend": "sideways"})
+    assert wxbinary.decode(payload)["pressure_trend"] == "unknown"
+
+
+@pytest.mark.parametrize("name, value, expected", [
+    ("temperature", 5000.0, 3276.7),
+    ("temperature", -5000.0, -3276.8),
+    ("humidity", 300, 255),
+    ("humidity", -5, 0),
+    ("wind_gust", -1.0, 0.0),
+    ("wind_gust", 10000.0, 6553.5),
+    ("uv", 30.0, 25.5),
+    ("strike_count", 100000, 65535),
+])
+def test_values_are_clamped_to_the_field_range(name, value, expected):
+    report = wxbinary.decode(wxbinary.encode(wxbinary.TEMPEST_OBS, 0, {name: value}))
+    assert report[name] == pytest.approx(expected)
+
+
+def test_rejects_unknown_version():
+    payload = bytearray(wxbinary.encode(wxbinary.TEMPEST_OBS, 0, {"temperature": 1.0}))
+    payload[0] = wxbinary.VERSION + 1
+    with pytest.raises(ValueError, match="Unsupported payload version"):
+        wxbinary.decode(bytes(payload))
+
+
+def test_rejects_short_payload():
+    with pytest.raises(ValueError, match="too short"):
+        wxbinary.decode(struct.pack("<BB", wxbinary.VERSION, wxbinary.TEMPEST_OBS))
+
+
+@pytest.mark.parametrize("fmt, expected", [
+    ("text", [["report"]]),
+    ("binary", [["payload"]]),
+    ("BOTH", [["report"], ["payload"]]),
+])
+def test_with_payload(monkeypatch, fmt, expected):
+    monkeypatch.setattr(wxbinary, "PAYLOAD_FORMAT", fmt)
+    payload = wxbinary.encode(wxbinary.TEMPEST_OBS, 0, {"temperature": 1.0})
+    groups = wxbinary.with_payload([["report"]], wxbinary.TEMPEST_OBS, 0, {"temperature": 1.0})
+    assert groups == [[payload if part == "payload" else part for part in parts] for parts in expected]
+
+
+def test_with_payload_rejects_unknown_format(monkeypatch):
+    monkeypatch.setattr(wxbinary, "PAYLOAD_FORMAT", "protobuf")
+    with pytest.raises(ValueError, match="Unknown PAYLOAD_FORMAT 'protobuf'"):
+        wxbinary.with_payload([["report"]], wxbinary.TEMPEST_OBS, 0, {})
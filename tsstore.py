@@ -0,0 +1,318 @@
+"""Append-only local store of normalized observations with running rollups.
+
+Each series (one station) is a directory holding one binary file per local
+day, made of fixed-size records:
+
+    uint32 epoch seconds, then every FIELDS entry fixed-point scaled
+
+Missing values are written as the type's sentinel. Alongside the day files
+a small rollup.json holds today's running min/max temperature, peak gust,
+rain total and a thinned 3 hour pressure history; it is updated in constant
+time per sample, so reports never rescan the day files.
+"""
+import json
+import struct
+import threading
+import os
+from collections import deque
+from datetime import date, datetime
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+TS_ENABLED = os.getenv("TS_ENABLED", "true").lower() in ("1", "true", "yes")  # Record observations and rollups
+TS_DIR = os.getenv("TS_DIR", os.path.join(CACHE_DIR, "timeseries"))
+TS_RETENTION_DAYS = int(os.getenv("TS_RETENTION_DAYS", "30"))  # Day files older than this are deleted, at least
+
+TENDENCY_SECONDS = 3 * 3600
+TENDENCY_SPACING = 600  # Keep at most one pressure sample per 10 minutes for the tendency
+
+# (observation field, scale, struct format) - value is stored as round(value * scale)
+FIELDS = [
+    ("air_temperature", 10, "h"),
+    ("relative_humidity", 1, "B"),
+    ("barometric_pressure", 10, "H"),
+    ("wind_avg", 10, "H"),
+    ("wind_gust", 10, "H"),
+    ("wind_direction", 1, "H"),
+    ("precip_accum_local_day", 10, "H"),
+    ("solar_radiation", 1, "H"),
+    ("strike_count", 1, "H"),
+]
+RECORD = struct.Struct("<I" + "".join(fmt for _, _, fmt in FIELDS))
+MISSING = {"h": -32768, "H": 65535, "B": 255}
+LIMITS = {"h": (-32767, 32767), "H": (0, 65534), "B": (0, 254)}
+NUMPY_TYPES = {"h": "<i2", "H": "<u2", "B": "u1"}
+
+_lock = threading.Lock()
+_record_dtype = None
+
+
+def record_dtype():
+    """numpy dtype of a record, for reading or writing a whole day file at once"""
+    global _record_dtype
+    if _record_dtype is None:
+        # Imported here so the report scripts don't load numpy
+        import numpy as np
+        _record_dtype = np.dtype([("timestamp", "<u4")] + [(name, NUMPY_TYPES[fmt]) for name, _, fmt in FIELDS])
+        assert _record_dtype.itemsize == RECORD.size
+    return _record_dtype
+
+
+def series_name(station_id, source="rest"):
+    """Series for a Tempest station's observations; the local hub's broadcasts (TEMPEST_SOURCE=udp) have their own"""
+    return "tempest-local" if source.lower() == "udp" else f"tempest-{station_id}"
+
+
+def pack_record(obs):
+    values = [int(obs["timestamp"])]
+    for name, scale, fmt in FIELDS:
+        value = obs.get(name)
+        if isinstance(value, (int, float)):
+            low, high = LIMITS[fmt]
+            values.append(max(low, min(high, int(round(value * scale)))))
+        else:
+            values.append(MISSING[fmt])
+    return RECORD.pack(*values)
+
+
+def unpack_record(raw):
+    values = RECORD.unpack(raw)
+    obs = {"timestamp": values[0]}
+    for (name, scale, fmt), value in zip(FIELDS, values[1:]):
+        obs[name] = None if value == MISSING[fmt] else value / scale
+    return obs
+
+
+def new_rollup(day):
+    return {
+        "day": day,
+        "last_ts": None,
+        "samples": 0,
+        "temp_min": None,
+        "temp_max": None,
+        "gust_max": None,
+        "gust_ts": None,
+        "rain_day": None,
+        "pressure": [],
+    }
+
+
+def pressure_tendency(rollup):
+    """hPa change over the last 3 hours, or None until 3 hours of history exist"""
+    history = rollup.get("pressure") or []
+    if len(history) < 2:
+        return None
+    (old_ts, old_p), (new_ts, new_p) = history[0], history[-1]
+    # The baseline must be close to 3 hours old; after a long gap there is no tendency
+    if not TENDENCY_SECONDS - TENDENCY_SPACING <= new_ts - old_ts <= TENDENCY_SECONDS + 3600:
+        return None
+    return new_p - old_p
+
+
+def tendency_trend(change):
+    """Classify a 3 hour pressure change like Tempest's pressure_trend"""
+    if change is None:
+        return None
+    if change <= -1.0:
+        return "falling"
+    if change >= 1.0:
+        return "rising"
+    return "steady"
+
+
+class SeriesStore:
+    """Observations and rollups for one station"""
+
+    def __init__(self, name, directory=TS_DIR):
+        self.name = name
+        self.directory = os.path.join(directory, name)
+        self.rollup_file = os.path.join(self.directory, "rollup.json")
+        self.retention_file = os.path.join(self.directory, "retention.json")
+
+    def day_path(self, day):
+        """Path of the record file for a day (YYYY-MM-DD)"""
+        return os.path.join(self.directory, f"{day}.bin")
+
+    def _load_rollup(self):
+        try:
+            with open(self.rollup_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_rollup(self, rollup):
+        tmp_file = f"{self.rollup_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(rollup, f)
+        os.replace(tmp_file, self.rollup_file)
+
+    def retention_days(self):
+        """Days of history kept: TS_RETENTION_DAYS, or more if keep_days() asked for it"""
+        try:
+            with open(self.retention_file, "r", encoding="utf-8") as f:
+                return max(TS_RETENTION_DAYS, int(json.load(f)["days"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            return TS_RETENTION_DAYS
+
+    def keep_days(self, days):
+        """Keep at least days of history from now on, e.g. to cover a backfilled range"""
+        if days <= self.retention_days():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_file = f"{self.retention_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"days": int(days)}, f)
+        os.replace(tmp_file, self.retention_file)
+
+    def _purge(self, today):
+        cutoff = date.fromisoformat(today).toordinal() - self.retention_days()
+        for filename in os.listdir(self.directory):
+            stem, ext = os.path.splitext(filename)
+            if ext != ".bin":
+                continue
+            try:
+                if date.fromisoformat(stem).toordinal() < cutoff:
+                    os.remove(os.path.join(self.directory, filename))
+            except ValueError:
+                continue
+
+    def append(self, obs):
+        """Store an observation and update the rollups; returns the rollup.
+
+        Observations without a timestamp, or not newer than the last one
+        stored (polled sources repeat until a new observation is published),
+        are not stored again.
+        """
+        ts = obs.get("timestamp")
+        with _lock:
+            os.makedirs(self.directory, exist_ok=True)
+            rollup = self._load_rollup()
+            if not isinstance(ts, (int, float)) or (rollup and rollup["last_ts"] and ts <= rollup["last_ts"]):
+                return rollup
+
+            day = datetime.fromtimestamp(ts).date().isoformat()
+            if rollup is None or rollup["day"] != day:
+                pressure = rollup["pressure"] if rollup else []
+                rollup = new_rollup(day)
+                # The pressure tendency carries across midnight
+                rollup["pressure"] = pressure
+                self._purge(day)
+
+            with open(self.day_path(day), "ab") as f:
+                f.write(pack_record(obs))
+
+            self._update(rollup, ts, obs)
+            self._save_rollup(rollup)
+            return rollup
+
+    def _update(self, rollup, ts, obs):
+        rollup["last_ts"] = ts
+        rollup["samples"] += 1
+
+        temperature = obs.get("air_temperature")
+        if isinstance(temperature, (int, float)):
+            if rollup["temp_min"] is None or temperature < rollup["temp_min"]:
+                rollup["temp_min"] = temperature
+            if rollup["temp_max"] is None or temperature > rollup["temp_max"]:
+                rollup["temp_max"] = temperature
+
+        gust = obs.get("wind_gust")
+        if isinstance(gust, (int, float)) and (rollup["gust_max"] is None or gust > rollup["gust_max"]):
+            rollup["gust_max"] = gust
+            rollup["gust_ts"] = ts
+
+        rain = obs.get("precip_accum_local_day")
+        if isinstance(rain, (int, float)):
+            # Already a daily accumulation; keep the largest seen in case of a late reset
+            rollup["rain_day"] = rain if rollup["rain_day"] is None else max(rollup["rain_day"], rain)
+
+        pressure = obs.get("barometric_pressure")
+        if isinstance(pressure, (int, float)):
+            history = deque(rollup["pressure"])
+            if not history or ts - history[-1][0] >= TENDENCY_SPACING:
+                history.append([ts, pressure])
+            # Keep exactly one sample from before the 3 hour mark as the baseline
+            while len(history) > 1 and history[1][0] <= ts - TENDENCY_SECONDS:
+                history.popleft()
+            rollup["pressure"] = list(history)
+        rollup["pressure_tendency"] = pressure_tendency(rollup)
+
+    def rollup(self):
+        """Today's rollup, or None if nothing has been stored today"""
+        with _lock:
+            rollup = self._load_rollup()
+        if rollup is None or rollup["day"] != date.today().isoformat():
+            return None
+        return rollup
+
+    def replace_day(self, day, data):
+        """Atomically replace a day's records with already packed, time-ordered data"""
+        with _lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.day_path(day)
+            tmp_file = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_file, "wb") as f:
+                f.write(data)
+            os.replace(tmp_file, path)
+
+    def merge_rollup(self, summary):
+        """Fold a summary of a whole day written in bulk into the rollup.
+
+        summary holds day, samples, last_ts, temp_min, temp_max, gust_max,
+        gust_ts and rain_day for every record now stored for that day. Days
+        older than the current rollup are ignored.
+        """
+        with _lock:
+            rollup = self._load_rollup()
+            if rollup is not None and rollup["day"] > summary["day"]:
+                return rollup
+            if rollup is None or rollup["day"] < summary["day"]:
+                pressure = rollup["pressure"] if rollup else []
+                rollup = new_rollup(summary["day"])
+                rollup["pressure"] = pressure
+
+            rollup["samples"] = summary["samples"]
+            rollup["last_ts"] = max(rollup["last_ts"] or 0, summary["last_ts"])
+            for key, pick in (("temp_min", min), ("temp_max", max), ("rain_day", max)):
+                if summary.get(key) is not None:
+                    rollup[key] = summary[key] if rollup[key] is None else pick(rollup[key], summary[key])
+            if summary.get("gust_max") is not None and (rollup["gust_max"] is None
+                                                        or summary["gust_max"] > rollup["gust_max"]):
+                rollup["gust_max"] = summary["gust_max"]
+                rollup["gust_ts"] = summary["gust_ts"]
+            os.makedirs(self.directory, exist_ok=True)
+            self._save_rollup(rollup)
+            return rollup
+
+    def read(self, day):
+        """All observations stored for a day (YYYY-MM-DD), oldest first"""
+        try:
+            with open(self.day_path(day), "rb") as f:
+                data = f.read()
+        except OSError:
+            return []
+        usable = len(data) - len(data) % RECORD.size
+        return [unpack_record(data[offset:offset + RECORD.size]) for offset in range(0, usable, RECORD.size)]
+
+
+def today(name):
+    """Today's rollup of the named series without storing anything; None when disabled or empty"""
+    if not TS_ENABLED:
+        return None
+    return SeriesStore(name).rollup()
+
+
+def record(name, obs):
+    """Store an observation in the named series; returns today's rollup, or None when disabled"""
+    if not TS_ENABLED:
+        return None
+    try:
+        return SeriesStore(name).append(obs)
+    except OSError as e:
+        # History is a nice-to-have; never let a full SD card stop a report
+        print(f"Could not record observation: {e}")
+        return None
@@ -0,0 +1,451 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+import os
+from dotenv import load_dotenv
+
+import metrics
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+LORA_PRESET = os.getenv("LORA_PRESET", "LONG_FAST")  # Modem preset of the channel, for airtime estimates
+DUTY_CYCLE = float(os.getenv("DUTY_CYCLE", "0.10"))  # Fraction of time we may transmit (EU868: 0.01)
+DUTY_WINDOW = int(os.getenv("DUTY_WINDOW", "600"))  # Seconds over which the duty cycle is averaged
+ACK_PACING = os.getenv("ACK_PACING", "false").lower() in ("1", "true", "yes")  # Wait for the node's ack between packets
+ACK_TIMEOUT = float(os.getenv("ACK_TIMEOUT", "30"))  # Seconds to wait for an ack before moving on
+MIN_GAP = float(os.getenv("TX_MIN_GAP", "0.5"))  # Seconds between packets handed to the node
+MAX_ATTEMPTS = 3  # Sends of one packet before it is dropped
+RETRY_DELAY = 10  # Seconds before retrying a failed send, multiplied by the attempt number
+ACK_POLL = 0.1  # Seconds between checks for an ack
+
+# Priorities - lower goes first
+ALERT = 0
+REPLY = 1  # Answers to on-mesh queries, ahead of scheduled reports
+ROUTINE = 2
+PRIORITY_NAMES = {ALERT: "alert", REPLY: "reply", ROUTINE: "routine"}
+
+# Meshtastic modem presets: (spreading factor, bandwidth kHz, coding rate denominator)
+PRESETS = {
+    "SHORT_TURBO": (7, 500, 5),
+    "SHORT_FAST": (7, 250, 5),
+    "SHORT_SLOW": (8, 250, 5),
+    "MEDIUM_FAST": (9, 250, 5),
+    "MEDIUM_SLOW": (10, 250, 5),
+    "LONG_FAST": (11, 250, 5),
+    "LONG_MODERATE": (11, 125, 8),
+    "LONG_SLOW": (12, 125, 8),
+}
+PREAMBLE_SYMBOLS = 16  # Meshtastic uses a 16-symbol preamble
+PACKET_OVERHEAD = 20  # Meshtastic header plus protobuf framing, in bytes
+
+
+def airtime(payload_bytes, preset=LORA_PRESET):
+    """Estimated LoRa time on air in seconds for one packet (Semtech AN1200.13)"""
+    sf, bw_khz, cr_denominator = PRESETS[preset]
+    symbol_time = (2 ** sf) / (bw_khz * 1000)
+    low_data_rate = 1 if symbol_time > 0.016 else 0
+    length = payload_bytes + PACKET_OVERHEAD
+    payload_symbols = 8 + max(
+        math.ceil((8 * length - 4 * sf + 28 + 16) / (4 * (sf - 2 * low_data_rate))) * cr_denominator, 0)
+    return (PREAMBLE_SYMBOLS + 4.25) * symbol_time + payload_symbols * symbol_time
+
+
+class SimulatedClock:
+    """clock and sleep for a TxQueue that should pace without waiting"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+
+
+_handoff_lock = threading.Lock()
+
+
+class AlertParts(list):
+    """Message parts that should go out at alert priority"""
+
+    expires_at = None
+    on_accepted = None
+    handoffs = 1  # Queues or outboxes that still have to take the alert whole
+
+    def accepted(self):
+        """Count one handoff; runs on_accepted once the last expected one has been made"""
+        with _handoff_lock:
+            self.handoffs -= 1
+            if self.handoffs > 0:
+                return
+            callback, self.on_accepted = self.on_accepted, None
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception as e:
+            print(f"Error recording sent alert: {e}")
+
+
+def alert(parts, expires_at=None, on_accepted=None):
+    """Mark a group of message parts as an alert, optionally valid until expires_at (epoch seconds).
+
+    on_accepted is called once the alert has been handed off: every part
+    sent by a TxQueue, or the alert stored in an outbox.Outbox. It is not
+    called when a part is dropped. When the alert goes to several nodes or
+    channels, expect_handoffs() says how many, and on_accepted waits for
+    all of them.
+    """
+    parts = AlertParts(parts)
+    parts.expires_at = expires_at
+    parts.on_accepted = on_accepted
+    return parts
+
+
+def expect_handoffs(groups, count):
+    """Make the alerts among groups count as accepted only after count handoffs, one per node and channel"""
+    with _handoff_lock:
+        for parts in groups:
+            if isinstance(parts, AlertParts):
+                parts.handoffs = count
+
+class Packet:
+    def __init__(self, payload, channel_index, priority, enqueued_at, destination=None, tag=None):
+        self.payload = payload
+        self.channel_index = int(channel_index)
+        self.priority = priority
+        self.destination = destination
+        self.tag = tag
+        self.group = None  # The AlertParts this packet belongs to, while it is waiting for on_accepted
+        self.handoff = None  # Key of this submission of the group in TxQueue.unsent
+        self.enqueued_at = enqueued_at
+        self.size = len(payload) if isinstance(payload, bytes) else len(payload.encode("utf-8"))
+        self.airtime = airtime(self.size)
+        self.attempts = 0
+        self.order = None  # Position in the queue among packets of the same priority
+        self.message = None  # Packets of one message share this, and go out in order
+        self.retry_at = None  # After a failed send, when the packet may be tried again
+
+
+class TxQueue:
+    """Priority transmit queue paced by a duty-cycle token bucket.
+
+    The bucket holds transmit time: it refills at duty_cycle seconds per
+    second up to duty_cycle * window, and each packet spends its estimated
+    airtime. Alerts always go before routine packets, including routine
+    packets queued earlier, while parts of one message keep their order.
+    A packet whose send failed waits RETRY_DELAY times its attempts before
+    it is tried again; only the rest of its message waits with it.
+    With ack pacing the next packet waits for the node to report the
+    previous one delivered (or for ack_timeout).
+
+    get_interface returns the interface to send on and bytes payloads go out
+    as data packets on binary_portnum; on_error is called with the exception
+    when a send fails, before the packet is retried, and on_done with the
+    packet and True once it is sent or False once it is dropped. label names the node
+    in messages and metrics when there are several. clock and
+    sleep can be replaced with a simulated clock for testing.
+    """
+
+    def __init__(self, get_interface, duty_cycle=DUTY_CYCLE, window=DUTY_WINDOW, ack_pacing=ACK_PACING,
+                 ack_timeout=ACK_TIMEOUT, min_gap=MIN_GAP, binary_portnum=256, on_error=None,
+                 clock=time.monotonic, sleep=time.sleep, label=None, on_done=None):
+        self.get_interface = get_interface
+        self.label = label
+        self.labels = {"target": label} if label else {}
+        self.binary_portnum = binary_portnum
+        self.rate = duty_cycle
+        self.capacity = duty_cycle * window
+        self.ack_pacing = ack_pacing
+        self.ack_timeout = ack_timeout
+        self.min_gap = min_gap
+        self.on_error = on_error
+        self.on_done = on_done
+        self.clock = clock
+        self.sleep = sleep
+
+        self.tokens = self.capacity
+        self.last_refill = clock()
+        self.last_sent = None
+        self.last_airtime = 0.0
+        self.heap = []
+        self.counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.airtime_sent = 0.0
+        self.dropped = 0
+        self.unsent = {}  # One submission of an AlertParts waiting for on_accepted -> packets still to send
+        self.acks = 0
+        self.ack_timeouts = 0
+        self.latency = {p: [0, 0.0, 0.0] for p in PRIORITY_NAMES}  # count, total, max seconds in queue
+        self.started_at = clock()
+
+    def submit(self, groups, channel_index, priority=ROUTINE, destination=None, tag=None, message=None):
+        """Queue message groups; groups made with alert() are queued at alert priority.
+
+        With a destination (a node number or '!id') the packets go out as
+        direct messages to that node instead of to the whole channel. tag
+        is kept on the packets for on_done. Each group is one message, whose
+        parts wait for each other when one is retried; message makes the
+        packets of several calls one message, e.g. an outbox item.
+        """
+        with self._cond:
+            now = self.clock()
+            for parts in groups:
+                group_message = message if message is not None else ("group", next(self.counter))
+                group_priority = ALERT if isinstance(parts, AlertParts) else priority
+                waiting = isinstance(parts, AlertParts) and parts.on_accepted is not None
+                if waiting:
+                    # Counted per submission: the same alert may be queued on several channels
+                    handoff = next(self.counter)
+                    self.unsent[handoff] = len(parts)
+                for payload in parts:
+                    packet = Packet(payload, channel_index, group_priority, now, destination, tag)
+                    if waiting:
+                        packet.group = parts
+                        packet.handoff = handoff
+                    packet.message = group_message
+                    packet.order = next(self.counter)
+                    heapq.heappush(self.heap, (group_priority, packet.order, packet))
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return len(self.heap)
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _wait_needed(self, packet, now):
+        """Seconds until packet may be sent, from both the token bucket and the minimum gap"""
+        self._refill(now)
+        wait = 0.0
+        # A packet larger than the whole bucket goes once the bucket is full, leaving it in debt
+        needed = min(packet.airtime, self.capacity)
+        if self.tokens < needed:
+            wait = (needed - self.tokens) / self.rate if self.rate > 0 else 0.0
+        if self.last_sent is not None:
+            wait = max(wait, self.last_sent + self.last_airtime + self.min_gap - now)
+        return max(0.0, wait)
+
+    def _next_ready(self, now):
+        """(heap entry of the most urgent packet not waiting to be retried, None), or (None, seconds to wait).
+
+        A packet waiting for a retry holds back the later parts of its own
+        message, but nothing else.
+        """
+        waiting = set()
+        soonest = None
+        for entry in sorted(self.heap):
+            packet = entry[2]
+            if packet.message in waiting:
+                continue
+            if packet.retry_at is not None and packet.retry_at > now:
+                waiting.add(packet.message)
+                soonest = packet.retry_at if soonest is None else min(soonest, packet.retry_at)
+                continue
+            return entry, None
+        return None, soonest - now
+
+    def _wait(self, seconds):
+        if self._running:
+            # Wake early if a higher priority packet arrives
+            self._cond.wait(seconds)
+        else:
+            self._cond.release()
+            try:
+                self.sleep(seconds)
+            finally:
+                self._cond.acquire()
+
+    def send_next(self):
+        """Send the most urgent packet once pacing allows; returns False if the queue is empty"""
+        with self._cond:
+            started = self.clock()
+            while True:
+                if not self.heap:
+                    return False
+                now = self.clock()
+                entry, wait = self._next_ready(now)
+                if entry is not None:
+                    packet = entry[2]
+                    wait = self._wait_needed(packet, now)
+                    if wait < 0.001:
+                        self.heap.remove(entry)
+                        heapq.heapify(self.heap)
+                        break
+                self._wait(wait)
+                if self._thread is not None and not self._running:
+                    return False
+
+        if now > started:
+            # Time held back by the duty cycle, minimum gap or retry delay
+            metrics.observe("pacing", now - started, priority=PRIORITY_NAMES[packet.priority], **self.labels)
+        self._transmit(packet)
+        return True
+
+    def _transmit(self, packet):
+        acked = threading.Event()
+
+        def onAckNak(response):
+            # Named so meshtastic delivers routing acks to it
+            acked.set()
+
+        try:
+            with metrics.span("send", priority=PRIORITY_NAMES[packet.priority], **self.labels) as fields:
+                fields.update(bytes=packet.size, channel=packet.channel_index)
+                interface = self.get_interface()
+                kwargs = {"channelIndex": packet.channel_index}
+                if packet.destination is not None:
+                    kwargs["destinationId"] = packet.destination
+                if self.ack_pacing:
+                    kwargs.update(wantAck=True, onResponse=onAckNak)
+                if isinstance(packet.payload, bytes):
+                    interface.sendData(packet.payload, portNum=self.binary_portnum, **kwargs)
+                else:
+                    interface.sendText(packet.payload, **kwargs)
+        except Exception as e:
+            packet.attempts += 1
+            if self.on_error is not None:
+                self.on_error(e)
+            with self._cond:
+                dropped = packet.attempts >= MAX_ATTEMPTS
+                if not dropped:
+                    delay = RETRY_DELAY * packet.attempts
+                    print(f"Send failed ({e}), retrying packet in {delay} seconds")
+                    metrics.inc("retries_total", stage="send", **self.labels)
+                    packet.retry_at = self.clock() + delay
+                    # Back in its original place, so the parts of a message stay in order
+                    heapq.heappush(self.heap, (packet.priority, packet.order, packet))
+                else:
+                    print(f"Send failed ({e}), dropping packet after {packet.attempts} attempts")
+                    self.dropped += 1
+                    if packet.group is not None:
+                        # The alert did not go out whole, so it is never accepted
+                        self.unsent.pop(packet.handoff, None)
+                    metrics.inc("packets_dropped_total", **self.labels)
+            if dropped and self.on_done is not None:
+                self.on_done(packet, False)
+            return
+
+        now = self.clock()
+        with self._cond:
+            self._refill(now)
+            self.tokens -= packet.airtime
+            self.last_sent = now
+            self.last_airtime = packet.airtime
+            self.packets_sent += 1
+            self.bytes_sent += packet.size
+            self.airtime_sent += packet.airtime
+            stats = self.latency[packet.priority]
+            waited = now - packet.enqueued_at
+            stats[0] += 1
+            stats[1] += waited
+            stats[2] = max(stats[2], waited)
+            finished = None
+            remaining = self.unsent.get(packet.handoff) if packet.group is not None else None
+            if remaining is not None:
+                if remaining > 1:
+                    self.unsent[packet.handoff] = remaining - 1
+                else:
+                    del self.unsent[packet.handoff]
+                    finished = packet.group
+        metrics.inc("packets_sent_total", priority=PRIORITY_NAMES[packet.priority], **self.labels)
+        metrics.inc("bytes_sent_total", packet.size, **self.labels)
+        metrics.inc("airtime_seconds_total", packet.airtime, **self.labels)
+        target = f" to {self.label}" if self.label else ""
+        print(f"Sent {PRIORITY_NAMES[packet.priority]} packet{target} ({packet.size} bytes, ~{packet.airtime:.2f}s airtime)")
+        if self.on_done is not None:
+            self.on_done(packet, True)
+        if finished is not None:
+            finished.accepted()
+
+        if self.ack_pacing:
+            # Polled on the queue's clock, so a simulated clock covers the wait too
+            started = self.clock()
+            deadline = started + self.ack_timeout
+            while not acked.is_set() and self.clock() < deadline:
+                self.sleep(min(ACK_POLL, deadline - self.clock()))
+            delivered = acked.is_set()
+            metrics.observe("ack", self.clock() - started, **self.labels)
+            if delivered:
+                self.acks += 1
+            else:
+                self.ack_timeouts += 1
+                print(f"No ack after {self.ack_timeout} seconds, continuing")
+
+    def drain(self):
+        """Send everything queued, pacing in the calling thread"""
+        while self.send_next():
+            pass
+
+    def flush(self):
+        """Wait until the last packet has had time to leave the radio"""
+        if self.last_sent is not None:
+            remaining = self.last_sent + self.last_airtime + self.min_gap - self.clock()
+            if remaining > 0:
+                self.sleep(remaining)
+
+    def start(self):
+        """Send from a background thread until stop() is called"""
+        if self._thread is not None:
+            return
+        self._running = True
+
+        def worker():
+            while True:
+                with self._cond:
+                    while self._running and not self.heap:
+                        self._cond.wait()
+                    if not self._running:
+                        return
+                try:
+                    self.send_next()
+                except Exception as e:
+                    print(f"Transmit worker error: {e}")
+
+        self._thread = threading.Thread(target=worker, name="txqueue", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=60):
+        """Stop the worker, giving queued packets up to timeout seconds to go out"""
+        deadline = self.clock() + timeout
+        while self.pending() and self.clock() < deadline:
+            self.sleep(0.5)
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def metrics(self):
+        """Throughput and queue latency counters"""
+        elapsed = max(self.clock() - self.started_at, 1e-9)
+        result = {
+            "packets_sent": self.packets_sent,
+            "bytes_sent": self.bytes_sent,
+            "airtime_sent": round(self.airtime_sent, 3),
+            "duty_cycle_used": round(self.airtime_sent / elapsed, 4),
+            "packets_per_minute": round(self.packets_sent * 60 / elapsed, 2),
+            "dropped": self.dropped,
+            "acks": self.acks,
+            "ack_timeouts": self.ack_timeouts,
+            "queued": self.pending(),
+        }
+        for priority, (count, total, longest) in self.latency.items():
+            name = PRIORITY_NAMES[priority]
+            result[f"{name}_latency_avg"] = round(total / count, 3) if count else 0.0
+            result[f"{name}_latency_max"] = round(longest, 3)
+        return result
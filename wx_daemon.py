@@ -0,0 +1,152 @@
+import importlib
+import signal
+import threading
+import time
+import os
+from dotenv import load_dotenv
+
+import events
+import getwx
+import http_client
+import metrics
+import multi_site
+import nws_current_weather
+import radio
+import responder
+import tempest_udp
+import tsstore
+from scheduler import Scheduler
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Report scripts run as jobs, keyed by the environment variable holding their schedule.
+# A schedule is either a number of seconds (e.g. 900) or a 5-field cron expression
+# (e.g. "*/15 * * * *"). Reports without a schedule are not run.
+REPORTS = {
+    "getwx": "SCHEDULE_GETWX",
+    "getwx_forecast": "SCHEDULE_GETWX_FORECAST",
+    "nws_current_weather": "SCHEDULE_NWS_CURRENT_WEATHER",
+    "tempest_forecast": "SCHEDULE_TEMPEST_FORECAST",
+    "energy_outlook": "SCHEDULE_ENERGY_OUTLOOK",
+}
+SCHEDULE_SITES = os.getenv("SCHEDULE_SITES")  # Schedule for all reports of every site in SITES_FILE
+EVENTS = os.getenv("EVENTS", "false").lower() in ("1", "true", "yes")  # Send alerts as conditions change
+EVENT_SOURCE = os.getenv("EVENT_SOURCE", "tempest")  # 'tempest' or 'nws' observations for event detection
+SCHEDULE_EVENTS = os.getenv("SCHEDULE_EVENTS", "60")  # Poll schedule for event detection (unless using Tempest UDP)
+HEALTH_CHECK_INTERVAL = int(os.getenv("HEALTH_CHECK_INTERVAL", "60"))  # Seconds between radio health checks
+RESPONDER = os.getenv("RESPONDER", "false").lower() in ("1", "true", "yes")  # Answer weather queries sent over the mesh
+
+
+def make_report_job(module, link, dry_run=False):
+    """Build a job that renders a report and sends it over the shared radio link"""
+    # A dry run must not record observations or mark alerts as broadcast
+    options = multi_site.DRY_RUN_ARGS.get(module.__name__, {}) if dry_run else {}
+
+    def job():
+        http_client.start_run()
+        with metrics.span("render", report=module.__name__):
+            groups = module.build_messages(**options)
+        if groups:
+            link.send(groups, module.CHANNEL_INDEX, key=module.__name__)
+    return job
+
+
+def make_sites_job(link, dry_run=False):
+    """Build a job that renders every site's reports and sends each to its site's channel"""
+    sites = multi_site.load_sites()
+
+    def job():
+        http_client.start_run()
+        for site, report, groups in multi_site.build_all(sites, dry_run):
+            print(f"Queueing {report} for {site['name']} on channel {site['channel_index']}")
+            link.send(groups, site["channel_index"], key=f"{report}:{site['name']}")
+    return job
+
+
+def make_event_poll_job(observe):
+    """Build a job that fetches the latest observation and feeds it to the event engine"""
+    if EVENT_SOURCE.lower() == "nws":
+        def job():
+            http_client.start_run()
+            _, props = nws_current_weather.fetch_observation()
+            # An old copy served from the cache is not a new observation
+            if props and http_client.stale_since(props) is None:
+                observe(nws_current_weather.normalize_observation(props))
+    else:
+        def job():
+            http_client.start_run()
+            obs = getwx.fetch_observation()
+            if obs and http_client.stale_since(obs) is None:
+                observe(obs)
+    return job
+
+
+def make_health_check(link, interval):
+    last_check = [0.0]
+
+    def check():
+        if time.monotonic() - last_check[0] >= interval:
+            last_check[0] = time.monotonic()
+            link.check()
+    return check
+
+
+def main():
+    args = radio.parse_args("Run the scheduled weather reports")
+    scheduler = Scheduler()
+    link = radio.TransportPool(dry_run=args.dry_run)
+
+    for name, env_var in REPORTS.items():
+        spec = os.getenv(env_var)
+        if not spec:
+            continue
+        module = importlib.import_module(name)
+        scheduler.add_job(name, spec, make_report_job(module, link, args.dry_run))
+
+    if SCHEDULE_SITES:
+        scheduler.add_job("sites", SCHEDULE_SITES, make_sites_job(link, args.dry_run))
+
+    if EVENTS:
+        observe = events.make_sender(link)
+        if EVENT_SOURCE.lower() == "tempest" and os.getenv("TEMPEST_SOURCE", "rest").lower() == "udp":
+            # Evaluate every broadcast as it arrives
+            tempest_udp.get_listener().observers.append(observe)
+            print("Event detection running on Tempest UDP broadcasts")
+        else:
+            scheduler.add_job("events", SCHEDULE_EVENTS, make_event_poll_job(observe))
+
+    if RESPONDER:
+        # Answers come from a cache re-rendered on its own schedule, never from a fetch per query
+        query_responder = responder.Responder(link, responder.load_sites())
+        scheduler.add_job("responder", responder.RESPONDER_REFRESH, query_responder.refresh)
+        if not args.dry_run:
+            query_responder.listen()
+
+    if (getwx.TEMPEST_SOURCE.lower() == "udp" and tsstore.TS_ENABLED and os.getenv("SCHEDULE_GETWX")
+            and not args.dry_run):
+        # Keep every broadcast in the history, not just the ones that get reported
+        series = tsstore.series_name(getwx.STATION_ID, getwx.TEMPEST_SOURCE)
+        tempest_udp.get_listener().observers.append(lambda obs: tsstore.record(series, obs))
+
+    if not scheduler.jobs and not EVENTS:
+        raise ValueError("No reports scheduled; set SCHEDULE_SITES, RESPONDER or at least one of: "
+                         + ", ".join(REPORTS.values()))
+
+    scheduler.idle_hooks.append(make_health_check(link, HEALTH_CHECK_INTERVAL))
+
+    # Stop cleanly on Ctrl+C or SIGTERM (e.g. from systemd)
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    metrics.serve()
+    link.check()
+    try:
+        scheduler.run_forever(stop_event)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        link.close()
+
+if __name__ == "__main__":
+    main()
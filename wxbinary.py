@@ -0,0 +1,131 @@
+"""Compact binary encoding of weather reports for machine consumers on the mesh.
+
+Layout (all integers little-endian):
+
+    byte 0      schema version (currently 1)
+    byte 1      report type (REPORT_TYPES)
+    bytes 2-5   observation/forecast time, uint32 epoch seconds
+    bytes 6-7   presence bitmap, bit n set if FIELDS[n] follows
+    ...         each present field in FIELDS order, fixed-point scaled
+
+A full report is 8 bytes of header plus at most 26 bytes of fields, so it
+always fits in a single packet. Absent or unknown values are simply left
+out of the bitmap. Decoders must reject versions they don't know.
+"""
+import argparse
+import struct
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment variables
+PAYLOAD_FORMAT = os.getenv("PAYLOAD_FORMAT", "text")  # 'text', 'binary' or 'both'
+
+PAYLOAD_FORMATS = ("text", "binary", "both")
+
+VERSION = 1
+
+TEMPEST_OBS = 1
+NWS_OBS = 2
+DAILY_FORECAST = 3
+REPORT_TYPES = {TEMPEST_OBS: "tempest_obs", NWS_OBS: "nws_obs", DAILY_FORECAST: "daily_forecast"}
+
+PRESSURE_TRENDS = ["unknown", "falling", "steady", "rising"]
+
+# (name, unit, scale, struct format) - value is stored as round(value * scale)
+FIELDS = [
+    ("temperature", "C", 10, "h"),
+    ("feels_like", "C", 10, "h"),
+    ("humidity", "%", 1, "B"),
+    ("pressure", "hPa", 10, "H"),
+    ("wind_avg", "m/s", 10, "H"),
+    ("wind_gust", "m/s", 10, "H"),
+    ("wind_direction", "deg", 1, "H"),
+    ("rain_day", "mm", 10, "H"),
+    ("strike_count", "", 1, "H"),
+    ("solar_radiation", "W/m2", 1, "H"),
+    ("uv", "", 10, "B"),
+    ("pressure_trend", "", 1, "B"),
+    ("temp_high", "C", 10, "h"),
+    ("temp_low", "C", 10, "h"),
+    ("precip_probability", "%", 1, "B"),
+]
+FIELD_INDEX = {name: idx for idx, (name, _, _, _) in enumerate(FIELDS)}
+
+HEADER = struct.Struct("<BBIH")
+LIMITS = {"h": (-32768, 32767), "H": (0, 65535), "B": (0, 255)}
+
+
+def encode(report_type, timestamp, values):
+    """Encode a dict of field name -> value (in FIELDS units) into a payload"""
+    bitmap = 0
+    body = b""
+    for idx, (name, _, scale, fmt) in enumerate(FIELDS):
+        value = values.get(name)
+        if name == "pressure_trend" and isinstance(value, str):
+            value = PRESSURE_TRENDS.index(value) if value in PRESSURE_TRENDS else 0
+        if value is None or isinstance(value, str):
+            continue
+        low, high = LIMITS[fmt]
+        raw = max(low, min(high, int(round(value * scale))))
+        bitmap |= 1 << idx
+        body += struct.pack("<" + fmt, raw)
+    return HEADER.pack(VERSION, report_type, int(timestamp), bitmap) + body
+
+
+def decode(payload):
+    """Decode a payload into a dict with version, report_type, timestamp and field values"""
+    if len(payload) < HEADER.size:
+        raise ValueError("Payload too short")
+    version, report_type, timestamp, bitmap = HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError(f"Unsupported payload version {version}")
+
+    report = {
+        "version": version,
+        "report_type": REPORT_TYPES.get(report_type, report_type),
+        "timestamp": timestamp,
+    }
+    offset = HEADER.size
+    for idx, (name, _, scale, fmt) in enumerate(FIELDS):
+        if not bitmap & (1 << idx):
+            continue
+        (raw,) = struct.unpack_from("<" + fmt, payload, offset)
+        offset += struct.calcsize(fmt)
+        if name == "pressure_trend":
+            report[name] = PRESSURE_TRENDS[raw] if raw < len(PRESSURE_TRENDS) else "unknown"
+        else:
+            report[name] = raw / scale if scale != 1 else raw
+    return report
+
+
+def with_payload(groups, report_type, timestamp, values):
+    """Apply PAYLOAD_FORMAT to a report's text message groups.
+
+    'text' returns the groups unchanged, 'binary' replaces them with a
+    single binary payload and 'both' sends the payload after the text.
+    """
+    fmt = PAYLOAD_FORMAT.lower()
+    if fmt not in PAYLOAD_FORMATS:
+        raise ValueError(f"Unknown PAYLOAD_FORMAT '{PAYLOAD_FORMAT}'; expected one of: {', '.join(PAYLOAD_FORMATS)}")
+    if fmt == "text":
+        return groups
+    payload = encode(report_type, timestamp, values)
+    if fmt == "binary":
+        return [[payload]]
+    return groups + [[payload]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode a binary weather payload")
+    parser.add_argument("payload", help="payload as a hex string")
+    args = parser.parse_args()
+    report = decode(bytes.fromhex(args.payload))
+    for key, value in report.items():
+        unit = FIELDS[FIELD_INDEX[key]][1] if key in FIELD_INDEX else ""
+        print(f"{key}: {value} {unit}".rstrip())
+
+if __name__ == "__main__":
+    main()